@@ -1,113 +1,344 @@
-''' @file                   Term_BNO055.py
-    @brief                  A driver for reading IMU data
-    @details                Creates a class which can be used to create a IMU object to access the functions of the physical IMU.
-                            You can change the operating mode, write and read calibration coefficients and read the calibration status
-                            of the instruments. The most important functions are the one to read the euler angles and the angular velocities.
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   December 03, 2021
-'''
-
-import pyb
-import struct
-
-
-buffer = bytearray([4])
-
-class BNO055:
-    ''' @brief Class to interface with IMU
-    '''
-    
-    def __init__(self, pyb_I2C_object):
-        ''' @brief Constructs an BNO055 object
-            @param pyb_I2C_object preconfigured object in master mode
-        '''
-        #class variables
-        self.I2C = pyb_I2C_object
-        
-        
-    def change_operating_mode(self, mode):
-        ''' @brief Changes the operating mode of the IMU
-            @param mode operating mode of the desired IMU mode in binary data
-        '''
-        #writes to IMU to change operating mode
-        self.I2C.mem_write(mode, 0x28, 0x3D) 
-    
-    def calibration_status(self,):
-        ''' @brief Retrieves the calibration status from the IMU
-            @return the status values of the callibration status
-        '''
-        #reads the calibration status
-        buffer_bytes = self.I2C.mem_read(buffer, 0x28, 0x35)
-        #creates 4 tuples of the separated Bits of the sensors
-        cal_status = (buffer_bytes[0] & 0b11, (buffer_bytes[0] & 0b11 << 2) >> 2, (buffer_bytes[0] & 0b11 << 4) >> 4 , (buffer_bytes[0] & 0b11 << 6) >> 6)
-
-        #checks the calibration status      
-        if (cal_status[0] == 3): #checks if magnetometer sensor is calibrated
-            magneto = True
-        else:
-            magneto = False
-            
-        if(cal_status[1] == 3): #checks if accelerometer sensor is calibrated
-            acc = True
-        else:
-            acc = False
-            
-        if(cal_status[2] == 3): #checks if gyroscope sensor is calibrated
-            gyr = True
-        else:
-            gyr = False
-            
-        if(cal_status[3] == 3): #checks if system is calibrated
-            sys = True
-        else:
-            sys = False
-        
-        return(magneto,acc,gyr,sys)      
-        
-    def ret_calibration_coefficient(self,):
-        ''' @brief Retrieves the calibration coefficients from the IMU as binary data
-            @return bytearray of the buffer with the callibration data
-        '''
-        #declares buffer
-        buffer = bytearray(22)
-        #reads the calibration status
-        self.I2C.mem_read(buffer, 0x28, 0x55)
-        #return buffer array
-        return(buffer)       
-        
-    def wrt_calibration_coefficient(self, calibration_data):
-        ''' @brief Write the calibration coefficients to the IMU from pre-recorded binary data
-        '''
-        #writes calibration_data to the IMU
-        self.I2C.mem_write(bytearray(calibration_data), 0x28, 0x55)
-        
-    def read_euler_angles(self,):
-        ''' @brief Read euler angles from the IMU to use as state measurements
-            @return signed euler values in a tuple
-        '''
-        #creates bytearray
-        buffer = bytearray(6)
-        #reads the euler angles from IMU
-        self.I2C.mem_read(buffer, 0x28, 0x1A)
-        #tranform the bytearray in signed values
-        eul_signed_ints = struct.unpack('<hhh', buffer)
-        #create a tuple with the singed int euler values
-        eul_values = tuple(eul_int/16 for eul_int in eul_signed_ints)
-        #returns euler angles
-        return(eul_values)
-      
-    def read_angular_velocity(self,):
-        ''' @brief Read angular velocity from the IMU to use as state measurements
-            @return signed angular velocities in a tuple
-        '''
-        #creates bytearray
-        buffer = bytearray(6)
-        #reads the euler angles from IMU
-        self.I2C.mem_read(buffer, 0x28, 0x14)
-        #tranform the bytearray in signed values
-        angular_signed_ints = struct.unpack('<hhh', buffer)
-        #create a tuple with the singed int angular velocity values
-        angular_velocity_values = tuple(ang_int/16 for ang_int in angular_signed_ints)
-        #returns angular velocity values
-        return(angular_velocity_values)       
-    
+''' @file                   Term_BNO055.py
+    @brief                  A driver for reading IMU data
+    @details                Creates a class which can be used to create a IMU object to access the functions of the physical IMU.
+                            You can change the operating mode, write and read calibration coefficients and read the calibration status
+                            of the instruments. The most important functions are the one to read the euler angles and the angular velocities.
+                            read_motion() reads both with one I2C transaction into preallocated buffers. read_motion_part()
+                            splits the same read into one transaction per register group (gyroscope, euler angles and with
+                            the quaternion the quaternion), so a caller can spread one read over several runs and pyb.I2C
+                            blocks only for a part of the transfer at a time. The samples are double buffered,
+                            latest_motion() always returns a complete set.
+                            The operating mode is selected with set_mode(). The fusion modes IMU, NDOF_FMC_OFF and NDOF need
+                            different sensors to be calibrated, is_ready() checks the calibration bits of READY_MASKS for the
+                            mode. ACCGYRO gives the raw sensor data without fusion, the bandwidths and ranges of the sensors
+                            are set with configure_sensors(). With use_quaternion(True) the motion reads also read the
+                            quaternion (0x20) and calculate the angles from it instead of taking the euler registers.
+                            read_raw() reads the accelerometer, magnetometer and gyroscope registers (0x08 to 0x19) with one
+                            I2C transaction for an estimator on the board, e.g. Term_complementary.py.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 03, 2021
+'''
+
+import pyb
+import math
+import struct
+from array import array
+
+
+buffer = bytearray([4])
+
+##@brief configuration mode, the calibration and the sensor configuration can only be written in this mode
+#
+CONFIG = 0x00
+##@brief non fusion mode with accelerometer and gyroscope, the euler and quaternion registers stay 0
+#
+ACCGYRO = 0x05
+##@brief fusion mode of accelerometer and gyroscope, the heading is relative to the start
+#
+IMU = 0x08
+##@brief fusion mode of all sensors without the fast magnetometer calibration
+#
+NDOF_FMC_OFF = 0x0B
+##@brief fusion mode of all sensors
+#
+NDOF = 0x0C
+
+##@brief calibration bits of the status register 0x35 which must be 3 in a mode: system 0xC0, gyroscope 0x30,
+#        accelerometer 0x0C, magnetometer 0x03
+#
+READY_MASKS = {CONFIG: 0x00, ACCGYRO: 0x00, IMU: 0x3C, NDOF_FMC_OFF: 0x3F, NDOF: 0xFF}
+
+##@brief bandwidths of the accelerometer in Hz, the index is the value of the register ACC_Config
+#
+ACC_BANDWIDTHS = (7.81, 15.63, 31.25, 62.5, 125, 250, 500, 1000)
+##@brief ranges of the accelerometer in g, the index is the value of the register ACC_Config
+#
+ACC_RANGES = (2, 4, 8, 16)
+##@brief bandwidths of the gyroscope in Hz, the index is the value of the register GYR_Config_0
+#
+GYR_BANDWIDTHS = (523, 230, 116, 47, 23, 12, 64, 32)
+##@brief ranges of the gyroscope in degree/s, the index is the value of the register GYR_Config_0
+#
+GYR_RANGES = (2000, 1000, 500, 250, 125)
+
+##@brief scale of the quaternion registers, 2^14 LSB are 1
+#
+QUATERNION_SCALE = 1/16384
+##@brief offsets of the register groups in the motion buffer from 0x14: gyroscope and euler angles
+#
+EULER_PARTS = (0, 6, 12)
+##@brief offsets of the register groups in the motion buffer from 0x14: gyroscope, euler angles and quaternion
+#
+QUATERNION_PARTS = (0, 6, 12, 20)
+
+class BNO055:
+    ''' @brief Class to interface with IMU
+    '''
+    
+    def __init__(self, pyb_I2C_object):
+        ''' @brief Constructs an BNO055 object
+            @param pyb_I2C_object preconfigured object in master mode
+        '''
+        #class variables
+        self.I2C = pyb_I2C_object
+        #double buffers of the motion reads: raw gyro and euler registers, decoded values, index of the complete set
+        self.motion_buffers = (bytearray(12), bytearray(12))
+        self.motions = (array('f', [0] * 6), array('f', [0] * 6))
+        self.front = 0
+        #the BNO055 starts in the configuration mode
+        self.mode = CONFIG
+        #buffers of the motion reads with the quaternion registers, the quaternion w, x, y, z of the last read
+        self.euler_buffers = self.motion_buffers
+        self.quaternion_buffers = (bytearray(20), bytearray(20))
+        self.quaternion_buffer = bytearray(8)
+        self.quaternion = array('f', [1, 0, 0, 0])
+        self.use_quaternions = False
+        #register groups of the split motion reads, preallocated views of both buffers and the next group
+        self.euler_parts = self.part_views(self.euler_buffers, EULER_PARTS)
+        self.quaternion_parts = self.part_views(self.quaternion_buffers, QUATERNION_PARTS)
+        self.motion_parts = self.euler_parts
+        self.part = 0
+        #buffer of the raw reads and the decoded angular velocities and accelerations
+        self.raw_buffer = bytearray(18)
+        self.raw = array('f', [0] * 6)
+        
+        
+    def change_operating_mode(self, mode):
+        ''' @brief Changes the operating mode of the IMU
+            @param mode operating mode of the desired IMU mode in binary data
+        '''
+        #writes to IMU to change operating mode
+        self.I2C.mem_write(mode, 0x28, 0x3D) 
+    
+    def set_mode(self, mode):
+        ''' @brief Changes the operating mode and waits until the BNO055 has switched
+            @details The switching time is 19 ms from any mode into the configuration mode and 7 ms from the
+                     configuration mode into any other mode (datasheet table 3-6).
+            @param mode one of CONFIG, ACCGYRO, IMU, NDOF_FMC_OFF, NDOF
+        '''
+        self.change_operating_mode(mode)
+        pyb.delay(19 if mode == CONFIG else 7)
+        self.mode = mode
+    
+    def configure_sensors(self, acc_range=4, acc_bandwidth=62.5, gyr_range=2000, gyr_bandwidth=32):
+        ''' @brief Sets the ranges and bandwidths of the accelerometer and the gyroscope
+            @details The registers are on page 1 and are only used in the non fusion modes, the fusion modes configure the
+                     sensors themselves. The BNO055 is switched to the configuration mode and back.
+            @param acc_range range of the accelerometer in g, one of ACC_RANGES
+            @param acc_bandwidth bandwidth of the accelerometer in Hz, one of ACC_BANDWIDTHS
+            @param gyr_range range of the gyroscope in degree/s, one of GYR_RANGES
+            @param gyr_bandwidth bandwidth of the gyroscope in Hz, one of GYR_BANDWIDTHS
+        '''
+        mode = self.mode
+        if (mode != CONFIG):
+            self.set_mode(CONFIG)
+        #page 1, ACC_Config (0x08) and GYR_Config_0 (0x0A) in normal power mode
+        self.I2C.mem_write(1, 0x28, 0x07)
+        self.I2C.mem_write(ACC_RANGES.index(acc_range) | (ACC_BANDWIDTHS.index(acc_bandwidth) << 2), 0x28, 0x08)
+        self.I2C.mem_write(GYR_RANGES.index(gyr_range) | (GYR_BANDWIDTHS.index(gyr_bandwidth) << 3), 0x28, 0x0A)
+        self.I2C.mem_write(0, 0x28, 0x0B)
+        self.I2C.mem_write(0, 0x28, 0x07)
+        if (mode != CONFIG):
+            self.set_mode(mode)
+    
+    def is_ready(self, mode=None):
+        ''' @brief Checks if all sensors which a mode needs are calibrated
+            @param mode operating mode, the current mode if None
+            @return True if the calibration bits of READY_MASKS are set
+        '''
+        mask = READY_MASKS[self.mode if mode is None else mode]
+        self.I2C.mem_read(buffer, 0x28, 0x35)
+        return((buffer[0] & mask) == mask)
+    
+    def calibration_status(self,):
+        ''' @brief Retrieves the calibration status from the IMU
+            @return the status values of the callibration status
+        '''
+        #reads the calibration status
+        buffer_bytes = self.I2C.mem_read(buffer, 0x28, 0x35)
+        #creates 4 tuples of the separated Bits of the sensors
+        cal_status = (buffer_bytes[0] & 0b11, (buffer_bytes[0] & 0b11 << 2) >> 2, (buffer_bytes[0] & 0b11 << 4) >> 4 , (buffer_bytes[0] & 0b11 << 6) >> 6)
+
+        #checks the calibration status      
+        if (cal_status[0] == 3): #checks if magnetometer sensor is calibrated
+            magneto = True
+        else:
+            magneto = False
+            
+        if(cal_status[1] == 3): #checks if accelerometer sensor is calibrated
+            acc = True
+        else:
+            acc = False
+            
+        if(cal_status[2] == 3): #checks if gyroscope sensor is calibrated
+            gyr = True
+        else:
+            gyr = False
+            
+        if(cal_status[3] == 3): #checks if system is calibrated
+            sys = True
+        else:
+            sys = False
+        
+        return(magneto,acc,gyr,sys)      
+        
+    def ret_calibration_coefficient(self,):
+        ''' @brief Retrieves the calibration coefficients from the IMU as binary data
+            @return bytearray of the buffer with the callibration data
+        '''
+        #declares buffer
+        buffer = bytearray(22)
+        #reads the calibration status
+        self.I2C.mem_read(buffer, 0x28, 0x55)
+        #return buffer array
+        return(buffer)       
+        
+    def wrt_calibration_coefficient(self, calibration_data):
+        ''' @brief Write the calibration coefficients to the IMU from pre-recorded binary data
+        '''
+        #writes calibration_data to the IMU
+        self.I2C.mem_write(bytearray(calibration_data), 0x28, 0x55)
+        
+    def read_euler_angles(self,):
+        ''' @brief Read euler angles from the IMU to use as state measurements
+            @return signed euler values in a tuple
+        '''
+        #creates bytearray
+        buffer = bytearray(6)
+        #reads the euler angles from IMU
+        self.I2C.mem_read(buffer, 0x28, 0x1A)
+        #tranform the bytearray in signed values
+        eul_signed_ints = struct.unpack('<hhh', buffer)
+        #create a tuple with the singed int euler values
+        eul_values = tuple(eul_int/16 for eul_int in eul_signed_ints)
+        #returns euler angles
+        return(eul_values)
+      
+    def read_angular_velocity(self,):
+        ''' @brief Read angular velocity from the IMU to use as state measurements
+            @return signed angular velocities in a tuple
+        '''
+        #creates bytearray
+        buffer = bytearray(6)
+        #reads the euler angles from IMU
+        self.I2C.mem_read(buffer, 0x28, 0x14)
+        #tranform the bytearray in signed values
+        angular_signed_ints = struct.unpack('<hhh', buffer)
+        #create a tuple with the singed int angular velocity values
+        angular_velocity_values = tuple(ang_int/16 for ang_int in angular_signed_ints)
+        #returns angular velocity values
+        return(angular_velocity_values)
+    
+    def read_motion(self,):
+        ''' @brief Reads the angular velocities and the euler angles with one I2C transaction
+            @details The gyro registers (0x14) are followed by the euler registers (0x1A), so all 12 bytes are read at once
+                     into a preallocated buffer and decoded into a preallocated array.
+            @return array with the angular velocities x, y, z in degree/s and the euler angles heading, roll, pitch in degree,
+                    it stays valid until the next but one read
+        '''
+        #reads the gyro and the euler registers, a split read which is not finished starts again
+        back = 1 - self.front
+        self.part = 0
+        self.I2C.mem_read(self.motion_buffers[back], 0x28, 0x14)
+        return(self.decode_motion(back))
+    
+    def read_motion_part(self,):
+        ''' @brief Reads the next register group of the motion read
+            @details Every group is read with one transaction, so the 3 or 4 values of a group are from the same sample of
+                     the BNO055, the groups are from the samples at the times of their reads. After the last group the
+                     buffer is decoded and becomes the complete set of latest_motion().
+            @return True if the last group was read and latest_motion() returns the new set
+        '''
+        back = 1 - self.front
+        (offset, view) = self.motion_parts[back][self.part]
+        self.I2C.mem_read(view, 0x28, 0x14 + offset)
+        self.part += 1
+        if (self.part < len(self.motion_parts[back])):
+            return(False)
+        self.part = 0
+        self.decode_motion(back)
+        return(True)
+    
+    def part_views(self, buffers, parts):
+        ''' @brief Creates the views of the register groups of both motion buffers
+            @param buffers tuple with both motion buffers
+            @param parts offsets of the groups and the length of the buffer
+            @return tuple with a tuple of (offset, memoryview) per group for every buffer
+        '''
+        return(tuple(tuple((parts[i], memoryview(buffer)[parts[i]:parts[i + 1]]) for i in range(len(parts) - 1))
+                     for buffer in buffers))
+    
+    def use_quaternion(self, enable):
+        ''' @brief Selects the source of the angles of the motion reads
+            @details With the quaternion the reads are 20 bytes long (0x14 to 0x27) and the heading, roll and pitch are
+                     calculated from the quaternion in the same order as the euler registers.
+            @param enable True to calculate the angles from the quaternion, False to read the euler registers
+        '''
+        self.use_quaternions = enable
+        self.motion_buffers = self.quaternion_buffers if enable else self.euler_buffers
+        self.motion_parts = self.quaternion_parts if enable else self.euler_parts
+        self.part = 0
+    
+    def read_quaternion(self,):
+        ''' @brief Reads the quaternion of the fusion
+            @return array with w, x, y, z, it is overwritten by the next read
+        '''
+        self.I2C.mem_read(self.quaternion_buffer, 0x28, 0x20)
+        raw = struct.unpack_from('<hhhh', self.quaternion_buffer)
+        quaternion = self.quaternion
+        for i in range(4):
+            quaternion[i] = raw[i]*QUATERNION_SCALE
+        return(quaternion)
+    
+    def read_raw(self,):
+        ''' @brief Reads the raw angular velocities and accelerations with one I2C transaction
+            @details The 18 bytes from 0x08 hold the accelerometer, the magnetometer and the gyroscope data, the
+                     magnetometer is skipped when decoding. The registers are valid in every mode except CONFIG.
+            @return array with the angular velocities x, y, z in degree/s and the accelerations x, y, z in m/s^2,
+                    it is overwritten by the next read
+        '''
+        self.I2C.mem_read(self.raw_buffer, 0x28, 0x08)
+        raw = struct.unpack_from('<hhhhhhhhh', self.raw_buffer)
+        values = self.raw
+        for i in range(3):
+            #16 LSB per degree/s and 100 LSB per m/s^2
+            values[i] = raw[6 + i]/16
+            values[3 + i] = raw[i]/100
+        return(values)
+    
+    def latest_motion(self,):
+        ''' @brief Returns the last complete set of angular velocities and euler angles
+            @return array like read_motion()
+        '''
+        return(self.motions[self.front])
+    
+    def decode_motion(self, back):
+        ''' @brief Decodes a motion buffer and makes it the complete set
+            @param back index of the buffer which was read
+            @return the decoded array
+        '''
+        #tranform the bytes in signed values and scale them
+        motion = self.motions[back]
+        if (self.use_quaternions):
+            raw = struct.unpack_from('<hhhhhhhhhh', self.motion_buffers[back])
+            for i in range(3):
+                motion[i] = raw[i]/16
+            w = raw[6]*QUATERNION_SCALE
+            x = raw[7]*QUATERNION_SCALE
+            y = raw[8]*QUATERNION_SCALE
+            z = raw[9]*QUATERNION_SCALE
+            self.quaternion[0] = w
+            self.quaternion[1] = x
+            self.quaternion[2] = y
+            self.quaternion[3] = z
+            #heading around z (0..360), roll around y (-90..90) and pitch around x (-180..180) in the ranges of the euler
+            #registers, Term_imu_latency.py compares both on the board
+            motion[3] = math.degrees(math.atan2(2*(w*z + x*y), 1 - 2*(y*y + z*z))) % 360
+            motion[4] = math.degrees(math.asin(max(-1, min(1, 2*(w*y - z*x)))))
+            motion[5] = math.degrees(math.atan2(2*(w*x + y*z), 1 - 2*(x*x + y*y)))
+        else:
+            raw = struct.unpack_from('<hhhhhh', self.motion_buffers[back])
+            for i in range(6):
+                motion[i] = raw[i]/16
+        self.front = back
+        return(motion)
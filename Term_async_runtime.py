@@ -0,0 +1,102 @@
+''' @file                   Term_async_runtime.py
+    @brief                  A uasyncio based runtime for the tasks
+    @details                Alternative to Term_scheduler.Scheduler with the same add_task()/run() interface. Every task runs as
+                            a coroutine which awaits its next release time with wrap-safe tick math and then runs one iteration
+                            of the task. While a coroutine waits, the event loop is free for the other tasks. The runtime only
+                            wraps the periodic tasks, it is not event driven: a run of a task does not yield, and Task_User
+                            still polls the USB VCP with any() once per period instead of awaiting a stream.
+                            On the board uasyncio is used, whose clock counts in ms. On a PC CPython asyncio is imported
+                            instead, Term_sched_bench.py runs the runtime with a stand-in of uasyncio on its virtual clock and
+                            compares the idle time and the jitter with Term_scheduler.Scheduler.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 9, 2021
+'''
+
+import utime
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    sleep_ms = asyncio.sleep_ms
+except AttributeError:
+    #CPython asyncio has no sleep_ms()
+    def sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
+
+
+class AsyncRuntime:
+    ''' @brief A coroutine based task runtime
+        @details Objects of this class start one coroutine per registered task. A coroutine which fell behind by a whole
+                 period or more is resynchronized to the current time. Every coroutine yields at least once per run, so a
+                 late task cannot starve the other ones.
+    '''
+
+    def __init__(self, stats=None):
+        ''' @brief Constructs a runtime object
+            @param stats optional TaskStats object which records the run times of the tasks while stats.enabled is set
+        '''
+        #class variables
+        self.stats = stats
+        self.num_tasks = 0
+        self.names = []
+        self.callbacks = []
+        self.periods = []
+
+    def add_task(self, callback, period, name=''):
+        ''' @brief Registers a task at the runtime
+            @param callback function which runs one iteration of the task, e.g. Task_Motor.run
+            @param period time in us between two runs of the task
+            @param name short name of the task
+            @return index of the task in the task list
+        '''
+        self.names.append(name)
+        self.callbacks.append(callback)
+        self.periods.append(period)
+        if (self.stats is not None):
+            self.stats.set_name(self.num_tasks, name)
+        self.num_tasks += 1
+        return self.num_tasks - 1
+
+    async def periodic(self, task):
+        ''' @brief Coroutine which runs one task periodically
+            @param task index of the task
+        '''
+        callback = self.callbacks[task]
+        period = self.periods[task]
+        stats = self.stats
+        next_time = utime.ticks_add(utime.ticks_us(), period)
+        while(True):
+            #wait until the task is due, rounded up to the ms of the event loop, a late task still yields once
+            delay = utime.ticks_diff(next_time, utime.ticks_us())
+            if (delay > 0):
+                await sleep_ms((delay + 999) // 1000)
+            else:
+                await sleep_ms(0)
+
+            release = next_time
+            now = utime.ticks_us()
+            if (stats is not None) and stats.enabled:
+                callback()
+                stats.record(task, release, now, utime.ticks_us(), period)
+            else:
+                callback()
+
+            #defines the next time the task should run
+            if (utime.ticks_diff(now, release) >= period):
+                next_time = utime.ticks_add(now, period)
+            else:
+                next_time = utime.ticks_add(release, period)
+
+    async def main(self):
+        ''' @brief Coroutine which starts the coroutines of all tasks and waits for them
+        '''
+        coroutines = [asyncio.create_task(self.periodic(i)) for i in range(self.num_tasks)]
+        for coroutine in coroutines:
+            await coroutine
+
+    def run(self):
+        ''' @brief Runs all tasks forever
+        '''
+        asyncio.run(self.main())
@@ -0,0 +1,115 @@
+''' @file                   Term_calstore.py
+    @brief                  Stores the calibration of the touchpanel and the IMU in one binary file
+    @details                The file has a fixed layout: magic, version, flags, the 6 calibration values of the touchpanel as
+                            float32, the 22 calibration bytes of the BNO055, 2 reserved bytes and a CRC32 over all bytes before it.
+                            It is read with one readinto() and struct.unpack_from(). A new file is written to a temporary file
+                            first and then renamed, so a reset while writing keeps the old file. The flags tell which part is
+                            valid, every task only replaces its own part. The module runs on the board and on the PC.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 17, 2021
+'''
+
+import os
+import struct
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+
+## @brief name of the calibration file
+#
+FILE = "calstore.bin"
+## @brief first four bytes of the calibration file
+#
+MAGIC = b'BBCS'
+## @brief version of the layout
+#
+VERSION = 1
+## @brief struct format of the file without the CRC: magic, version, flags, touchpanel, IMU, reserved
+#
+LAYOUT = '<4sHH6f22sH'
+## @brief size of the file without the CRC in bytes
+#
+DATA_SIZE = 56
+## @brief size of the file in bytes
+#
+SIZE = 60
+## @brief flag of valid touchpanel calibration values
+#
+TOUCH_VALID = 1
+## @brief flag of valid IMU calibration bytes
+#
+IMU_VALID = 2
+
+#buffer of the file, reused by every load
+_buffer = bytearray(SIZE)
+
+
+def checksum(data):
+    ''' @brief Calculates the CRC32 of data
+        @details Uses binascii.crc32 if available, otherwise a bitwise calculation.
+        @param data bytes or bytearray
+        @return CRC32 as unsigned integer
+    '''
+    if (crc32):
+        return crc32(data) & 0xFFFFFFFF
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte
+        for i in range(8):
+            crc = (crc >> 1) ^ (0xEDB88320 & -(crc & 1))
+    return crc ^ 0xFFFFFFFF
+
+
+def load(filename=FILE):
+    ''' @brief Reads the calibration file
+        @param filename name of the calibration file
+        @return tuple (flags, touch, imu) with the 6 touchpanel values and the 22 IMU bytes,
+                flags is 0 if the file is missing, too short, of another version or corrupted
+    '''
+    empty = (0, (0.0,) * 6, bytes(22))
+    try:
+        with open(filename, 'rb') as f:
+            if (f.readinto(_buffer) != SIZE):
+                return empty
+    except OSError:
+        return empty
+    values = struct.unpack_from(LAYOUT, _buffer)
+    (crc,) = struct.unpack_from('<I', _buffer, DATA_SIZE)
+    if (values[0] != MAGIC) or (values[1] != VERSION) or (crc != checksum(memoryview(_buffer)[0:DATA_SIZE])):
+        return empty
+    return (values[2], values[3:9], values[9])
+
+
+def save(flags, touch, imu, filename=FILE):
+    ''' @brief Writes the calibration file atomically
+        @param flags TOUCH_VALID and IMU_VALID of the valid parts
+        @param touch 6 touchpanel values Kxx, Kxy, Kyx, Kyy, Xc, Yc
+        @param imu 22 IMU calibration bytes
+        @param filename name of the calibration file
+    '''
+    data = struct.pack(LAYOUT, MAGIC, VERSION, flags, touch[0], touch[1], touch[2], touch[3], touch[4], touch[5],
+                       bytes(imu), 0)
+    temp = filename + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.write(struct.pack('<I', checksum(data)))
+    os.rename(temp, filename)
+
+
+def update_touch(touch, filename=FILE):
+    ''' @brief Replaces the touchpanel calibration and keeps the IMU calibration
+        @param touch 6 touchpanel values Kxx, Kxy, Kyx, Kyy, Xc, Yc
+        @param filename name of the calibration file
+    '''
+    (flags, old_touch, imu) = load(filename)
+    save(flags | TOUCH_VALID, touch, imu, filename)
+
+
+def update_imu(imu, filename=FILE):
+    ''' @brief Replaces the IMU calibration and keeps the touchpanel calibration
+        @param imu 22 IMU calibration bytes
+        @param filename name of the calibration file
+    '''
+    (flags, touch, old_imu) = load(filename)
+    save(flags | IMU_VALID, touch, imu, filename)
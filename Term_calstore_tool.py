@@ -0,0 +1,104 @@
+''' @file                   Term_calstore_tool.py
+    @brief                  Host tool which inspects and edits the calibration store
+    @details                Runs on the PC, not on the board. Shows the contents of a calibration file copied from the board,
+                            replaces or clears the touchpanel or the IMU calibration and converts the old text files
+                            RT_cal_coeffs.txt and IMU_cal_coeffs.txt into a calibration file. The file is checked and written
+                            with Term_calstore.py, so the CRC is always valid.
+
+                            Example: python Term_calstore_tool.py show
+                                     python Term_calstore_tool.py set-touch 1.02,0.01,-0.02,0.98,1.5,-0.7
+                                     python Term_calstore_tool.py import-text --touch RT_cal_coeffs.txt --imu IMU_cal_coeffs.txt
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 17, 2021
+'''
+
+import argparse
+try:
+    import calstore
+except ImportError:
+    import Term_calstore as calstore
+
+
+def parse_imu(text):
+    ''' @brief Converts the text of IMU calibration bytes into bytes
+        @param text comma separated values (decimal or 0x hexadecimal) or one hexadecimal string
+        @return 22 bytes
+    '''
+    text = text.strip()
+    if ',' in text:
+        data = bytes(int(value, 0) for value in text.split(','))
+    else:
+        data = bytes.fromhex(text)
+    if len(data) != 22:
+        raise ValueError('the IMU calibration has 22 bytes, got {}'.format(len(data)))
+    return data
+
+
+def parse_touch(text):
+    ''' @brief Converts the text of the touchpanel calibration into values
+        @param text comma separated values Kxx, Kxy, Kyx, Kyy, Xc, Yc
+        @return tuple with the 6 values
+    '''
+    values = tuple(float(value) for value in text.strip().split(','))
+    if len(values) != 6:
+        raise ValueError('the touchpanel calibration has 6 values, got {}'.format(len(values)))
+    return values
+
+
+def show(filename):
+    ''' @brief Prints the contents of a calibration file
+        @param filename name of the calibration file
+    '''
+    (flags, touch, imu) = calstore.load(filename)
+    if flags == 0:
+        print('{}: missing, corrupted or empty'.format(filename))
+        return
+    print('{}: version {}, {} bytes'.format(filename, calstore.VERSION, calstore.SIZE))
+    if flags & calstore.TOUCH_VALID:
+        print('touchpanel  Kxx, Kxy, Kyx, Kyy, Xc, Yc = ' + ', '.join('{:.6g}'.format(v) for v in touch))
+    else:
+        print('touchpanel  not calibrated')
+    if flags & calstore.IMU_VALID:
+        print('IMU         ' + imu.hex())
+    else:
+        print('IMU         not calibrated')
+
+
+def main():
+    ''' @brief Command line interface of the tool
+    '''
+    parser = argparse.ArgumentParser(description='Inspect and edit the calibration store of the ball balancing platform')
+    parser.add_argument('-f', '--file', default=calstore.FILE, help='name of the calibration file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('show', help='print the calibration')
+    command = commands.add_parser('set-touch', help='replace the touchpanel calibration')
+    command.add_argument('values', help='Kxx,Kxy,Kyx,Kyy,Xc,Yc')
+    command = commands.add_parser('set-imu', help='replace the IMU calibration')
+    command.add_argument('values', help='22 bytes as hex string or comma separated values')
+    command = commands.add_parser('clear', help='mark a calibration as invalid')
+    command.add_argument('part', choices=('touch', 'imu'))
+    command = commands.add_parser('import-text', help='convert the old text files')
+    command.add_argument('--touch', help='RT_cal_coeffs.txt')
+    command.add_argument('--imu', help='IMU_cal_coeffs.txt')
+    args = parser.parse_args()
+
+    if args.command == 'set-touch':
+        calstore.update_touch(parse_touch(args.values), args.file)
+    elif args.command == 'set-imu':
+        calstore.update_imu(parse_imu(args.values), args.file)
+    elif args.command == 'clear':
+        (flags, touch, imu) = calstore.load(args.file)
+        flags &= ~(calstore.TOUCH_VALID if args.part == 'touch' else calstore.IMU_VALID)
+        calstore.save(flags, touch, imu, args.file)
+    elif args.command == 'import-text':
+        if args.touch:
+            with open(args.touch) as f:
+                calstore.update_touch(parse_touch(f.readline()), args.file)
+        if args.imu:
+            with open(args.imu) as f:
+                calstore.update_imu(parse_imu(f.readline()), args.file)
+    show(args.file)
+
+
+if __name__ == '__main__':
+    main()
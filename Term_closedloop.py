@@ -1,48 +1,303 @@
-''' @file                   Term_closedloop.py
-    @brief                  A controller driver for closed loop control
-    @details                Creates a class which can be used to set up a closed loop control system. It takes in the state vector
-                            which contains the values of the touchpanel and the IMU and uses the gain values to calculate a motor torque.
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   October 28, 2021
-'''
-
-from ulab import numpy as np
-
-class ClosedLoop:
-    ''' @brief A closedloop class
-        @details Objects of this class can be used to implement a closed loop controller. 
-    '''
-    
-    def __init__(self, K_matrix):
-        ''' @brief          Constructs an closed loop controller object
-            @param K_matrix Contains the gain values for the closedloop controler. First the gain for the x, then theta, x_dot and theta_dot.
-        '''    
-        #class variables
-        self.K_matrix = K_matrix
-       
-    def run(self, state_vector):
-        """ @brief Takes in the state_vector containing all the touchpanel and IMU values and calculates the motor torque.
-            @param state_vector contains the touchpanel values and the IMU values as well as the velocities.  
-            @param motor_torque returns the motor_torque 
-        """
-        
-        #calculate the motor torque
-        motor_torque = np.dot(-self.K_matrix, state_vector)
-        #return motor_torque
-        return motor_torque[0]
-    
-    def get_K(self):
-        """ @brief returns the K_Matrix with the gains.
-            @return returns the K_matrix with the gains.
-        """
-        return self.K_matrix                   
-     
-         
-    def set_K(self, K_matrix):
-        """ @brief sets the K_Matrix with the gains.
-        """
-        
-        self.K_matrix = K_matrix
-        
-    
-
+''' @file                   Term_closedloop.py
+    @brief                  A controller driver for closed loop control
+    @details                Creates a class which can be used to set up a closed loop control system. It takes in the state vector
+                            which contains the values of the touchpanel and the IMU and uses the gain values to calculate a motor torque.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   October 28, 2021
+'''
+
+try:
+    from ulab import numpy as np
+except ImportError:
+    #NumPy on the PC, used by the host tools to check the controllers
+    import numpy as np
+import math
+from array import array
+
+class ClosedLoop:
+    ''' @brief A closedloop class
+        @details Objects of this class can be used to implement a closed loop controller. 
+    '''
+    
+    def __init__(self, K_matrix):
+        ''' @brief          Constructs an closed loop controller object
+            @param K_matrix Contains the gain values for the closedloop controler. First the gain for the x, then theta, x_dot and theta_dot.
+        '''    
+        #class variables
+        self.K_matrix = K_matrix
+       
+    def run(self, state_vector):
+        """ @brief Takes in the state_vector containing all the touchpanel and IMU values and calculates the motor torque.
+            @param state_vector contains the touchpanel values and the IMU values as well as the velocities.  
+            @param motor_torque returns the motor_torque 
+        """
+        
+        #calculate the motor torque
+        motor_torque = np.dot(-self.K_matrix, state_vector)
+        #return motor_torque
+        return motor_torque[0]
+    
+    def get_K(self):
+        """ @brief returns the K_Matrix with the gains.
+            @return returns the K_matrix with the gains.
+        """
+        return self.K_matrix                   
+     
+         
+    def set_K(self, K_matrix):
+        """ @brief sets the K_Matrix with the gains.
+        """
+        
+        self.K_matrix = K_matrix
+
+
+class FusedClosedLoop:
+    ''' @brief A closedloop class for both axes of the platform
+        @details Objects of this class calculate the torques of both motors with one matrix multiplication. The state vector
+                 contains the values of the x-axis (x, theta_y, x_dot, theta_y_dot) followed by the values of the y-axis
+                 (y, theta_x, y_dot, theta_x_dot). The gains are stored as a negated 2x8 block matrix in one flat array,
+                 row after row. run() calculates both torques with multiply-adds over the 8 state values and writes them
+                 into a preallocated output array, so unlike np.dot() it creates no result array.
+    '''
+    
+    def __init__(self, K_x, K_y):
+        ''' @brief      Constructs a closed loop controller object for both axes
+            @param K_x  Contains the gain values for the x-axis. First the gain for the x, then theta, x_dot and theta_dot.
+            @param K_y  Contains the gain values for the y-axis. First the gain for the y, then theta, y_dot and theta_dot.
+        '''
+        #class variables
+        self.K_block = array('f', [0] * 16)
+        self.torque = array('f', [0] * 2)
+        self.set_K(K_x, K_y)
+    
+    def run(self, state_vector):
+        """ @brief Calculates the torques of both motors
+            @param state_vector array with the 8 values of both axes
+            @return array with the torque of the x-motor and the y-motor, it is overwritten by the next call
+        """
+        #calculate the motor torques
+        K = self.K_block
+        x0 = state_vector[0]
+        x1 = state_vector[1]
+        x2 = state_vector[2]
+        x3 = state_vector[3]
+        x4 = state_vector[4]
+        x5 = state_vector[5]
+        x6 = state_vector[6]
+        x7 = state_vector[7]
+        self.torque[0] = K[0]*x0 + K[1]*x1 + K[2]*x2 + K[3]*x3 + K[4]*x4 + K[5]*x5 + K[6]*x6 + K[7]*x7
+        self.torque[1] = K[8]*x0 + K[9]*x1 + K[10]*x2 + K[11]*x3 + K[12]*x4 + K[13]*x5 + K[14]*x6 + K[15]*x7
+        return self.torque
+    
+    def get_K(self):
+        """ @brief returns the negated 2x8 block matrix with the gains.
+            @return returns the negated 2x8 block matrix with the gains as flat array, the gain of row i and column j is at 8*i + j.
+        """
+        return self.K_block
+    
+    def set_K(self, K_x, K_y):
+        """ @brief sets the gains of both axes, the gains between the axes from set_K_block() are set to zero.
+            @param K_x gains of the x-axis
+            @param K_y gains of the y-axis
+        """
+        for i in range(4):
+            self.K_block[i] = -K_x[i]
+            self.K_block[4 + i] = 0
+            self.K_block[8 + i] = 0
+            self.K_block[12 + i] = -K_y[i]
+    
+    def set_K_block(self, K_block):
+        """ @brief sets all gains including the gains between the axes.
+            @param K_block 2x8 matrix with the (not negated) gains
+        """
+        for i in range(2):
+            for j in range(8):
+                self.K_block[8*i + j] = -K_block[i][j]
+
+
+class ScheduledClosedLoop(FusedClosedLoop):
+    ''' @brief A gain scheduled closedloop class for both axes of the platform
+        @details Objects of this class hold a table of gains on a uniform grid over the ball radius (distance of the ball
+                 from the center) and the platform tilt (magnitude of both angles). Every run the gains are interpolated
+                 bilinearly between the four surrounding grid points into the preallocated block matrix, then the torques
+                 are calculated like in FusedClosedLoop. The same gains are used for both axes.
+                 The first row of the table holds the grid: maximum radius in mm, maximum tilt in degree, number of radius
+                 points and number of tilt points. The following rows hold the 4 gains of every grid point, radius major.
+    '''
+    
+    def __init__(self, rows, cols, table):
+        ''' @brief        Constructs a gain scheduled controller object
+            @param rows   number of rows of the table
+            @param cols   number of columns of the table, must be 4
+            @param table  array with the rows of the table, e.g. from tablefile.load()
+        '''
+        #grid of the table
+        if (cols != 4) or (rows < 2):
+            raise ValueError('gain schedule table has the wrong shape')
+        self.n_radius = int(table[2])
+        self.n_tilt = int(table[3])
+        if (self.n_radius < 1) or (self.n_tilt < 1) or (rows != 1 + self.n_radius*self.n_tilt):
+            raise ValueError('gain schedule table has the wrong shape')
+        if (table[0] <= 0) or (table[1] <= 0):
+            raise ValueError('gain schedule table needs a positive maximum radius and tilt')
+        self.radius_scale = (self.n_radius - 1) / table[0]
+        self.tilt_scale = (self.n_tilt - 1) / table[1]
+        self.table = table
+        
+        #start with the gains at the center of the plate
+        FusedClosedLoop.__init__(self, table[4:8], table[4:8])
+    
+    def run(self, state_vector):
+        """ @brief Interpolates the gains for the current state and calculates the torques of both motors
+            @param state_vector array with the 8 values of both axes
+            @return array with the torque of the x-motor and the y-motor, it is overwritten by the next call
+        """
+        radius = math.sqrt(state_vector[0]*state_vector[0] + state_vector[4]*state_vector[4])
+        tilt = math.sqrt(state_vector[1]*state_vector[1] + state_vector[5]*state_vector[5])
+        self.schedule(radius, tilt)
+        return FusedClosedLoop.run(self, state_vector)
+    
+    def schedule(self, radius, tilt):
+        """ @brief Interpolates the gains for an operating point and writes them into the block matrix
+            @param radius distance of the ball from the center in mm
+            @param tilt tilt of the platform in degree
+        """
+        #index and fraction on the radius axis, clamped to the table
+        f_r = radius * self.radius_scale
+        i_r = int(f_r)
+        if (i_r >= self.n_radius - 1):
+            i_r = self.n_radius - 1
+            f_r = 0
+        else:
+            f_r -= i_r
+        #index and fraction on the tilt axis, clamped to the table
+        f_t = tilt * self.tilt_scale
+        i_t = int(f_t)
+        if (i_t >= self.n_tilt - 1):
+            i_t = self.n_tilt - 1
+            f_t = 0
+        else:
+            f_t -= i_t
+        
+        #first value of the four surrounding grid points
+        table = self.table
+        a = 4 * (1 + i_r*self.n_tilt + i_t)
+        b = a + 4 if (f_t > 0) else a
+        c = a + 4*self.n_tilt if (f_r > 0) else a
+        d = c + 4 if (f_t > 0) else c
+        
+        K_block = self.K_block
+        for k in range(4):
+            low = table[a + k] + f_t*(table[b + k] - table[a + k])
+            high = table[c + k] + f_t*(table[d + k] - table[c + k])
+            gain = low + f_r*(high - low)
+            K_block[k] = -gain
+            K_block[12 + k] = -gain
+
+
+class ExplicitMPC:
+    ''' @brief An explicit model predictive controller for both axes of the platform
+        @details The optimization problem with the torque limit and the plate edge is solved on the PC by Term_mpc_design.py
+                 for every combination of active constraints. The solution is a table of regions of the state space, each
+                 with an affine law for the first torque. Every run the regions are searched in the order of the table (most
+                 frequent first), the constraints of a region are evaluated as multiply-adds until one is violated, and the
+                 law of the first region which contains the state is applied. No array is created. Outside of all regions the saturated LQR
+                 gains are used. The same table is used for both axes, the constraints hold for the state passed to run().
+                 Task_Controller passes the error to the reference trajectory, so the plate edge limits the distance of the
+                 ball from the reference and not from the plate center. Only with the center as reference this is the
+                 absolute position, with a trajectory the ball may come closer to the edge by the distance of the reference.
+                 Constraining the absolute position would need the reference as an additional parameter of the design.
+                 The first row of the table holds the number of regions and the torque limit, the second row the LQR gains.
+                 Every region is a row with its number of constraints, a row with the law (4 gains and an offset) and one row
+                 per constraint (4 coefficients and the bound).
+    '''
+    
+    def __init__(self, rows, cols, table):
+        ''' @brief        Constructs an explicit MPC object
+            @param rows   number of rows of the table
+            @param cols   number of columns of the table, must be 5
+            @param table  array with the rows of the table, e.g. from tablefile.load()
+        '''
+        if (cols != 5) or (rows < 2):
+            raise ValueError('MPC table has the wrong shape')
+        self.n_regions = int(table[0])
+        self.u_max = table[1]
+        self.K = [table[5 + i] for i in range(4)]
+        
+        #count the constraints to allocate the storage
+        n_constraints = 0
+        row = 2
+        for r in range(self.n_regions):
+            n = int(table[5*row])
+            n_constraints += n
+            row += 2 + n
+        if (row != rows):
+            raise ValueError('MPC table has the wrong shape')
+        
+        #4 coefficients of every constraint, the same for both axes
+        self.C = array('f', [0] * (4*n_constraints))
+        self.bound = array('f', [0] * n_constraints)
+        self.law = array('f', [0] * (5*self.n_regions))
+        self.first = [0] * (self.n_regions + 1)
+        row = 2
+        j = 0
+        for r in range(self.n_regions):
+            n = int(table[5*row])
+            for k in range(5):
+                self.law[5*r + k] = table[5*(row + 1) + k]
+            self.first[r] = j
+            for c in range(n):
+                a = 5*(row + 2 + c)
+                for k in range(4):
+                    self.C[4*j + k] = table[a + k]
+                self.bound[j] = table[a + 4]
+                j += 1
+            row += 2 + n
+        self.first[self.n_regions] = j
+        
+        self.torque = array('f', [0] * 2)
+        #region of the last run of every axis, -1 is the saturated LQR
+        self.region = [-1, -1]
+    
+    def run(self, state_vector):
+        """ @brief Calculates the torques of both motors
+            @param state_vector array with the 8 values of both axes
+            @return array with the torque of the x-motor and the y-motor, it is overwritten by the next call
+        """
+        self.torque[0] = self.lookup(state_vector, 0)
+        self.torque[1] = self.lookup(state_vector, 1)
+        return self.torque
+    
+    def lookup(self, state_vector, axis):
+        """ @brief Finds the region of one axis and evaluates its law
+            @param state_vector array with the 8 values of both axes
+            @param axis 0 for the x-axis and 1 for the y-axis
+            @return torque of the axis
+        """
+        x0 = state_vector[4*axis]
+        x1 = state_vector[4*axis + 1]
+        x2 = state_vector[4*axis + 2]
+        x3 = state_vector[4*axis + 3]
+        C = self.C
+        bound = self.bound
+        first = self.first
+        for r in range(self.n_regions):
+            for j in range(first[r], first[r + 1]):
+                c = 4*j
+                if (C[c]*x0 + C[c + 1]*x1 + C[c + 2]*x2 + C[c + 3]*x3 > bound[j]):
+                    break
+            else:
+                law = self.law
+                a = 5*r
+                self.region[axis] = r
+                return law[a]*x0 + law[a + 1]*x1 + law[a + 2]*x2 + law[a + 3]*x3 + law[a + 4]
+        
+        #no region contains the state, saturated LQR
+        self.region[axis] = -1
+        K = self.K
+        u = -(K[0]*x0 + K[1]*x1 + K[2]*x2 + K[3]*x3)
+        if (u > self.u_max):
+            u = self.u_max
+        elif (u < -self.u_max):
+            u = -self.u_max
+        return u
@@ -0,0 +1,71 @@
+''' @file                   Term_complementary.py
+    @brief                  A complementary filter for the tilt of the platform
+    @details                Estimates the two tilt angles of the platform from the raw gyroscope and accelerometer data of the
+                            BNO055. The angular velocity is integrated and the small error of this integration is pulled to
+                            the tilt of the gravity vector with one fixed coefficient. The filter runs at the period of
+                            Task_IMU, which can be shorter than the 10 ms of the BNO055 fusion. Every update is a fixed set of
+                            operations into preallocated storage. Term_filter_replay.py compares the filter with the fusion of
+                            the BNO055 on a recording and chooses the time constant.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 20, 2021
+'''
+
+import math
+from array import array
+
+## @brief conversion from radian to degree
+#
+DEGREES = 180/math.pi
+
+
+class ComplementaryFilter:
+    ''' @brief A complementary filter class
+        @details The angles are the ones of the euler registers of the BNO055: the roll around the y-axis and the pitch
+                 around the x-axis in degree. With the rotation around x applied first, the gravity in the sensor frame
+                 gives pitch = atan2(ay, az) and roll = atan2(-ax, sqrt(ay^2 + az^2)). The angles grow against the
+                 angular velocities of the gyroscope: Task_Controller uses -THETA_X_VEL (gyroscope y) as the rate of
+                 THETA_X (roll) and -THETA_Y_VEL (gyroscope x) as the rate of THETA_Y (pitch). The first update starts at
+                 the gravity angles, then angle = a*(angle - rate*period) + (1 - a)*gravity_angle with a = tau/(tau + period).
+    '''
+
+    def __init__(self, period, time_constant=0.5):
+        ''' @brief Constructs a filter object
+            @param period time between two updates in s
+            @param time_constant time constant in s below which the gyroscope is trusted, above the accelerometer
+        '''
+        #class variables
+        self.period = period
+        self.a = time_constant/(time_constant + period)
+        self.b = 1 - self.a
+        #angular velocities (0..2) and heading, roll, pitch (3..5) like BNO055.read_motion()
+        self.motion = array('f', [0] * 6)
+        self.started = False
+
+    def update(self, raw):
+        ''' @brief Runs one update of the filter
+            @param raw array with the angular velocities x, y, z in degree/s and the accelerations x, y, z in m/s^2,
+                       e.g. from BNO055.read_raw()
+            @return array with the angular velocities x, y, z in degree/s and heading (always 0), roll and pitch in degree,
+                    it is overwritten by the next update
+        '''
+        motion = self.motion
+        (gx, gy, gz, ax, ay, az) = raw
+        motion[0] = gx
+        motion[1] = gy
+        motion[2] = gz
+        #tilt of the gravity vector
+        roll = DEGREES*math.atan2(-ax, math.sqrt(ay*ay + az*az))
+        pitch = DEGREES*math.atan2(ay, az)
+        if (self.started):
+            motion[4] = self.a*(motion[4] - gy*self.period) + self.b*roll
+            motion[5] = self.a*(motion[5] - gx*self.period) + self.b*pitch
+        else:
+            motion[4] = roll
+            motion[5] = pitch
+            self.started = True
+        return(motion)
+
+    def reset(self):
+        ''' @brief Restarts the filter at the tilt of the next update
+        '''
+        self.started = False
@@ -0,0 +1,166 @@
+''' @file                   Term_controller_bench.py
+    @brief                  Host benchmark of the state feedback of Task_Controller
+    @details                Runs on the PC with NumPy, not on the board with ulab. The old controller, two ClosedLoop objects
+                            which were called with one 4x1 state vector per axis, is compared with FusedClosedLoop, which
+                            calculates both torques with multiply-adds over its 2x8 block matrix into a preallocated array,
+                            and with ScheduledClosedLoop, which interpolates its gains in a table before. The gains of the table grow linearly with the ball
+                            radius and the tilt, so the bilinear interpolation is exact and its torques are compared with the
+                            gains calculated from the same linear function, clamped at the end of the table. All run on the
+                            same random float32 states, like the state vector of Task_Controller. Printed are the time of one run for both axes on the PC, the memory which is
+                            allocated and freed again within one run (measured with tracemalloc) and the largest difference of
+                            the torques to the reference. At the end set_K() is checked to remove the gains between the axes which
+                            set_K_block() wrote. The times on the board differ, the ratio shows the saved calls.
+                            None of the controllers creates an array in run() any more, the temporary memory which remains for
+                            ScheduledClosedLoop on the PC are the float objects of the interpolation.
+
+                            Example: python Term_controller_bench.py --runs 20000
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 28, 2021
+'''
+
+import argparse
+from array import array
+import random
+import time
+import tracemalloc
+import numpy as np
+try:
+    import closedloop
+except ImportError:
+    import Term_closedloop as closedloop
+
+
+## @brief gains of one axis: x, theta, x_dot and theta_dot, the same as the default of Task_Controller
+#
+K_AXIS = (0, -5.0, 0, -0.2)
+
+## @brief grid of the gain schedule table: maximum radius in mm, maximum tilt in degree, number of radius and tilt points
+#
+GRID = (100, 10, 5, 4)
+
+
+def random_states(count, seed=1):
+    ''' @brief Creates state vectors of both axes
+        @param count number of states
+        @param seed seed of the random numbers
+        @return list of float32 arrays with the 8 values of both axes
+    '''
+    rng = random.Random(seed)
+    scale = (80, 10, 300, 100)
+    return [array('f', [rng.uniform(-1, 1)*scale[i % 4] for i in range(8)]) for k in range(count)]
+
+
+class LegacyController:
+    ''' @brief The two ClosedLoop objects of Task_Controller before FusedClosedLoop, as reference
+    '''
+
+    def __init__(self, K_x, K_y):
+        self.ctr_x = closedloop.ClosedLoop(np.array(K_x))
+        self.ctr_y = closedloop.ClosedLoop(np.array(K_y))
+        self.state_x = np.zeros((4, 1))
+        self.state_y = np.zeros((4, 1))
+        self.torque = [0, 0]
+
+    def run(self, state_vector):
+        for i in range(4):
+            self.state_x[i, 0] = state_vector[i]
+            self.state_y[i, 0] = state_vector[4 + i]
+        self.torque[0] = self.ctr_x.run(self.state_x)
+        self.torque[1] = self.ctr_y.run(self.state_y)
+        return self.torque
+
+
+def scheduled_gain(k, radius, tilt):
+    ''' @brief Gain of the schedule table, linear in the radius and the tilt and constant beyond the table
+        @param k index of the gain: x, theta, x_dot or theta_dot
+        @param radius distance of the ball from the center in mm
+        @param tilt tilt of the platform in degree
+        @return gain
+    '''
+    return K_AXIS[k]*(1 + min(radius, GRID[0])/GRID[0] + 0.5*min(tilt, GRID[1])/GRID[1])
+
+
+def scheduled_table():
+    ''' @brief Creates the gain schedule table of scheduled_gain() in the layout of ScheduledClosedLoop
+        @return tuple (rows, cols, table) with a float32 array like tablefile.load()
+    '''
+    table = list(GRID)
+    for i in range(GRID[2]):
+        for j in range(GRID[3]):
+            table += [scheduled_gain(k, i*GRID[0]/(GRID[2] - 1), j*GRID[1]/(GRID[3] - 1)) for k in range(4)]
+    return (1 + GRID[2]*GRID[3], 4, array('f', table))
+
+
+def scheduled_reference(state_vector):
+    ''' @brief Torques of both axes with the gains of scheduled_gain()
+        @param state_vector array with the 8 values of both axes
+        @return tuple with the torque of the x-motor and the y-motor
+    '''
+    radius = np.hypot(state_vector[0], state_vector[4])
+    tilt = np.hypot(state_vector[1], state_vector[5])
+    gains = [scheduled_gain(k, radius, tilt) for k in range(4)]
+    return tuple(-sum(gains[k]*state_vector[4*axis + k] for k in range(4)) for axis in range(2))
+
+
+def controllers():
+    ''' @brief Creates the compared controllers
+        @return list of tuples (name, run function, reference function or None for the torques of the first controller)
+    '''
+    return [('2x ClosedLoop', LegacyController(K_AXIS, K_AXIS).run, None),
+            ('FusedClosedLoop', closedloop.FusedClosedLoop(K_AXIS, K_AXIS).run, None),
+            ('ScheduledClosedLoop', closedloop.ScheduledClosedLoop(*scheduled_table()).run, scheduled_reference)]
+
+
+def measure(run, states):
+    ''' @brief Measures one controller
+        @param run run function of the controller
+        @param states list of state vectors
+        @return tuple (time of one run in us, temporary memory of one run in bytes, list of the torques)
+    '''
+    torques = [tuple(run(state)) for state in states]
+    start = time.perf_counter()
+    for state in states:
+        run(state)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    run(states[0])
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (1e6*elapsed/len(states), peak - current, torques)
+
+
+def check_set_K():
+    ''' @brief Checks that set_K() leaves only the gains of both axes in the block matrix
+        @return True if the gains between the axes are zero
+    '''
+    ctr = closedloop.FusedClosedLoop(K_AXIS, K_AXIS)
+    ctr.set_K_block([[1]*8, [2]*8])
+    ctr.set_K(K_AXIS, K_AXIS)
+    K = ctr.get_K()
+    #the gains are stored as float32
+    gains = array('f', [-k for k in K_AXIS])
+    return all(K[4 + i] == 0 and K[8 + i] == 0 and K[i] == gains[i] and K[12 + i] == gains[i] for i in range(4))
+
+
+def main():
+    ''' @brief Command line interface of the benchmark
+    '''
+    parser = argparse.ArgumentParser(description='Compare the controllers of Task_Controller')
+    parser.add_argument('--runs', type=int, default=20000, help='number of random states')
+    args = parser.parse_args()
+
+    states = random_states(args.runs)
+    print('{:<22}{:>14}{:>20}{:>22}'.format('controller', 'us/run PC', 'temporary B/run', 'largest difference'))
+    first = None
+    for (name, run, expected) in controllers():
+        (us, temporary, torques) = measure(run, states)
+        first = first or torques
+        reference = [expected(state) for state in states] if expected else first
+        error = max(abs(a - b) for (old, new) in zip(reference, torques) for (a, b) in zip(old, new))
+        print('{:<22}{:>14.2f}{:>20}{:>22.1e}'.format(name, us, temporary, error))
+    print('set_K() after set_K_block(): gains between the axes {}'.format('zero' if check_set_K() else 'NOT zero'))
+
+
+if __name__ == '__main__':
+    main()
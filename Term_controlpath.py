@@ -0,0 +1,108 @@
+''' @file                   Term_controlpath.py
+    @brief                  A hardware timer driven control path
+    @details                Runs the touch -> control -> motor chain as one fixed-rate pipeline. A timer interrupt only
+                            defers the pipeline with micropython.schedule(), so the stages run outside the interrupt right after
+                            the current bytecode of the cooperative loop. Every stage sees the output of the previous one of the
+                            same pass, so a touch sample becomes a PWM change in the same period. The user interface, the IMU and
+                            the data collection stay in the cooperative loop.
+                            Because the pipeline can interrupt the cooperative loop between any two bytecodes, the stages are the
+                            update() methods of the tasks, which only use the StateBlock, StampedShares and their hardware. The
+                            queues, the files and the state changes stay in the run() methods of the tasks, which the scheduler
+                            still calls. Term_sched_bench.py --pipeline runs the pipeline with a fake timer and compares it with
+                            the cooperative loop.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 8, 2021
+'''
+
+import micropython
+import utime
+
+
+class ControlPath:
+    ''' @brief A timer driven pipeline class
+        @details Objects of this class call a fixed tuple of stages, for example Task_Touchpanel.update,
+                 Task_Controller.update and Task_Motor.update, on every timer interrupt. A stage with a divider of n only runs
+                 in every n-th pass, e.g. the controller which is designed for twice the period of the touchpanel. The
+                 interrupt handler does not allocate. If the pipeline of the previous interrupt has not run yet, the interrupt
+                 is counted as an overrun instead of being queued twice.
+    '''
+
+    def __init__(self, timer, stages, period, stats=None, stats_task=0, dividers=None):
+        ''' @brief Constructs a control path object
+            @param timer preconfigured timer object with a callback() method, e.g. pyb.Timer(6, freq=200)
+            @param stages tuple of functions which are called in that order on every interrupt
+            @param period period of the timer in us
+            @param stats optional TaskStats object which records the latency and run time of the pipeline
+            @param stats_task index of the pipeline in stats
+            @param dividers optional tuple with the number of passes between two runs of every stage, all 1 if None
+        '''
+        #class variables
+        self.timer = timer
+        self.stages = stages
+        self.period = period
+        self.stats = stats
+        self.stats_task = stats_task
+        self.pending = False
+        self.overruns = 0
+        self.release = 0
+        self.dividers = dividers if dividers else (1,) * len(stages)
+        #pass counter, it restarts after the largest divider times all others so every stage keeps its rate
+        self.count = 0
+        self.cycle = 1
+        for divider in self.dividers:
+            self.cycle *= divider
+        if (stats is not None):
+            stats.set_name(stats_task, 'controlpath')
+
+        #bound methods are created once here, creating them in the interrupt would allocate
+        self._isr_ref = self._isr
+        self._run_ref = self._run
+
+    def start(self):
+        ''' @brief Starts calling the pipeline from the timer interrupt
+        '''
+        self.pending = False
+        self.timer.callback(self._isr_ref)
+
+    def stop(self):
+        ''' @brief Stops the timer interrupt
+        '''
+        self.timer.callback(None)
+
+    def _isr(self, timer):
+        ''' @brief Timer interrupt handler which defers the pipeline
+            @param timer timer which caused the interrupt
+        '''
+        if (self.pending):
+            self.overruns += 1
+        else:
+            self.pending = True
+            self.release = utime.ticks_us()
+            micropython.schedule(self._run_ref, 0)
+
+    def _run(self, arg):
+        ''' @brief Runs all stages of the pipeline once
+            @param arg unused argument passed by micropython.schedule()
+        '''
+        stats = self.stats
+        if (stats is not None) and stats.enabled:
+            start = utime.ticks_us()
+            self._stages()
+            stats.record(self.stats_task, self.release, start, utime.ticks_us(), self.period)
+        else:
+            self._stages()
+        self.pending = False
+
+    def _stages(self):
+        ''' @brief Runs the stages which are due in this pass
+        '''
+        count = self.count
+        dividers = self.dividers
+        stages = self.stages
+        for i in range(len(stages)):
+            if (count % dividers[i] == 0):
+                stages[i]()
+        count += 1
+        if (count >= self.cycle):
+            count = 0
+        self.count = count
@@ -0,0 +1,93 @@
+''' @file                   Term_estimator.py
+    @brief                  A steady-state Kalman estimator for the ball position and velocity
+    @details                Estimates position and velocity of the ball on both axes from the touchpanel and the platform angles.
+                            The tilt of the platform accelerates the ball, so it is used as the input of the model of every
+                            axis. The gains are calculated on the PC by Term_kalman_design.py, on the board every update is a
+                            fixed set of multiply-adds into preallocated storage. Without contact only the prediction runs.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 13, 2021
+'''
+
+from array import array
+
+## @brief default coefficients for a period of 5 ms: a11, a12, a21, a22, b1, b2, l1, l2, h
+#
+DEFAULT_COEFFICIENTS = (1, 0.005, 0, 1, -0.00152872, -0.611489, 0.270867, 8.53893, 0.0025)
+
+
+class BallEstimator:
+    ''' @brief A steady-state Kalman estimator class
+        @details Objects of this class hold the estimated position (mm) and velocity (mm/s) of both axes. The model of one
+                 axis is x(k+1) = A x(k) + b u(k) with u = theta + h*theta_dot, the plate angle in degree advanced by half a
+                 period with the angular velocity. A touch measurement corrects the prediction with the constant gain l.
+                 After the ball was lost for more than reset_after updates, the next measurement restarts the estimate.
+    '''
+
+    def __init__(self, coefficients=DEFAULT_COEFFICIENTS, reset_after=20):
+        ''' @brief Constructs an estimator object
+            @param coefficients a11, a12, a21, a22, b1, b2, l1, l2 and h, e.g. a row read by tablefile.load()
+            @param reset_after number of updates without contact after which the estimate restarts at the next contact
+        '''
+        #class variables
+        self.coefficients = array('f', [0] * 9)
+        self.set_coefficients(coefficients)
+        #position and velocity of the x- and the y-axis
+        self.estimate = array('f', [0] * 4)
+        self.reset_after = reset_after
+        self.lost = reset_after + 1
+
+    def set_coefficients(self, coefficients):
+        ''' @brief Sets the model and gain coefficients
+            @param coefficients a11, a12, a21, a22, b1, b2, l1, l2 and h
+        '''
+        for i in range(9):
+            self.coefficients[i] = coefficients[i]
+
+    def update(self, contact, x, y, theta_x_axis, theta_x_axis_vel, theta_y_axis, theta_y_axis_vel):
+        ''' @brief Runs one prediction and, with contact, one measurement update on both axes
+            @param contact True if the touchpanel detects the ball
+            @param x measured x position in mm
+            @param y measured y position in mm
+            @param theta_x_axis plate angle in degree which accelerates the ball along x
+            @param theta_x_axis_vel angular velocity of that angle in degree/s
+            @param theta_y_axis plate angle in degree which accelerates the ball along y
+            @param theta_y_axis_vel angular velocity of that angle in degree/s
+            @return array with x position, x velocity, y position and y velocity, it is overwritten by the next update
+        '''
+        (a11, a12, a21, a22, b1, b2, l1, l2, h) = self.coefficients
+        e = self.estimate
+
+        #restart the estimate at the first contact after the ball was lost
+        if (contact) and (self.lost > self.reset_after):
+            e[0] = x
+            e[1] = 0
+            e[2] = y
+            e[3] = 0
+            self.lost = 0
+            return e
+
+        #prediction
+        u = theta_x_axis + h*theta_x_axis_vel
+        p = a11*e[0] + a12*e[1] + b1*u
+        v = a21*e[0] + a22*e[1] + b2*u
+        u = theta_y_axis + h*theta_y_axis_vel
+        q = a11*e[2] + a12*e[3] + b1*u
+        w = a21*e[2] + a22*e[3] + b2*u
+
+        #measurement update
+        if (contact):
+            self.lost = 0
+            r = x - p
+            p += l1*r
+            v += l2*r
+            r = y - q
+            q += l1*r
+            w += l2*r
+        elif (self.lost <= self.reset_after):
+            self.lost += 1
+
+        e[0] = p
+        e[1] = v
+        e[2] = q
+        e[3] = w
+        return e
@@ -0,0 +1,202 @@
+''' @file                   Term_fault_bench.py
+    @brief                  Host benchmark of the motor fault handling
+    @details                Runs on the PC, not on the board. Task_Motor, Task_User and the deadline scheduler run on a virtual
+                            clock with the fake pyb module of Term_motor_bench.py, in which pulling a pin low calls the
+                            callback of its ExtInt. A controller task writes torques every 10 ms. At random times the nFAULT
+                            pin is pulled low in the middle of the simulated time, e.g. while another task runs. The time
+                            and the number of scheduler steps until both motors have a pulse width of 0 is measured for the
+                            nFAULT interrupt and, as reference, for a motor task which polls the pin in every run. After
+                            every fault the pin goes high again and 'c' is typed into a fake USB_VCP, the time until the
+                            motors follow the controller again is measured too, task_user has to report every fault.
+
+                            Example: python Term_fault_bench.py --faults 200
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 23, 2021
+'''
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+try:
+    import imu_bench
+except ImportError:
+    import Term_imu_bench as imu_bench
+try:
+    import motor_bench
+except ImportError:
+    import Term_motor_bench as motor_bench
+
+
+class EventClock(imu_bench.VirtualClock):
+    ''' @brief Virtual clock which runs events when their time has come
+    '''
+
+    def __init__(self):
+        imu_bench.VirtualClock.__init__(self)
+        self.events = []
+
+    def at(self, time, event):
+        ''' @brief Runs a function when the clock reaches a time
+            @param time time in us
+            @param event function without arguments
+        '''
+        self.events.append((time, event))
+        self.events.sort(key=lambda item: item[0])
+
+    def advance(self, us):
+        end = self.now + max(0, int(us))
+        while self.events and self.events[0][0] <= end:
+            (time, event) = self.events.pop(0)
+            self.now = max(self.now, time)
+            event()
+        self.now = end
+
+
+class FakeSerial:
+    ''' @brief USB_VCP with typed characters
+    '''
+
+    def __init__(self, *args):
+        self.typed = b''
+
+    def any(self):
+        return len(self.typed) > 0
+
+    def read(self, count):
+        (data, self.typed) = (self.typed[:count], self.typed[count:])
+        return data
+
+
+class Controller:
+    ''' @brief Task which writes a torque every run and takes some time
+    '''
+
+    def __init__(self, clock, motor_x_set, motor_y_set, cost=300):
+        self.clock = clock
+        self.motor_x_set = motor_x_set
+        self.motor_y_set = motor_y_set
+        self.cost = cost
+        self.runs = 0
+
+    def run(self):
+        self.runs += 1
+        self.motor_x_set.write(100 + self.runs % 7)
+        self.motor_y_set.write(-80 - self.runs % 5)
+        self.clock.advance(self.cost)
+
+
+def simulate(polled, faults, seed=1):
+    ''' @brief Runs the tasks and injects faults
+        @param polled True to detect the fault by polling nFAULT in the motor task instead of the interrupt
+        @param faults number of injected faults
+        @param seed seed of the random numbers
+        @return tuple (list of stop latencies in us, list of stop latencies in scheduler steps, list of recovery times in us,
+                       text printed by task_user)
+    '''
+    (task_motor, shares) = motor_bench.load_task()
+    task_motor.COMPENSATION_FILE = ''
+    clock = EventClock()
+    utime = clock.module()
+    pyb = sys.modules['pyb']
+    pyb.USB_VCP = FakeSerial
+    sys.modules['utime'] = utime
+    for name in ('scheduler', 'task_user'):
+        if name not in sys.modules:
+            sys.modules[name] = __import__('Term_' + name)
+    for name in ('shares', 'scheduler'):
+        sys.modules[name].utime = utime
+    motor_bench.FakeExtInt.lines.clear()
+    motor_bench.FakePin.levels.clear()
+
+    queues = [shares.Queue() for i in range(11)]
+    (clear_fault, fault) = (shares.Queue(), shares.Share(False))
+    (motor_x_set, motor_y_set) = (shares.StampedShare(0), shares.StampedShare(0))
+    user = sys.modules['task_user'].Task_User(100000, *queues[0:5], shares.Share(), *queues[5:9], None, *queues[9:11],
+                                                clear_fault, fault, shares.Queue())
+    motor = task_motor.Task_Motor(5000, motor_x_set, motor_y_set, clear_fault, fault)
+    controller = Controller(clock, motor_x_set, motor_y_set)
+    motor.run()
+    if polled:
+        #the reference polls nFAULT in every run of the motor task
+        motor_bench.FakeExtInt.lines['B2'].disable()
+        motor_bench.FakeExtInt.lines['B2'].enable = lambda: None
+        run = motor.run
+
+        def poll():
+            if (motor.motor_drv.nFAULT.value() == 0) and (not motor.motor_drv.faulted):
+                motor.motor_drv.fault_cb(0)
+            run()
+        motor.run = poll
+
+    tasks = sys.modules['scheduler'].Scheduler()
+    tasks.add_task(user.run, user.period, 'user')
+    tasks.add_task(controller.run, 10000, 'controller')
+    tasks.add_task(motor.run, motor.period, 'motor')
+    channels = motor.timer.channels
+    state = {'fault': None, 'steps': 0, 'cleared': None}
+    (stops, stop_steps, recoveries) = ([], [], [])
+
+    def stopped():
+        return all(channel.width == 0 for channel in channels)
+
+    def check():
+        if state['fault'] is not None and stopped():
+            stops.append(clock.now - state['fault'])
+            stop_steps.append(state['steps'])
+            state['fault'] = None
+
+    def inject():
+        state['fault'] = clock.now
+        state['steps'] = 0
+        motor_bench.FakeExtInt.drive('B2', 0)
+        check()
+
+    def recover():
+        motor_bench.FakeExtInt.drive('B2', 1)
+
+    def type_clear():
+        user.serport.typed += b'c'
+        state['cleared'] = clock.now
+
+    rng = random.Random(seed)
+    text = io.StringIO()
+    with contextlib.redirect_stdout(text):
+        for k in range(faults):
+            start = clock.now + 50000 + rng.randrange(20000)
+            clock.at(start, inject)
+            clock.at(start + 20000, recover)
+            clock.at(start + 50000, type_clear)
+            end = start + 300000
+            while clock.now < end:
+                tasks.step()
+                state['steps'] += 1
+                check()
+                if state['cleared'] is not None and not fault.read() and not stopped():
+                    recoveries.append(clock.now - state['cleared'])
+                    state['cleared'] = None
+    return (stops, stop_steps, recoveries, text.getvalue())
+
+
+def main():
+    ''' @brief Command line interface of the benchmark
+    '''
+    parser = argparse.ArgumentParser(description='Measure the reaction of the motor fault handling on a virtual clock')
+    parser.add_argument('--faults', type=int, default=100, help='number of injected faults')
+    args = parser.parse_args()
+
+    print('{:<22}{:>22}{:>24}{:>22}'.format('detection', 'stop mean/max us', 'stop mean/max steps', 'recovery after c ms'))
+    for polled in (False, True):
+        (stops, steps, recoveries, text) = simulate(polled, args.faults)
+        print('{:<22}{:>13.0f} /{:>6}{:>15.2f} /{:>6}{:>22.1f}'.format(
+            'polled every 5 ms' if polled else 'nFAULT interrupt', sum(stops)/len(stops), max(stops),
+            sum(steps)/len(steps), max(steps), sum(recoveries)/max(1, len(recoveries))/1000))
+        if len(stops) != args.faults or len(recoveries) != args.faults:
+            print('  {} of {} faults stopped the motors, {} recovered'.format(len(stops), args.faults, len(recoveries)))
+        if text.count('Motor fault:') != args.faults:
+            print('  task_user reported {} of {} faults'.format(text.count('Motor fault:'), args.faults))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+''' @file                   Term_filter_replay.py
+    @brief                  Host tool which replays IMU recordings through the complementary filter
+    @details                Runs on the PC with NumPy, not on the board. A recording of Term_imu_latency.record() holds the raw
+                            angular velocities and accelerations and the roll and pitch of the BNO055 fusion. The raw data is
+                            replayed through the ComplementaryFilter of the board for several time constants and the angles
+                            are compared with the fusion: RMS and largest difference and the delay of the fusion relative to
+                            the filter, from the shift with the best match, interpolated between the samples. The fusion is
+                            only updated every 10 ms, the fraction of samples in which it repeats the last value is printed
+                            too. The sign of the gyroscope relative to the rate of the fusion angles is taken from the
+                            recording and compared with the sign which the filter and the controller use. The time of one update on
+                            the PC is measured, the time on the board is measured by Term_imu_latency.filter_benchmark().
+                            Without a recording --synthetic creates one from a known motion with gyroscope bias, sensor noise
+                            and a fusion which is updated every 10 ms with a delay, then the error and the delay to the true
+                            angles are printed as well. Its gyroscope has the sign of the board: the rate of roll is -y and
+                            the rate of pitch is -x.
+
+                            Example: python Term_filter_replay.py imu_record.bin
+                                     python Term_filter_replay.py --synthetic --period 5000
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 20, 2021
+'''
+
+import argparse
+import time
+import numpy as np
+try:
+    import tablefile
+except ImportError:
+    import Term_tablefile as tablefile
+try:
+    import complementary
+except ImportError:
+    import Term_complementary as complementary
+
+
+## @brief standard gravity in m/s^2
+#
+GRAVITY = 9.81
+
+## @brief time constants of the filter in s which are compared
+#
+TIME_CONSTANTS = (0.1, 0.2, 0.5, 1.0, 2.0)
+
+## @brief sign of the gyroscope columns x and y relative to the rate of pitch and roll, the one of Task_Controller
+#
+GYRO_SIGN = -1
+
+
+def synthetic(period, duration=20.0, fusion_period=0.01, fusion_delay=0.02, seed=1):
+    ''' @brief Creates a recording of a known platform motion
+        @param period sample period in s
+        @param duration length of the recording in s
+        @param fusion_period update period of the simulated fusion in s
+        @param fusion_delay delay of the simulated fusion in s
+        @param seed seed of the random numbers
+        @return tuple (table with the columns of a recording, array with the true roll and pitch in degree)
+    '''
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration/period)) * period
+    #sums of sines like a balancing platform, in degree
+    roll = 4*np.sin(2*np.pi*0.7*t) + 1.5*np.sin(2*np.pi*2.3*t + 1)
+    pitch = 3*np.sin(2*np.pi*0.5*t + 2) + 2*np.sin(2*np.pi*1.9*t)
+    roll_rate = np.gradient(roll, period)
+    pitch_rate = np.gradient(pitch, period)
+    (r, p) = (np.radians(roll), np.radians(pitch))
+    #gravity in the sensor frame, plus vibration of the motors
+    acc = GRAVITY * np.column_stack((-np.sin(r), np.cos(r)*np.sin(p), np.cos(r)*np.cos(p)))
+    acc += rng.normal(0, 0.3, acc.shape)
+    gyro = np.column_stack((GYRO_SIGN*pitch_rate + 0.5, GYRO_SIGN*roll_rate - 0.3, np.zeros_like(t)))
+    gyro += rng.normal(0, 0.2, (len(t), 3))
+    #the fusion repeats the value of its last update, which was calculated fusion_delay before
+    updated = np.floor(t/fusion_period)*fusion_period - fusion_delay
+    fusion = np.column_stack((np.interp(updated, t, roll), np.interp(updated, t, pitch)))
+    table = np.column_stack((1e6*t, np.round(16*gyro)/16, np.round(100*acc)/100, np.round(16*fusion)/16))
+    return (table, np.column_stack((roll, pitch)))
+
+
+def replay(table, period, time_constant):
+    ''' @brief Runs the filter of the board over a recording
+        @param table array with the columns of a recording
+        @param period filter period in s
+        @param time_constant time constant of the filter in s
+        @return tuple (array with the roll and pitch of the filter, time of one update in us on the PC)
+    '''
+    flt = complementary.ComplementaryFilter(period, time_constant)
+    rows = [tuple(float(v) for v in row[1:7]) for row in table]
+    angles = np.zeros((len(rows), 2))
+    start = time.perf_counter()
+    for (i, raw) in enumerate(rows):
+        motion = flt.update(raw)
+        angles[i, 0] = motion[4]
+        angles[i, 1] = motion[5]
+    return (angles, 1e6*(time.perf_counter() - start)/len(rows))
+
+
+def delay(reference, signal, period, largest=0.1):
+    ''' @brief Finds the delay of a signal relative to a reference
+        @details The mean squared difference is calculated for every shift by whole samples, a parabola through the
+                 smallest one and its neighbours gives the delay between the samples.
+        @param reference array of the reference
+        @param signal array of the delayed signal
+        @param period sample period in s
+        @param largest largest delay in both directions which is checked in s
+        @return delay in s with the smallest RMS difference, negative if the signal is ahead of the reference
+    '''
+    count = int(largest/period)
+    n = len(reference)
+    errors = []
+    for k in range(-count, count + 1):
+        if (k >= 0):
+            errors.append(np.mean((signal[k:] - reference[:n - k])**2))
+        else:
+            errors.append(np.mean((signal[:n + k] - reference[-k:])**2))
+    best = int(np.argmin(errors))
+    fraction = 0.0
+    if 0 < best < len(errors) - 1:
+        (left, middle, right) = errors[best - 1:best + 2]
+        curvature = left - 2*middle + right
+        if curvature > 0:
+            fraction = 0.5*(left - right)/curvature
+    return period*(best - count + fraction)
+
+
+def gyro_sign(table, period, skip):
+    ''' @brief Finds the sign of the gyroscope relative to the rate of the fusion angles
+        @param table array with the columns of a recording
+        @param period sample period in s
+        @param skip first sample which is used
+        @return tuple (sign of x to the pitch rate, sign of y to the roll rate), 0 if the platform did not move
+    '''
+    signs = []
+    for (gyro, angle) in ((1, 8), (2, 7)):
+        rate = np.gradient(table[skip:, angle], period)
+        product = np.dot(rate, table[skip:, gyro])
+        signs.append(int(np.sign(product)) if abs(product) > 1e-9 else 0)
+    return tuple(signs)
+
+
+def main():
+    ''' @brief Command line interface of the replay tool
+    '''
+    parser = argparse.ArgumentParser(description='Compare the complementary filter with the BNO055 fusion on a recording')
+    parser.add_argument('recording', nargs='?', default='imu_record.bin', help='table file of Term_imu_latency.record()')
+    parser.add_argument('--synthetic', action='store_true', help='create a recording instead of reading one')
+    parser.add_argument('--period', type=int, default=5000, help='sample period of the synthetic recording in us')
+    parser.add_argument('--skip', type=float, default=2.0, help='start time of the comparison in s, after the settling')
+    args = parser.parse_args()
+
+    truth = None
+    if args.synthetic:
+        (table, truth) = synthetic(args.period/1e6)
+    else:
+        (rows, cols, values) = tablefile.load(args.recording)
+        table = np.array(values).reshape(rows, cols)
+    period = float(np.mean(np.diff(table[:, 0])))/1e6
+    fusion = table[:, 7:9]
+    first = int(args.skip/period)
+    stale = np.mean(np.all(np.diff(fusion[first:], axis=0) == 0, axis=1))
+    print('{} samples, period {:.0f} us, the fusion repeats its last value in {:.0%} of the samples'.format(
+        len(table), 1e6*period, stale))
+    signs = gyro_sign(table, period, first)
+    print('sign of the gyroscope to the fusion rate: x to pitch {:+d}, y to roll {:+d}'.format(*signs))
+    if any(sign != GYRO_SIGN for sign in signs):
+        print('  the filter and the controller use {:+d}, check the mounting and the axis remap of the BNO055'.format(
+            GYRO_SIGN))
+    if truth is not None:
+        error = fusion[first:] - truth[first:]
+        lag = np.mean([delay(truth[first:, i], fusion[first:, i], period) for i in range(2)])
+        print('fusion to truth: rms {:.3f}, max {:.3f} degree, delay {:.1f} ms'.format(
+            np.sqrt(np.mean(error**2)), np.max(np.abs(error)), 1e3*lag))
+
+    print('{:>8}{:>24}{:>20}{:>24}{:>18}{:>14}'.format('tau s', 'to fusion rms/max deg', 'fusion delay ms',
+                                                       'to truth rms/max deg', 'truth delay ms', 'us/update PC'))
+    for time_constant in TIME_CONSTANTS:
+        (angles, us) = replay(table, period, time_constant)
+        error = angles[first:] - fusion[first:]
+        lag = np.mean([delay(angles[first:, i], fusion[first:, i], period) for i in range(2)])
+        (text, lag_text) = ('-', '-')
+        if truth is not None:
+            error_truth = angles[first:] - truth[first:]
+            text = '{:.3f} / {:.3f}'.format(np.sqrt(np.mean(error_truth**2)), np.max(np.abs(error_truth)))
+            lag_truth = np.mean([delay(truth[first:, i], angles[first:, i], period) for i in range(2)])
+            lag_text = '{:.1f}'.format(1e3*lag_truth)
+        print('{:>8.2f}{:>24}{:>20.1f}{:>24}{:>18}{:>14.2f}'.format(
+            time_constant, '{:.3f} / {:.3f}'.format(np.sqrt(np.mean(error**2)), np.max(np.abs(error))), 1e3*lag, text,
+            lag_text, us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+''' @file                   Term_imu_bench.py
+    @brief                  Host benchmark of the IMU driver
+    @details                Runs on the PC, not on the board. The BNO055 driver is imported with a fake pyb module and talks to a
+                            fake I2C bus, which holds the registers of the BNO055 and counts the transactions and the bytes.
+                            The bytearray() and tuple() calls of the driver are counted by replacing these names in the driver
+                            module, the temporary memory of a read is measured with tracemalloc.
+                            With --jitter Task_IMU runs with the deadline scheduler, a touchpanel and a motor task on a virtual
+                            clock. The read of the 12 motion bytes takes a configurable time, a transaction takes this time in
+                            proportion to its bytes plus the address and register bytes. pyb.I2C.mem_read() holds up the other
+                            tasks for the whole transaction. The blocking read takes all 12 bytes in one run, the split phase
+                            read one register group of 6 bytes per run at half the period, so the samples come at the same
+                            rate. The lateness of the other tasks and the age of the published IMU samples since the start of
+                            their first transaction are printed for both.
+
+                            Example: python Term_imu_bench.py --reads 1000
+                                     python Term_imu_bench.py --jitter --latency 1500 --period 2500
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 18, 2021
+'''
+
+import argparse
+import builtins
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+
+class VirtualClock:
+    ''' @brief Virtual time of the fake utime module
+    '''
+
+    def __init__(self):
+        ''' @brief Starts the clock at 0 us
+        '''
+        self.now = 0
+
+    def module(self):
+        ''' @brief Creates the fake utime module
+            @return module object which can be put into sys.modules
+        '''
+        clock = self
+        utime = types.ModuleType('utime')
+        utime.ticks_us = lambda: clock.now % (1 << 30)
+        utime.ticks_ms = lambda: (clock.now // 1000) % (1 << 30)
+        utime.ticks_add = lambda ticks, delta: (ticks + delta) % (1 << 30)
+        utime.ticks_diff = lambda a, b: ((a - b + (1 << 29)) % (1 << 30)) - (1 << 29)
+        utime.sleep_us = lambda us: clock.advance(us)
+        utime.sleep_ms = lambda ms: clock.advance(1000*ms)
+        return utime
+
+    def advance(self, us):
+        ''' @brief Lets time pass
+            @param us time in us
+        '''
+        self.now += max(0, int(us))
+
+
+class FakeI2C:
+    ''' @brief Fake I2C bus with the registers of one BNO055
+        @details With a clock every transaction blocks for a time in proportion to its bytes.
+    '''
+
+    #bytes of a read besides the data: device address, register and device address again
+    OVERHEAD_BYTES = 3
+
+    def __init__(self, clock=None, latency=0):
+        ''' @brief Creates the registers and the counters
+            @param clock optional VirtualClock
+            @param latency time of a read of the 12 motion bytes in us
+        '''
+        self.registers = bytearray(256)
+        self.transactions = 0
+        self.bytes = 0
+        self.clock = clock
+        self.latency = latency
+
+    def set_motion(self, gyro, euler):
+        ''' @brief Writes angular velocities and euler angles into the registers
+            @param gyro angular velocities x, y, z in degree/s
+            @param euler euler angles heading, roll, pitch in degree
+        '''
+        struct.pack_into('<hhhhhh', self.registers, 0x14, *[int(round(16*v)) for v in tuple(gyro) + tuple(euler)])
+
+    def mem_read(self, data, addr, memaddr):
+        ''' @brief Reads registers like pyb.I2C.mem_read()
+            @param data buffer or number of bytes
+            @return the buffer
+        '''
+        if isinstance(data, int):
+            data = bytearray(data)
+        data[:] = self.registers[memaddr:memaddr + len(data)]
+        self.transactions += 1
+        self.bytes += len(data)
+        if self.clock:
+            self.clock.advance(self.latency*(len(data) + self.OVERHEAD_BYTES)/(12 + self.OVERHEAD_BYTES))
+        return data
+
+    def mem_write(self, data, addr, memaddr):
+        ''' @brief Writes registers like pyb.I2C.mem_write()
+            @param data integer or buffer
+        '''
+        if isinstance(data, int):
+            data = bytes([data])
+        self.registers[memaddr:memaddr + len(data)] = data
+        self.transactions += 1
+        self.bytes += len(data)
+
+
+class Counter:
+    ''' @brief Counts the calls of a constructor
+    '''
+
+    def __init__(self, function):
+        ''' @param function constructor which is counted
+        '''
+        self.function = function
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.function(*args)
+
+
+def load_driver():
+    ''' @brief Imports the BNO055 driver with a fake pyb module and counted constructors
+        @return tuple (BNO055 module, dictionary with the counters)
+    '''
+    sys.modules['pyb'] = types.ModuleType('pyb')
+    try:
+        import BNO055
+    except ImportError:
+        import Term_BNO055 as BNO055
+    counters = {'bytearray': Counter(builtins.bytearray), 'tuple': Counter(builtins.tuple)}
+    for (name, counter) in counters.items():
+        setattr(BNO055, name, counter)
+    return (BNO055, counters)
+
+
+def measure(bus, counters, read, reads):
+    ''' @brief Runs a read function and returns its costs per read
+        @param bus FakeI2C object
+        @param counters dictionary with the counters of the driver
+        @param read function which is benchmarked
+        @param reads number of reads
+        @return dictionary with the transactions, bytes, constructor calls, temporary bytes and time per read
+    '''
+    read()
+    bus.transactions = 0
+    bus.bytes = 0
+    for counter in counters.values():
+        counter.calls = 0
+    start = time.perf_counter()
+    for i in range(reads):
+        read()
+    elapsed = time.perf_counter() - start
+    result = {'transactions': bus.transactions / reads, 'bytes': bus.bytes / reads}
+    for (name, counter) in counters.items():
+        result[name] = counter.calls / reads
+    tracemalloc.start()
+    read()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    read()
+    result['peak'] = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    result['us'] = 1e6 * elapsed / reads
+    return result
+
+
+class PeriodicLoad:
+    ''' @brief Task which takes a fixed time and records how late it starts
+    '''
+
+    def __init__(self, clock, period, cost):
+        ''' @param clock VirtualClock
+            @param period period of the task in us
+            @param cost run time of the task in us
+        '''
+        self.clock = clock
+        self.period = period
+        self.cost = cost
+        self.release = None
+        self.late = []
+
+    def run(self):
+        if self.release is None:
+            self.release = self.clock.now
+        self.late.append(self.clock.now - self.release)
+        self.release += self.period
+        self.clock.advance(self.cost)
+
+
+def simulate(split, latency, duration, offset, period):
+    ''' @brief Runs Task_IMU with the scheduler and two other tasks on a virtual clock
+        @param split True for the split phase read, Task_IMU then runs with half the period
+        @param latency time of a bus transfer in us
+        @param duration simulated time in us
+        @param offset time in us between the releases of the other tasks and of Task_IMU
+        @param period period of Task_IMU in us
+        @return tuple (touchpanel task, motor task, list with the age of the IMU samples when they are published)
+    '''
+    clock = VirtualClock()
+    bus = FakeI2C(clock, latency)
+    bus.registers[0x35] = 0xFF
+    bus.set_motion((1.0, 2.0, 3.0), (0.0, 1.0, 2.0))
+
+    class I2C:
+        MASTER = 0
+
+        def __new__(cls, *args):
+            return bus
+
+    pyb = types.ModuleType('pyb')
+    pyb.I2C = I2C
+    pyb.delay = lambda ms: clock.advance(1000*ms)
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda value: value
+    sys.modules.update({'pyb': pyb, 'utime': clock.module(), 'micropython': micropython})
+    for name in ('BNO055', 'shares', 'calstore', 'complementary', 'scheduler', 'task_imu'):
+        if name not in sys.modules:
+            sys.modules[name] = __import__('Term_' + name)
+    for name in ('BNO055', 'scheduler', 'task_imu'):
+        #use the fake modules of this run
+        sys.modules[name].pyb = pyb
+        sys.modules[name].utime = sys.modules['utime']
+    shares = sys.modules['shares']
+    calstore = sys.modules['calstore']
+
+    #warm boot: the IMU calibration is valid
+    directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    calstore.update_imu(bytes(22))
+    block = shares.StateBlock()
+    imu = sys.modules['task_imu'].Task_IMU(period//2 if split else period, shares.Queue(), shares.Share(), block, split)
+    imu.run()
+    os.chdir(directory)
+
+    touch = PeriodicLoad(clock, 5000, 400)
+    motor = PeriodicLoad(clock, 5000, 100)
+    ages = []
+    last = [block.seq(shares.IMU)]
+    first = [clock.now]
+
+    def imu_run():
+        #time of the first transaction of a sample
+        if imu.IMU.part == 0:
+            first[0] = clock.now
+        imu.run()
+        if block.seq(shares.IMU) != last[0]:
+            last[0] = block.seq(shares.IMU)
+            ages.append(clock.now - first[0])
+
+    tasks = sys.modules['scheduler'].Scheduler()
+    tasks.add_task(touch.run, touch.period, 'touch')
+    tasks.add_task(motor.run, motor.period, 'motor')
+    clock.advance(offset)
+    tasks.add_task(imu_run, imu.period, 'imu')
+    while clock.now < duration:
+        tasks.step()
+    return (touch, motor, ages)
+
+
+def main():
+    ''' @brief Command line interface of the benchmark
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark the IMU driver with a fake I2C bus')
+    parser.add_argument('--reads', type=int, default=1000, help='number of reads of every case')
+    parser.add_argument('--jitter', action='store_true', help='simulate the lateness of the other tasks instead')
+    parser.add_argument('--latency', type=float, default=1500.0, help='time of an I2C read of the 12 motion bytes in us')
+    parser.add_argument('--duration', type=float, default=2.0, help='simulated time in s')
+    parser.add_argument('--offset', type=float, default=4000.0, help='release of Task_IMU after the other tasks in us')
+    parser.add_argument('--period', type=int, default=10000, help='period of Task_IMU in us')
+    args = parser.parse_args()
+
+    if args.jitter:
+        print('{:<14}{:>22}{:>22}{:>18}'.format('IMU read', 'touch late mean/max', 'motor late mean/max', 'IMU age mean'))
+        for split in (False, True):
+            (touch, motor, ages) = simulate(split, args.latency, 1e6*args.duration, args.offset, args.period)
+            print('{:<14}{:>15.0f} /{:>5} us{:>15.0f} /{:>5} us{:>15.0f} us'.format(
+                'split phase' if split else 'blocking', sum(touch.late)/len(touch.late), max(touch.late),
+                sum(motor.late)/len(motor.late), max(motor.late), sum(ages)/max(1, len(ages))))
+        return
+
+    (BNO055, counters) = load_driver()
+    bus = FakeI2C()
+    bus.set_motion((1.5, -2.25, 0.5), (90.0, 3.0, -4.5))
+    imu = BNO055.BNO055(bus)
+
+    def separate():
+        imu.read_euler_angles()
+        imu.read_angular_velocity()
+
+    print('{:<36}{:>13}{:>7}{:>11}{:>7}{:>11}{:>11}'.format('case', 'transactions', 'bytes', 'bytearray', 'tuple',
+                                                          'temp bytes', 'us on PC'))
+    for (name, read) in (('read_euler_angles + angular_velocity', separate), ('read_motion', imu.read_motion)):
+        r = measure(bus, counters, read, args.reads)
+        print('{:<36}{:>13g}{:>7g}{:>11g}{:>7g}{:>11}{:>11.2f}'.format(name, r['transactions'], r['bytes'], r['bytearray'],
+                                                                     r['tuple'], r['peak'], r['us']))
+    motion = imu.read_motion()
+    print('read_motion: gyro {} degree/s, euler {} degree'.format(list(motion[0:3]), list(motion[3:6])))
+
+
+if __name__ == '__main__':
+    main()
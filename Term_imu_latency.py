@@ -0,0 +1,213 @@
+''' @file                   Term_imu_latency.py
+    @brief                  Measures the read latency and the sample age of the BNO055 in every operating mode
+    @details                Runs on the board with the IMU connected to I2C 1. For every operating mode the BNO055 is switched
+                            into the mode and the motion read is timed with utime.ticks_us(). The registers are then polled as
+                            fast as possible for some time, every change of the read bytes is a new sample of the BNO055, so
+                            the mean time between changes is its output period. The age of a sample when the read returns is
+                            on average the read latency plus half the output period and at most the read latency plus the
+                            longest time between two samples. The fusion modes are measured with the euler registers and with
+                            the quaternion, the largest difference of roll and pitch between both is printed as a check of
+                            the quaternion conversion. With ready_timeout the time until the sensors of the mode are
+                            calibrated is measured too, move the platform while it runs.
+                            record() writes the raw data and the angles of the fusion in a fusion mode to a table file, which
+                            Term_filter_replay.py replays through the complementary filter on the PC. filter_benchmark() times
+                            the raw read and one update of the complementary filter on the board.
+
+                            Example: import imu_latency
+                                     imu_latency.run(reads=200, duration=2000, ready_timeout=60000)
+                                     imu_latency.record('imu_record.bin', duration=20000, period=5000)
+                                     imu_latency.filter_benchmark()
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 19, 2021
+'''
+
+import BNO055
+import calstore
+import complementary
+import tablefile
+import pyb
+import struct
+import utime
+from array import array
+
+
+##@brief names and values of the measured operating modes
+#
+MODES = (('ACCGYRO', BNO055.ACCGYRO), ('IMU', BNO055.IMU), ('NDOF_FMC_OFF', BNO055.NDOF_FMC_OFF), ('NDOF', BNO055.NDOF))
+##@brief columns of a recording: time in us, angular velocities x, y, z in degree/s, accelerations x, y, z in m/s^2,
+#        roll and pitch of the fusion in degree
+#
+RECORD_COLUMNS = 9
+
+
+def read_latency(imu, reads):
+    ''' @brief Times the motion read
+        @param imu BNO055 object
+        @param reads number of reads
+        @return tuple (mean, max) of the read time in us
+    '''
+    total = 0
+    longest = 0
+    for i in range(reads):
+        start = utime.ticks_us()
+        imu.read_motion()
+        time = utime.ticks_diff(utime.ticks_us(), start)
+        total += time
+        longest = max(longest, time)
+    return (total/reads, longest)
+
+
+def output_period(imu, duration):
+    ''' @brief Measures the time between two new samples of the BNO055
+        @param imu BNO055 object
+        @param duration time of the measurement in ms
+        @return tuple (mean, max) of the time between two changes of the registers in us, (0, 0) without changes
+    '''
+    last = bytearray(len(imu.motion_buffers[0]))
+    changes = 0
+    longest = 0
+    start = utime.ticks_us()
+    changed = start
+    end = utime.ticks_add(utime.ticks_ms(), duration)
+    while (utime.ticks_diff(end, utime.ticks_ms()) > 0):
+        imu.read_motion()
+        buffer = imu.motion_buffers[imu.front]
+        if (buffer != last):
+            now = utime.ticks_us()
+            if (changes > 0):
+                longest = max(longest, utime.ticks_diff(now, changed))
+            else:
+                start = now
+            changed = now
+            changes += 1
+            last[:] = buffer
+    if (changes < 2):
+        return (0, 0)
+    return (utime.ticks_diff(changed, start)/(changes - 1), longest)
+
+
+def quaternion_error(imu, reads):
+    ''' @brief Compares the angles calculated from the quaternion with the euler registers
+        @param imu BNO055 object in a fusion mode, use_quaternion(True)
+        @param reads number of reads
+        @return largest difference of roll and pitch in degree
+    '''
+    error = 0
+    for i in range(reads):
+        motion = imu.read_motion()
+        (roll, pitch) = struct.unpack_from('<hh', imu.motion_buffers[imu.front], 8)
+        error = max(error, abs(motion[4] - roll/16), abs((motion[5] - pitch/16 + 180) % 360 - 180))
+    return error
+
+
+def ready_time(imu, timeout):
+    ''' @brief Waits until the sensors of the current mode are calibrated
+        @param imu BNO055 object
+        @param timeout longest time in ms
+        @return time in ms or None after the timeout
+    '''
+    start = utime.ticks_ms()
+    while (utime.ticks_diff(utime.ticks_ms(), start) < timeout):
+        if (imu.is_ready()):
+            return utime.ticks_diff(utime.ticks_ms(), start)
+        pyb.delay(10)
+    return None
+
+
+def connect():
+    ''' @brief Creates the BNO055 object and writes the calibration of the calibration store
+        @return BNO055 object in the configuration mode
+    '''
+    imu = BNO055.BNO055(pyb.I2C(1, pyb.I2C.MASTER))
+    (flags, touch, coefficients) = calstore.load()
+    if (flags & calstore.IMU_VALID):
+        imu.set_mode(BNO055.CONFIG)
+        imu.wrt_calibration_coefficient(coefficients)
+    return imu
+
+
+def record(filename='imu_record.bin', duration=20000, period=5000, mode=BNO055.NDOF):
+    ''' @brief Records the raw data and the angles of the fusion for Term_filter_replay.py
+        @details The accelerometer, magnetometer, gyroscope and euler registers (0x08 to 0x1F) are read with one
+                 transaction every period into a preallocated table, which is written when the recording is finished.
+        @param filename name of the table file
+        @param duration time of the recording in ms
+        @param period time between two samples in us
+        @param mode fusion mode of the BNO055
+    '''
+    imu = connect()
+    imu.set_mode(mode)
+    rows = duration*1000//period
+    table = array('f', [0] * (rows*RECORD_COLUMNS))
+    buffer = bytearray(24)
+    print('recording {} samples, move the platform'.format(rows))
+    start = utime.ticks_us()
+    release = start
+    for row in range(rows):
+        while (utime.ticks_diff(release, utime.ticks_us()) > 0):
+            pass
+        time = utime.ticks_diff(utime.ticks_us(), start)
+        imu.I2C.mem_read(buffer, 0x28, 0x08)
+        raw = struct.unpack_from('<hhhhhhhhhhhh', buffer)
+        i = row*RECORD_COLUMNS
+        table[i] = time
+        for j in range(3):
+            table[i + 1 + j] = raw[6 + j]/16
+            table[i + 4 + j] = raw[j]/100
+        table[i + 7] = raw[10]/16
+        table[i + 8] = raw[11]/16
+        release = utime.ticks_add(release, period)
+    tablefile.save(filename, rows, RECORD_COLUMNS, table)
+    print('saved {}'.format(filename))
+
+
+def filter_benchmark(updates=1000, period=5000):
+    ''' @brief Times the raw read and the update of the complementary filter
+        @param updates number of timed updates
+        @param period period of the filter in us
+    '''
+    imu = connect()
+    imu.set_mode(BNO055.ACCGYRO)
+    imu.configure_sensors()
+    flt = complementary.ComplementaryFilter(period/1000000)
+    raw = imu.read_raw()
+    start = utime.ticks_us()
+    for i in range(updates):
+        imu.read_raw()
+    read = utime.ticks_diff(utime.ticks_us(), start)/updates
+    start = utime.ticks_us()
+    for i in range(updates):
+        flt.update(raw)
+    update = utime.ticks_diff(utime.ticks_us(), start)/updates
+    print('read_raw {:.0f} us, filter update {:.0f} us, total {:.0f} us of {} us'.format(read, update, read + update, period))
+
+
+def run(reads=200, duration=2000, ready_timeout=0):
+    ''' @brief Measures every operating mode and prints a table
+        @param reads number of timed reads per mode
+        @param duration time in ms the output period is measured
+        @param ready_timeout longest time in ms to wait for the calibration, 0 skips it
+    '''
+    imu = connect()
+    print('{:<14}{:<10}{:>16}{:>14}{:>20}{:>10}{:>12}'.format('mode', 'angles', 'read mean/max', 'period mean',
+                                                             'sample age mean/max', 'ready', 'q error'))
+    for (name, mode) in MODES:
+        imu.set_mode(mode)
+        ready = '-'
+        if (ready_timeout > 0) and (BNO055.READY_MASKS[mode] != 0):
+            time = ready_time(imu, ready_timeout)
+            ready = 'timeout' if time is None else '{} ms'.format(time)
+        for quaternion in ((False,) if mode == BNO055.ACCGYRO else (False, True)):
+            imu.use_quaternion(quaternion)
+            (latency, latency_max) = read_latency(imu, reads)
+            (period, period_max) = output_period(imu, duration)
+            error = '{:.2f} deg'.format(quaternion_error(imu, reads)) if quaternion else '-'
+            print('{:<14}{:<10}{:>9.0f} /{:>4} us{:>11.0f} us{:>11.0f} /{:>5} us{:>10}{:>12}'.format(
+                name, 'quaternion' if quaternion else 'euler', latency, latency_max, period,
+                latency + period/2, latency_max + period_max, ready, error))
+    imu.use_quaternion(False)
+    imu.set_mode(BNO055.NDOF)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,73 @@
+''' @file                   Term_kalman_design.py
+    @brief                  Host tool which designs the steady-state Kalman estimator of the ball
+    @details                Runs on the PC with NumPy, not on the board. The ball on the tilted plate is modeled per axis as a
+                            double integrator driven by the plate angle, discretized with the touchpanel period. The steady-state
+                            gain follows from the dual Riccati equation for a given acceleration noise and touchpanel noise. The
+                            coefficients are written as a table file which Task_Touchpanel loads at startup.
+
+                            Example: python Term_kalman_design.py --period 0.005 --accel-noise 2000 --touch-noise 1 -o KF_gains.bin
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 13, 2021
+'''
+
+import argparse
+import numpy as np
+try:
+    import tablefile
+except ImportError:
+    import Term_tablefile as tablefile
+try:
+    import lqr_design
+except ImportError:
+    import Term_lqr_design as lqr_design
+
+
+def ball_acceleration(p):
+    ''' @brief Calculates the acceleration of the rolling ball per degree of plate angle
+        @param p dictionary with the physical parameters
+        @return acceleration in mm/s^2 per degree
+    '''
+    I_B = 0.4 * p['m_B'] * p['r_B']**2
+    return -p['m_B']*p['g'] / (p['m_B'] + I_B/p['r_B']**2) * 1000.0 * np.pi/180.0
+
+
+def estimator_coefficients(p, period, accel_noise, touch_noise):
+    ''' @brief Designs the model and the steady-state gain of one axis
+        @param p dictionary with the physical parameters
+        @param period touchpanel period in s
+        @param accel_noise standard deviation of the unmodeled ball acceleration in mm/s^2
+        @param touch_noise standard deviation of the touchpanel position in mm
+        @return list a11, a12, a21, a22, b1, b2, l1, l2, h as used by estimator.BallEstimator
+    '''
+    T = period
+    c = ball_acceleration(p)
+    A = np.array([[1.0, T], [0.0, 1.0]])
+    B = np.array([T*T/2*c, T*c])
+    C = np.array([[1.0, 0.0]])
+    G = np.array([[T*T/2], [T]])
+    Q = G @ G.T * accel_noise**2
+    R = np.array([[touch_noise**2]])
+    #the dual LQR problem gives the a priori covariance of the estimate
+    (K, P) = lqr_design.dlqr(A.T, C.T, Q, R)
+    L = (P @ C.T / (C @ P @ C.T + R)).ravel()
+    return [A[0, 0], A[0, 1], A[1, 0], A[1, 1], B[0], B[1], L[0], L[1], T/2]
+
+
+def main():
+    ''' @brief Command line interface of the design tool
+    '''
+    parser = argparse.ArgumentParser(description='Design the ball estimator of the ball balancing platform')
+    parser.add_argument('--period', type=float, default=0.005, help='touchpanel period in s')
+    parser.add_argument('--accel-noise', type=float, default=2000.0, help='unmodeled ball acceleration in mm/s^2')
+    parser.add_argument('--touch-noise', type=float, default=1.0, help='touchpanel noise in mm')
+    parser.add_argument('-o', '--output', default='KF_gains.bin', help='name of the estimator file')
+    args = parser.parse_args()
+
+    row = estimator_coefficients(lqr_design.PARAMETERS, args.period, args.accel_noise, args.touch_noise)
+    print('a11, a12, a21, a22, b1, b2, l1, l2, h =', ', '.join('{:.6g}'.format(v) for v in row))
+    tablefile.save(args.output, 1, 9, row)
+    print('wrote', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+''' @file                   Term_log_bench.py
+    @brief                  Host benchmark of the data collection
+    @details                Runs on the PC, not on the board. Task_DataCollection runs on the virtual clock of Term_imu_bench.py
+                            while the touchpanel and the IMU groups of the state block change every run. The old logger, which
+                            appended one formatted line per sample to a list of strings and wrote 25 lines per run to Data.txt,
+                            is reproduced here as reference. For both loggers the memory which is allocated and freed again
+                            within one sample (measured with tracemalloc), the memory which is kept per sample, the time per
+                            sample on the PC and the number and the longest time of the runs which write the file are printed.
+                            The binary logger copies the bytes of the snapshot into its buffer and writes the time with
+                            struct.pack_into(), neither allocates memory. The temporary memory which remains on the PC are the
+                            float objects which StateBlock.read_group() creates while it copies the values one by one.
+                            At the end Data.bin is decoded with Term_log_decode.py and compared with the written values.
+
+                            Example: python Term_log_bench.py --period 10000 --collections 3
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 24, 2021
+'''
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+try:
+    import imu_bench
+except ImportError:
+    import Term_imu_bench as imu_bench
+try:
+    import log_decode
+except ImportError:
+    import Term_log_decode as log_decode
+
+
+def load_task(clock):
+    ''' @brief Imports the data collection task with a fake utime module
+        @param clock VirtualClock of imu_bench
+        @return tuple (task_datacollection module, shares module)
+    '''
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda value: value
+    sys.modules.update({'utime': clock.module(), 'micropython': micropython})
+    for name in ('shares', 'task_datacollection'):
+        if name not in sys.modules:
+            sys.modules[name] = __import__('Term_' + name)
+        #use the fake module of this run
+        sys.modules[name].utime = sys.modules['utime']
+    return (sys.modules['task_datacollection'], sys.modules['shares'])
+
+
+class LegacyTask:
+    ''' @brief The data collection task before the binary log, as reference
+    '''
+
+    def __init__(self, shares, utime, period, start_collect_data, state_block):
+        self.shares = shares
+        self.utime = utime
+        self.period = period
+        self.start_collect_data = start_collect_data
+        self.state_block = state_block
+        self.values = [0.0] * shares.STATE_SIZE
+        self.state = 1
+
+    def run(self):
+        (shares, utime) = (self.shares, self.utime)
+        if (self.state == 1):
+            if (self.start_collect_data.num_in() > 0):
+                self.start_collect_data.get()
+                self.stop_time = utime.ticks_add(utime.ticks_ms(), 10000)
+                with open("Data.txt", 'w') as f:
+                    f.write("")
+                self.array = ["Time[ms], Contact, X_Pos, Y_Pos, X_Vel, Y_Vel, Theta_X, Theta_Y, Theta_X_Vel, Theta_Y_Vel\n"]
+                self.state = 2
+        if (self.state == 2):
+            if ((utime.ticks_diff(self.stop_time, utime.ticks_ms())) > 0):
+                values = self.values
+                self.state_block.read_group(shares.TOUCH, values)
+                self.state_block.read_group(shares.IMU, values)
+                self.array.append(str((10000-(utime.ticks_diff(self.stop_time, utime.ticks_ms())))) + ", " + str(values[shares.Z_POS]) + ", " + str(values[shares.X_POS]) + ", " + str(values[shares.Y_POS]) + ", " + str(values[shares.X_VEL]) + ", " + str(values[shares.Y_VEL]) + ", " + str(values[shares.THETA_X]) + ", " + str(values[shares.THETA_Y]) + ", " + str(values[shares.THETA_X_VEL]) + ", " + str(values[shares.THETA_Y_VEL]) + "\n")
+            else:
+                self.line = 0
+                self.state = 3
+        elif (self.state == 3):
+            stop_line = min(self.line + 25, len(self.array))
+            with open("Data.txt", 'a') as f:
+                for i in range(self.line, stop_line):
+                    f.write(self.array[i])
+            self.line = stop_line
+            if (self.line == len(self.array)):
+                self.array = []
+                self.state = 1
+
+
+def collect(task, clock, shares, block, collections, trace, seed=1):
+    ''' @brief Runs a data collection task for several collections
+        @param task data collection task with run(), period and state
+        @param clock VirtualClock of the fake utime module
+        @param shares shares module
+        @param block StateBlock of the task
+        @param collections number of collections
+        @param trace True to measure the memory with tracemalloc, False to measure the time
+        @return dictionary with the samples, the allocated and kept bytes or the times and the runs which wrote the file
+    '''
+    rng = random.Random(seed)
+    values = [0.0] * shares.STATE_SIZE
+    result = {'samples': 0, 'temporary': 0, 'kept': 0, 'us': 0.0, 'write runs': 0, 'write ms': 0.0, 'written': []}
+    for k in range(collections):
+        task.start_collect_data.put(True)
+        #the collection starts in the next run, it is done when the task waits for the next start again
+        started = False
+        while True:
+            for i in range(shares.STATE_SIZE):
+                values[i] = rng.uniform(-100, 100)
+            block.write_group(shares.TOUCH, values)
+            block.write_group(shares.IMU, values)
+            if trace:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            task.run()
+            elapsed = time.perf_counter() - start
+            if trace:
+                (after, peak) = tracemalloc.get_traced_memory()
+            #every run which ends in the collecting state has stored a sample, the first one too
+            if task.state == 2:
+                result['samples'] += 1
+                result['us'] += 1e6*elapsed
+                if trace:
+                    result['temporary'] += peak - after
+                    result['kept'] += after - before
+                else:
+                    #the copy would be counted as kept memory
+                    result['written'].append(list(values))
+            elif task.state == 3 or (started and task.state == 1):
+                result['write runs'] += 1
+                result['write ms'] = max(result['write ms'], 1e3*elapsed)
+            started = started or task.state != 1
+            clock.advance(task.period)
+            if started and task.state == 1:
+                break
+    return result
+
+
+def main():
+    ''' @brief Command line interface of the benchmark
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark the memory and the time of the data collection')
+    parser.add_argument('--period', type=int, default=50000, help='period of the data collection task in us')
+    parser.add_argument('--collections', type=int, default=2, help='number of 10 s collections')
+    args = parser.parse_args()
+
+    clock = imu_bench.VirtualClock()
+    (task_datacollection, shares) = load_task(clock)
+    utime = sys.modules['utime']
+    directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    print('{:<16}{:>10}{:>22}{:>18}{:>16}{:>14}{:>18}'.format('logger', 'samples', 'temporary B/sample', 'kept B/sample',
+                                                             'us/sample PC', 'write runs', 'longest write ms'))
+    for name in ('text lines', 'binary buffer'):
+        result = {}
+        for trace in (True, False):
+            block = shares.StateBlock()
+            if name == 'text lines':
+                task = LegacyTask(shares, utime, args.period, shares.Queue(), block)
+            else:
+                task = task_datacollection.Task_DataCollection(args.period, shares.Queue(), block)
+                task.run()
+            if trace:
+                tracemalloc.start()
+            part = collect(task, clock, shares, block, args.collections, trace)
+            if trace:
+                tracemalloc.stop()
+            result.update({key: value for (key, value) in part.items() if trace == (key in ('temporary', 'kept'))})
+            result['samples'] = part['samples']
+        samples = max(1, result['samples'])
+        print('{:<16}{:>10}{:>22.1f}{:>18.1f}{:>16.2f}{:>14}{:>18.3f}'.format(
+            name, result['samples'], result['temporary']/samples, result['kept']/samples, result['us']/samples,
+            result['write runs'], result['write ms']))
+
+    #the file of the last collection against the values which were written into the state block
+    with open(task_datacollection.FILE, 'rb') as f:
+        (period, decoded) = log_decode.decode(f.read())
+    written = result['written'][-len(decoded):]
+    error = max(abs(a - b) for (sample, values) in zip(decoded, written) for (a, b) in zip(sample[1:], values))
+    print('{}: {} samples, period {} us, largest difference to the written values {:.1e}'.format(
+        task_datacollection.FILE, len(decoded), period, error))
+    os.chdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+''' @file                   Term_log_decode.py
+    @brief                  Host tool which decodes the log file of Task_DataCollection
+    @details                Runs on the PC, not on the board. Data.bin starts with a header of 16 bytes: the magic b'BBLG', the
+                            version, the values per sample, the number of samples and the period of the task in us. Then
+                            follow the samples, each the time in ms since the start as int32 and the values of the state
+                            block as float32, little endian. The samples are written as text file with the columns of the
+                            old Data.txt, so plots of older collections still work. The number of samples, the mean time
+                            between two samples and gaps longer than 1.5 periods are printed.
+
+                            Example: python Term_log_decode.py Data.bin -o Data.txt
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 24, 2021
+'''
+
+import argparse
+import struct
+
+
+## @brief first four bytes of the log file, the same as in Task_DataCollection
+#
+MAGIC = b'BBLG'
+
+## @brief struct format of the header, the same as in Task_DataCollection
+#
+HEADER = '<4sHHII'
+
+## @brief first line of the text file, the columns of the old Data.txt
+#
+COLUMNS = "Time[ms], Contact, X_Pos, Y_Pos, X_Vel, Y_Vel, Theta_X, Theta_Y, Theta_X_Vel, Theta_Y_Vel"
+
+
+def decode(data):
+    ''' @brief Decodes the content of a log file
+        @param data bytes of the file
+        @return tuple (period in us, list of samples), a sample is a tuple of the time in ms and the values
+    '''
+    (magic, version, count, samples, period) = struct.unpack_from(HEADER, data, 0)
+    if (magic != MAGIC) or (version != 1):
+        raise ValueError('not a log file of Task_DataCollection')
+    record = '<i{}f'.format(count)
+    size = struct.calcsize(record)
+    offset = struct.calcsize(HEADER)
+    if len(data) < offset + samples*size:
+        #a collection which was interrupted while writing the file, the complete samples are kept
+        samples = (len(data) - offset)//size
+    return (period, [struct.unpack_from(record, data, offset + i*size) for i in range(samples)])
+
+
+def to_text(samples):
+    ''' @brief Formats the samples like the old Data.txt
+        @param samples list of samples from decode()
+        @return text with one line per sample
+    '''
+    lines = [COLUMNS]
+    for sample in samples:
+        lines.append(', '.join([str(sample[0])] + ['{:.6g}'.format(value) for value in sample[1:]]))
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    ''' @brief Command line interface of the decoder
+    '''
+    parser = argparse.ArgumentParser(description='Decode the log file of Task_DataCollection')
+    parser.add_argument('log', nargs='?', default='Data.bin', help='log file copied from the board')
+    parser.add_argument('-o', '--output', default='Data.txt', help='text file with one line per sample')
+    args = parser.parse_args()
+
+    with open(args.log, 'rb') as f:
+        (period, samples) = decode(f.read())
+    with open(args.output, 'w') as f:
+        f.write(to_text(samples))
+    print('{} samples, period of the task {} us'.format(len(samples), period))
+    if len(samples) > 1:
+        times = [sample[0] for sample in samples]
+        steps = [b - a for (a, b) in zip(times[:-1], times[1:])]
+        gaps = [step for step in steps if step > 1.5*period/1000]
+        print('{:.1f} ms between two samples, {} gaps, the longest {} ms'.format(
+            (times[-1] - times[0])/(len(samples) - 1), len(gaps), max(steps)))
+    print('saved {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+''' @file                   Term_lqr_design.py
+    @brief                  Host tool which designs the gains of the full state feedback controller
+    @details                Runs on the PC with NumPy, not on the board. The tool linearizes the ball-on-plate model of one
+                            axis from its physical parameters, discretizes it with the controller period and solves the discrete
+                            LQR problem for one or many Q/R candidates at once. The gains are converted into the units used on
+                            the board (mm, degree, mm/s, degree/s and mNm) and written as a table file which Task_Controller
+                            loads at startup. Optionally the model is linearized on a grid of ball radii and platform tilts and
+                            the gains of all grid points are written as a gain schedule table for closedloop.ScheduledClosedLoop.
+                            With --qi the model is augmented with the integral of the ball position and the integral gain is
+                            written as fifth column of the gain file, Task_Controller uses it to remove tracking offsets.
+
+                            Example: python Term_lqr_design.py --q 400,100,25,1 --q 400,100,100,1 --r 10 --r 30 -o K_gains.bin
+                                     python Term_lqr_design.py --schedule 100,6,15,4
+                                     python Term_lqr_design.py --qi 2000
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 10, 2021
+'''
+
+import argparse
+import numpy as np
+try:
+    import tablefile
+except ImportError:
+    import Term_tablefile as tablefile
+
+
+## @brief physical parameters of one axis of the platform in SI units
+#  @details r_m: motor lever arm, l_P: distance between the pivot and the push rod joint, r_B: ball radius,
+#           r_C: height of the plate surface above the pivot, r_G: height of the platform center of gravity above the pivot,
+#           m_B: ball mass, m_P: platform mass, I_P: platform inertia about the pivot, b: viscous friction of the pivot
+#
+PARAMETERS = {'r_m': 0.060, 'l_P': 0.110, 'r_B': 0.0105, 'r_C': 0.050, 'r_G': 0.042,
+              'm_B': 0.030, 'm_P': 0.400, 'I_P': 1.88e-3, 'b': 0.010, 'g': 9.81}
+
+## @brief factors from the model state (m, rad, m/s, rad/s) to the board state (mm, degree, mm/s, degree/s)
+#
+STATE_SCALE = (1000.0, 180.0/np.pi, 1000.0, 180.0/np.pi)
+
+## @brief factor from the model torque (Nm) to the board torque (mNm)
+#  @details The sign is negative because a positive motor torque on the board tilts the plate to a negative IMU angle,
+#           this gives the angle gains the same sign as the hand tuned default gains of Task_Controller.
+#
+TORQUE_SCALE = -1000.0
+
+## @brief factor from the integral of the model position (m*s) to the integral on the board (mm*s)
+#
+INTEGRAL_SCALE = 1000.0
+
+
+def mass_matrix(p, x, theta):
+    ''' @brief Calculates the mass matrix of the ball and the plate
+        @param p dictionary with the physical parameters
+        @param x ball position on the plate in m
+        @param theta plate angle in rad
+        @return 2x2 mass matrix for the coordinates (x, theta)
+    '''
+    h = p['r_C'] + p['r_B']
+    I_B = 0.4 * p['m_B'] * p['r_B']**2
+    #jacobian of the ball center position
+    J = np.array([[np.cos(theta), -x*np.sin(theta) - h*np.cos(theta)],
+                  [np.sin(theta), x*np.cos(theta) - h*np.sin(theta)]])
+    #spin of the rolling ball is theta_dot - x_dot/r_B
+    a = np.array([-1.0/p['r_B'], 1.0])
+    return p['m_B']*J.T @ J + I_B*np.outer(a, a) + np.diag([0.0, p['I_P']])
+
+
+def gravity_vector(p, x, theta):
+    ''' @brief Calculates the derivative of the potential energy
+        @param p dictionary with the physical parameters
+        @param x ball position on the plate in m
+        @param theta plate angle in rad
+        @return gradient of the potential energy for the coordinates (x, theta)
+    '''
+    h = p['r_C'] + p['r_B']
+    g = p['g']
+    return np.array([p['m_B']*g*np.sin(theta),
+                     p['m_B']*g*(x*np.cos(theta) - h*np.sin(theta)) - p['m_P']*g*p['r_G']*np.sin(theta)])
+
+
+def linearize(p, x0=0.0, theta0=0.0, step=1e-6):
+    ''' @brief Linearizes the model of one axis
+        @details The plate is held by the static torque at the operating point, the velocities are zero there.
+        @param p dictionary with the physical parameters
+        @param x0 ball position of the operating point in m
+        @param theta0 plate angle of the operating point in rad
+        @param step step of the finite differences
+        @return tuple (A, B) of the continuous model for the state (x, theta, x_dot, theta_dot) and the motor torque
+    '''
+    lever = p['l_P'] / p['r_m']
+    tau0 = gravity_vector(p, x0, theta0)[1]
+
+    def acceleration(q):
+        M = mass_matrix(p, q[0], q[1])
+        return np.linalg.solve(M, np.array([0.0, tau0]) - gravity_vector(p, q[0], q[1]))
+
+    q0 = np.array([x0, theta0])
+    dq = np.zeros((2, 2))
+    for i in range(2):
+        e = np.zeros(2)
+        e[i] = step
+        dq[:, i] = (acceleration(q0 + e) - acceleration(q0 - e)) / (2*step)
+    M_inv = np.linalg.inv(mass_matrix(p, x0, theta0))
+
+    A = np.zeros((4, 4))
+    A[0:2, 2:4] = np.eye(2)
+    A[2:4, 0:2] = dq
+    A[2:4, 2:4] = -M_inv @ np.diag([0.0, p['b']])
+    B = np.zeros((4, 1))
+    B[2:4, 0] = M_inv @ np.array([0.0, lever])
+    return (A, B)
+
+
+def expm(M):
+    ''' @brief Matrix exponential by scaling and squaring of a Taylor series
+        @param M square matrix
+        @return exp(M)
+    '''
+    norm = np.linalg.norm(M, 1)
+    squarings = max(0, int(np.ceil(np.log2(norm))) + 1) if norm > 0 else 0
+    M = M / 2**squarings
+    result = np.eye(M.shape[0])
+    term = np.eye(M.shape[0])
+    for k in range(1, 20):
+        term = term @ M / k
+        result = result + term
+    for i in range(squarings):
+        result = result @ result
+    return result
+
+
+def discretize(A, B, period):
+    ''' @brief Discretizes a continuous model with zero order hold
+        @param A continuous system matrix
+        @param B continuous input matrix
+        @param period sample time in s
+        @return tuple (Ad, Bd) of the discrete model
+    '''
+    n = A.shape[0]
+    m = B.shape[1]
+    M = np.zeros((n + m, n + m))
+    M[:n, :n] = A
+    M[:n, n:] = B
+    E = expm(M * period)
+    return (E[:n, :n], E[:n, n:])
+
+
+def board_model(p, period, torque_scale=TORQUE_SCALE):
+    ''' @brief Discretizes the model of one axis in the units of the board
+        @param p dictionary with the physical parameters
+        @param period controller period in s
+        @param torque_scale factor from Nm to the board torque
+        @return tuple (A, B) for the state x, theta, x_dot, theta_dot in mm, degree, mm/s, degree/s and the torque in mNm
+    '''
+    (A, B) = discretize(*linearize(p), period)
+    S = np.diag(STATE_SCALE)
+    return (S @ A @ np.linalg.inv(S), S @ B / torque_scale)
+
+
+def augment_integral(A, B, period):
+    ''' @brief Adds the integral of the ball position to a discrete model
+        @details The integral is accumulated with the forward Euler rule like on the board, z(k+1) = z(k) + period*x(k).
+        @param A discrete system matrix with shape (..., n, n)
+        @param B discrete input matrix with shape (..., n, m)
+        @param period sample time in s
+        @return tuple (A, B) of the model with the integral as last state
+    '''
+    n = A.shape[-1]
+    A_i = np.zeros(A.shape[:-2] + (n + 1, n + 1))
+    A_i[..., :n, :n] = A
+    A_i[..., n, 0] = period
+    A_i[..., n, n] = 1.0
+    B_i = np.zeros(B.shape[:-2] + (n + 1, B.shape[-1]))
+    B_i[..., :n, :] = B
+    return (A_i, B_i)
+
+
+def dlqr(A, B, Q, R, iterations=100000, tol=1e-10):
+    ''' @brief Solves the discrete LQR problem for a batch of weights at once
+        @details The Riccati recursion is iterated for all candidates in parallel until every candidate converged.
+        @param A discrete system matrix with shape (..., n, n)
+        @param B discrete input matrix with shape (..., n, m)
+        @param Q state weights with shape (..., n, n)
+        @param R input weights with shape (..., m, m)
+        @return tuple (K, P) with the gains (..., m, n) and the solutions of the Riccati equation (..., n, n)
+    '''
+    Q = np.asarray(Q, dtype=float)
+    R = np.asarray(R, dtype=float)
+    P = Q.copy()
+    At = np.swapaxes(A, -1, -2)
+    Bt = np.swapaxes(B, -1, -2)
+    for i in range(iterations):
+        BtP = Bt @ P
+        K = np.linalg.solve(R + BtP @ B, BtP @ A)
+        P_next = Q + At @ P @ A - At @ P @ B @ K
+        if np.max(np.abs(P_next - P) / (1 + np.abs(P))) < tol:
+            P = P_next
+            break
+        P = P_next
+    BtP = Bt @ P
+    K = np.linalg.solve(R + BtP @ B, BtP @ A)
+    return (K, P)
+
+
+def board_gains(K, state_scale=STATE_SCALE, torque_scale=TORQUE_SCALE):
+    ''' @brief Converts gains of the model into gains for the board units
+        @param K gains with shape (..., 1, n) for the model units
+        @param state_scale factors from the model state to the board state
+        @param torque_scale factor from the model torque to the board torque
+        @return gains with shape (..., n) for the board units
+    '''
+    return torque_scale * K[..., 0, :] / np.asarray(state_scale)
+
+
+def spectral_radius(A, B, K):
+    ''' @brief Calculates the largest magnitude of the closed loop eigenvalues
+        @param A discrete system matrix
+        @param B discrete input matrix
+        @param K gains with shape (..., m, n)
+        @return spectral radius for every candidate, values below 1 are stable
+    '''
+    return np.max(np.abs(np.linalg.eigvals(A - B @ K)), axis=-1)
+
+
+def schedule_table(p, q, r, period, radius_max, n_radius, tilt_max, n_tilt, torque_scale=TORQUE_SCALE):
+    ''' @brief Designs the gains on a grid of operating points
+        @param p dictionary with the physical parameters
+        @param q diagonal of Q
+        @param r weight of the motor torque
+        @param period controller period in s
+        @param radius_max largest ball radius of the grid in mm
+        @param n_radius number of radius points
+        @param tilt_max largest platform tilt of the grid in degree
+        @param n_tilt number of tilt points
+        @param torque_scale factor from Nm to the board torque
+        @return list with the rows of the table file, the first row holds the grid
+    '''
+    A = []
+    B = []
+    for radius in np.linspace(0, radius_max, n_radius):
+        for tilt in np.linspace(0, tilt_max, n_tilt):
+            (A_c, B_c) = linearize(p, radius/STATE_SCALE[0], tilt/STATE_SCALE[1])
+            (A_d, B_d) = discretize(A_c, B_c, period)
+            A.append(A_d)
+            B.append(B_d)
+    (K, P) = dlqr(np.array(A), np.array(B), np.diag(q), [[r]])
+    rows = [[radius_max, tilt_max, n_radius, n_tilt]]
+    rows += [list(k) for k in board_gains(K, torque_scale=torque_scale)]
+    return rows
+
+
+def main():
+    ''' @brief Command line interface of the design tool
+    '''
+    parser = argparse.ArgumentParser(description='Design the LQR gains of the ball balancing platform')
+    parser.add_argument('--q', action='append', help='diagonal of Q as x,theta,x_dot,theta_dot, can be repeated')
+    parser.add_argument('--r', action='append', type=float, help='weight of the motor torque, can be repeated')
+    parser.add_argument('--qi', type=float, help='weight of the integral of the ball position, adds an integral gain')
+    parser.add_argument('--period', type=float, default=0.01, help='controller period in s')
+    parser.add_argument('--torque-scale', type=float, default=TORQUE_SCALE, help='factor from Nm to the board torque')
+    parser.add_argument('--pick', type=int, default=0, help='index of the candidate which is written to the file')
+    parser.add_argument('-o', '--output', default='K_gains.bin', help='name of the gain file')
+    parser.add_argument('--schedule', help='also write a gain schedule table for radius_max_mm,n_radius,tilt_max_deg,n_tilt')
+    parser.add_argument('--schedule-output', default='K_schedule.bin', help='name of the gain schedule file')
+    args = parser.parse_args()
+
+    q_list = [[float(v) for v in q.split(',')] for q in (args.q or ['400,100,25,1'])]
+    r_list = args.r or [30.0]
+    state_scale = STATE_SCALE
+    if args.qi is not None:
+        q_list = [q + [args.qi] for q in q_list]
+        state_scale = STATE_SCALE + (INTEGRAL_SCALE,)
+    Q = np.array([np.diag(q) for q in q_list for r in r_list])
+    R = np.array([[[r]] for q in q_list for r in r_list])
+
+    A, B = linearize(PARAMETERS)
+    Ad, Bd = discretize(A, B, args.period)
+    if args.qi is not None:
+        Ad, Bd = augment_integral(Ad, Bd, args.period)
+    K, P = dlqr(Ad, Bd, Q, R)
+    K_board = board_gains(K, state_scale=state_scale, torque_scale=args.torque_scale)
+    rho = spectral_radius(Ad, Bd, K)
+
+    units = 'mm, deg, mm/s, deg/s, mm*s' if args.qi is not None else 'mm, deg, mm/s, deg/s'
+    print('{:>3}  {:<28}{:>8}  {:<60}{:>8}'.format('#', 'Q', 'R', 'K ({} -> mNm)'.format(units), 'rho'))
+    for i in range(len(K_board)):
+        q_text = ','.join('{:g}'.format(v) for v in np.diag(Q[i]))
+        k_text = ' '.join('{:10.4g}'.format(v) for v in K_board[i])
+        print('{:>3}  {:<28}{:>8g}  {:<60}{:>8.4f}'.format(i, q_text, R[i, 0, 0], k_text, rho[i]))
+
+    #the same gains are used for the x- and the y-axis
+    tablefile.save(args.output, 2, len(state_scale), list(K_board[args.pick]) * 2)
+    print('wrote candidate {} to {}'.format(args.pick, args.output))
+
+    if args.schedule:
+        (radius_max, n_radius, tilt_max, n_tilt) = [float(v) for v in args.schedule.split(',')]
+        rows = schedule_table(PARAMETERS, np.diag(Q[args.pick])[:4], R[args.pick, 0, 0], args.period,
+                              radius_max, int(n_radius), tilt_max, int(n_tilt), args.torque_scale)
+        for row in rows[1:]:
+            print(' '.join('{:10.4g}'.format(v) for v in row))
+        tablefile.save(args.schedule_output, len(rows), 4, [v for row in rows for v in row])
+        print('wrote gain schedule of candidate {} to {}'.format(args.pick, args.schedule_output))
+
+
+if __name__ == '__main__':
+    main()
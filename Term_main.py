@@ -1,118 +1,152 @@
-''' @file                   Term_main.py
-    @brief                  In that file the main program is executed
-    @details                In this file all the task for the whole ball balancing aplication are executed.
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   November 3, 2021
-'''
-
-import task_controller
-import task_user
-import task_motor
-import task_imu
-import task_touchpanel
-import task_datacollection
-import shares
-
-
-if __name__ == '__main__':
-    
-    #shared variables
-    
-    ## @brief sends instruction from task_user to task_motor to clear the faults of the motors
-    #
-    clear_fault = shares.Queue()
-    ## @brief sends instruction from task_user to task_datacollection to start collecting data
-    #
-    start_data_collection = shares.Queue()
-    ## @brief sends instruction from task_user to task_IMU to get IMU calibration status
-    #
-    get_imu_status = shares.Queue()
-    ## @brief sends instruction from task_user to task_touchpanel to start calibration process or read calibration values from file if existent
-    #
-    calibrate_touchpanel = shares.Queue()
-    ## @brief sends instruction from task_user to task_controller to begin balancing of the platform
-    #
-    begin_balancing = shares.Queue()
-    ## @brief sends instruction from task_user to task_controller to stop balancing of the platform
-    #
-    stop_balancing = shares.Queue()
-    ## @brief sends instruction from task_user to task_touchpanel to read x,y value
-    #
-    UserInputTouch = shares.Queue()
-    ## @brief sends instruction from task_touchpanel to task_user that calibration is finished
-    #  
-    CalibrationFinished = shares.Queue()
-    ## @brief sends instruction from task_touchpanel to task_user to print instructions
-    #  
-    getUserInputTouch = shares.Queue()
-    ## @brief sends instruction from task_touchpanel to task_user to print that the Point for the touchpanel is calibrated.
-    #
-    PointFinished = shares.Queue()
-    
- 
-    ## @brief indicates a fault on the motor
-    #
-    fault = shares.Share()
-    ## @brief sends actuation level from task_controller to task_motor 
-    #
-    motor_x_set = shares.Share(0)
-    ## @brief sends actuation level from task_controller to task_motor 
-    #
-    motor_y_set = shares.Share(0)
-    ## @brief sends IMU status tupel from task_imu to task_user 
-    #
-    imu_status = shares.Share()
-    ## @brief contains actual theta_y angle of the platform (written by task_imu) 
-    #
-    theta_y = shares.Share()
-    ## @brief contains actual theta_x angle of the platform (written by task_imu) 
-    #
-    theta_x = shares.Share()
-    ## @brief contains actual theta_y velocity of the platform (written by task_imu) 
-    #
-    theta_y_vel = shares.Share()
-    ## @brief contains actual theta_x velocity of the platform (written by task_imu) 
-    #
-    theta_x_vel = shares.Share()
-    ## @brief contains actual z position from touchpanel read (written by task_touchpanel) 
-    #
-    z_pos = shares.Share()
-    ## @brief contains actual x position from touchpanel read (written by task_touchpanel) 
-    #
-    x_pos = shares.Share()
-    ## @brief contains actual y position from touchpanel read (written by task_touchpanel) 
-    #
-    y_pos = shares.Share()
-    ## @brief contains actual x velocity from touchpanel read (written by task_touchpanel) 
-    #
-    x_vel = shares.Share()
-    ## @brief contains actual y velocity from touchpanel read (written by task_touchpanel) 
-    #
-    y_vel = shares.Share()
-
-    
-    
-    #initiating tasks
-    user = task_user.Task_User(100000, calibrate_touchpanel, get_imu_status, begin_balancing, stop_balancing, start_data_collection, imu_status, UserInputTouch, CalibrationFinished, getUserInputTouch, PointFinished)
-    motor = task_motor.Task_Motor(5000, motor_x_set, motor_y_set)
-    touchpanel = task_touchpanel.Task_Touchpanel(5000, calibrate_touchpanel, z_pos, x_pos, y_pos, x_vel, y_vel, UserInputTouch, CalibrationFinished, getUserInputTouch, PointFinished)
-    imu = task_imu.Task_IMU(10000, get_imu_status, imu_status, theta_y, theta_x, theta_y_vel, theta_x_vel)
-    controller = task_controller.Task_Controller(10000, begin_balancing, stop_balancing, z_pos, x_pos, y_pos, x_vel, y_vel, theta_x, theta_y, theta_x_vel, theta_y_vel, motor_x_set, motor_y_set)
-    datacollection = task_datacollection.Task_DataCollection(50000, start_data_collection, z_pos, x_pos, y_pos, x_vel, y_vel, theta_x, theta_y, theta_x_vel, theta_y_vel)
-    
-    while(True):
-        
-        #try to run the different tasks
-        try:
-            user.run()
-            touchpanel.run()
-            imu.run()
-            controller.run()
-            motor.run()
-            datacollection.run()
-            
-        #checks if there is a KeyboardInterrupt
-        except KeyboardInterrupt:
-            break
-    #Prints the errror message
-    print('Program terminating')
+''' @file                   Term_main.py
+    @brief                  In that file the main program is executed
+    @details                In this file all the task for the whole ball balancing aplication are executed.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   November 3, 2021
+'''
+
+import task_controller
+import task_user
+import task_motor
+import task_imu
+import task_touchpanel
+import task_datacollection
+import shares
+import scheduler
+import taskstats
+import controlpath
+import async_runtime
+import BNO055
+import micropython
+import pyb
+
+
+## @brief runs the update() of touchpanel, controller and motor as one pipeline from a hardware timer, their run() only handles the commands in the scheduler
+#
+TIMER_CONTROL = False
+## @brief runs every task as a uasyncio coroutine instead of using the deadline scheduler
+#
+ASYNC_RUNTIME = False
+## @brief operating mode of the BNO055, BNO055.IMU does not wait for the magnetometer calibration, see Term_imu_latency.py
+#
+IMU_MODE = BNO055.NDOF
+## @brief calculates the angles from the quaternion of the BNO055 instead of reading its euler registers
+#
+IMU_QUATERNION = False
+## @brief estimates the angles with the complementary filter from the raw data on the board, best with IMU_MODE = BNO055.ACCGYRO
+#
+IMU_COMPLEMENTARY = False
+## @brief period of task_imu in us, the complementary filter can run faster than the 10 ms of the fusion
+#
+IMU_PERIOD = 10000
+## @brief reads x and y of the touchpanel as median of ADC bursts, uses timer 7 and up to 30% of the touchpanel period
+#
+TOUCH_OVERSAMPLING = False
+## @brief reads the IMU in one register group per run of task_imu, so a run blocks the other tasks only for a part of the
+#         I2C transfer, set IMU_PERIOD to 5000 (3333 with IMU_QUATERNION) to keep the sample rate of the fusion
+#
+IMU_SPLIT_PHASE = False
+
+
+if __name__ == '__main__':
+    
+    #memory for the traceback of an exception in an interrupt, e.g. the nFAULT interrupt of the motor driver
+    micropython.alloc_emergency_exception_buf(100)
+    
+    #shared variables
+    
+    ## @brief sends instruction from task_user to task_motor to clear the faults of the motors
+    #
+    clear_fault = shares.Queue()
+    ## @brief sends instruction from task_user to task_datacollection to start collecting data
+    #
+    start_data_collection = shares.Queue()
+    ## @brief sends instruction from task_user to task_IMU to get IMU calibration status
+    #
+    get_imu_status = shares.Queue()
+    ## @brief sends instruction from task_user to task_touchpanel to start calibration process or read calibration values from file if existent
+    #
+    calibrate_touchpanel = shares.Queue()
+    ## @brief sends instruction from task_user to task_controller to begin balancing of the platform
+    #
+    begin_balancing = shares.Queue()
+    ## @brief sends instruction from task_user to task_controller to stop balancing of the platform
+    #
+    stop_balancing = shares.Queue()
+    ## @brief sends instruction from task_user to task_touchpanel to read x,y value
+    #
+    UserInputTouch = shares.Queue()
+    ## @brief sends instruction from task_touchpanel to task_user that calibration is finished
+    #  
+    CalibrationFinished = shares.Queue()
+    ## @brief sends instruction from task_touchpanel to task_user to print instructions
+    #  
+    getUserInputTouch = shares.Queue()
+    ## @brief sends instruction from task_touchpanel to task_user to print that the Point for the touchpanel is calibrated.
+    #
+    PointFinished = shares.Queue()
+    ## @brief sends the index of the reference trajectory from task_user to task_controller
+    #
+    select_trajectory = shares.Queue()
+    ## @brief sends the index of the controller (state feedback or explicit MPC) from task_user to task_controller
+    #
+    select_controller = shares.Queue()
+    ## @brief sends the index of the controller which task_controller uses back to task_user
+    #
+    controller_selected = shares.Queue()
+    
+ 
+    ## @brief indicates a fault on the motor
+    #
+    fault = shares.Share(False)
+    ## @brief sends actuation level from task_controller to task_motor 
+    #
+    motor_x_set = shares.StampedShare(0)
+    ## @brief sends actuation level from task_controller to task_motor 
+    #
+    motor_y_set = shares.StampedShare(0)
+    ## @brief sends IMU status tupel from task_imu to task_user 
+    #
+    imu_status = shares.Share()
+    ## @brief contains the touchpanel values (written by task_touchpanel) and the angles and velocities of the platform (written by task_imu)
+    #
+    state_block = shares.StateBlock()
+    
+    ## @brief run time and overrun statistics of all tasks, printed by task_user
+    #
+    task_stats = taskstats.TaskStats(7)
+    
+    #initiating tasks
+    user = task_user.Task_User(100000, calibrate_touchpanel, get_imu_status, begin_balancing, stop_balancing, start_data_collection, imu_status, UserInputTouch, CalibrationFinished, getUserInputTouch, PointFinished, task_stats, select_trajectory, select_controller, clear_fault, fault, controller_selected)
+    motor = task_motor.Task_Motor(5000, motor_x_set, motor_y_set, clear_fault, fault, pipelined=TIMER_CONTROL)
+    touchpanel = task_touchpanel.Task_Touchpanel(5000, calibrate_touchpanel, state_block, UserInputTouch, CalibrationFinished, getUserInputTouch, PointFinished, pipelined=TIMER_CONTROL, oversampling=TOUCH_OVERSAMPLING)
+    imu = task_imu.Task_IMU(IMU_PERIOD, get_imu_status, imu_status, state_block, IMU_SPLIT_PHASE, IMU_MODE, IMU_QUATERNION, IMU_COMPLEMENTARY)
+    controller = task_controller.Task_Controller(10000, begin_balancing, stop_balancing, state_block, motor_x_set, motor_y_set, select_trajectory, select_controller, controller_selected, pipelined=TIMER_CONTROL)
+    datacollection = task_datacollection.Task_DataCollection(50000, start_data_collection, state_block)
+    
+    #register the tasks at the scheduler, tasks which are due at the same time run in this order
+    if (ASYNC_RUNTIME):
+        task_list = async_runtime.AsyncRuntime(stats=task_stats)
+    else:
+        task_list = scheduler.Scheduler(idle=pyb.wfi, stats=task_stats)
+    task_list.add_task(user.run, user.period, 'user')
+    task_list.add_task(touchpanel.run, touchpanel.period, 'touchpanel')
+    task_list.add_task(imu.run, imu.period, 'imu')
+    task_list.add_task(controller.run, controller.period, 'controller')
+    task_list.add_task(motor.run, motor.period, 'motor')
+    task_list.add_task(datacollection.run, datacollection.period, 'datacollection')
+    if (TIMER_CONTROL):
+        #the update() of touchpanel and motor run every touchpanel period from timer 6, the one of the controller every controller period
+        control_path = controlpath.ControlPath(pyb.Timer(6, freq=1000000//touchpanel.period), (touchpanel.update, controller.update, motor.update), touchpanel.period, task_stats, 6, (1, controller.period//touchpanel.period, 1))
+        control_path.start()
+    
+    #try to run the different tasks
+    try:
+        task_list.run()
+        
+    #checks if there is a KeyboardInterrupt
+    except KeyboardInterrupt:
+        if (TIMER_CONTROL):
+            control_path.stop()
+    #Prints the errror message
+    print('Program terminating')
\ No newline at end of file
@@ -0,0 +1,258 @@
+''' @file                   Term_motor_bench.py
+    @brief                  Host benchmark of the motor task
+    @details                Runs on the PC, not on the board. Term_task_motor.py and Term_motordriver.py are imported with a fake
+                            pyb module whose timer channels count the pulse width writes. The controller writes a new torque
+                            every 10 ms, the motor task runs every 5 ms. The torques are a slow sine with noise while
+                            balancing and a nearly constant torque while the ball rests. The old motor task, which converted
+                            and wrote both channels with pulse_width_percent() in every run, is reproduced here as reference.
+                            Printed are the timer writes and the time per run of the motor task on the PC and the largest
+                            difference between the commanded and the applied torque, which the deadband causes.
+
+                            Example: python Term_motor_bench.py --seconds 10 --deadband 4
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 21, 2021
+'''
+
+import argparse
+import math
+import random
+import sys
+import time
+import types
+
+
+class FakeChannel:
+    ''' @brief Timer channel which counts the writes
+    '''
+
+    def __init__(self, timer):
+        ''' @param timer FakeTimer of the channel
+        '''
+        self.timer = timer
+        self.width = 0
+
+    def pulse_width(self, width):
+        self.timer.writes += 1
+        self.width = width
+
+    def pulse_width_percent(self, percent):
+        self.timer.writes += 1
+        self.width = int(percent*(self.timer.ticks)/100)
+
+
+class FakeTimer:
+    ''' @brief Timer with the period of timer 3 at 20 kHz and a clock of 84 MHz
+    '''
+    PWM = 0
+
+    def __init__(self, *args, **kwargs):
+        self.ticks = 4200
+        self.writes = 0
+        self.channels = []
+
+    def period(self):
+        return self.ticks - 1
+
+    def channel(self, number, mode, pin=None):
+        channel = FakeChannel(self)
+        self.channels.append(channel)
+        return channel
+
+
+class FakePin:
+    ''' @brief Pin whose level is kept in a dictionary shared by all pins of the same name
+    '''
+    OUT_PP = 1
+    IN = 0
+    PULL_UP = 1
+    cpu = types.SimpleNamespace(A15='A15', B0='B0', B1='B1', B2='B2', B4='B4', B5='B5')
+    #levels of all pins by name
+    levels = {}
+
+    def __init__(self, name, mode=None, pull=None, value=None):
+        self.name = name
+        if value is not None:
+            FakePin.levels[name] = value
+        else:
+            FakePin.levels.setdefault(name, 1)
+
+    def value(self, level=None):
+        if level is None:
+            return FakePin.levels[self.name]
+        FakePin.levels[self.name] = level
+
+    def high(self):
+        FakePin.levels[self.name] = 1
+
+    def low(self):
+        FakePin.levels[self.name] = 0
+
+
+class FakeExtInt:
+    ''' @brief External interrupt which calls its callback when drive() pulls the pin low
+    '''
+    IRQ_FALLING = 2
+    #interrupts by pin name
+    lines = {}
+
+    def __init__(self, name, mode, pull, callback):
+        self.name = name
+        self.callback = callback
+        self.enabled = True
+        FakeExtInt.lines[name] = self
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    @staticmethod
+    def drive(name, level):
+        ''' @brief Sets the level of a pin like the hardware and runs the interrupt of a falling edge
+        '''
+        falling = FakePin.levels.get(name, 1) == 1 and level == 0
+        FakePin.levels[name] = level
+        line = FakeExtInt.lines.get(name)
+        if falling and line and line.enabled:
+            line.callback(0)
+
+
+def load_task():
+    ''' @brief Imports the motor task with the fake pyb module
+        @return tuple (task_motor module, shares module)
+    '''
+    pyb = types.ModuleType('pyb')
+    pyb.Timer = FakeTimer
+    pyb.Pin = FakePin
+    pyb.ExtInt = FakeExtInt
+    pyb.udelay = lambda us: None
+    utime = types.ModuleType('utime')
+    utime.ticks_us = lambda: int(time.perf_counter()*1e6) % (1 << 30)
+    utime.ticks_diff = lambda a, b: ((a - b + (1 << 29)) % (1 << 30)) - (1 << 29)
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda value: value
+    sys.modules.update({'pyb': pyb, 'utime': utime, 'micropython': micropython})
+    for name in ('shares', 'tablefile', 'motordriver', 'task_motor'):
+        if name not in sys.modules:
+            sys.modules[name] = __import__('Term_' + name)
+    return (sys.modules['task_motor'], sys.modules['shares'])
+
+
+class LegacyTask:
+    ''' @brief The motor task before the write-on-change motors, as reference
+    '''
+
+    def __init__(self, motor_x_set, motor_y_set):
+        self.convert_factor = (100*2.21)/(4*13.8*12)
+        self.motor_x_set = motor_x_set
+        self.motor_y_set = motor_y_set
+        self.timer = FakeTimer()
+        self.channels = [self.timer.channel(n, FakeTimer.PWM) for n in range(4)]
+
+    def set_duty(self, tch1, tch2, duty):
+        if (duty > 0):
+            tch1.pulse_width_percent(100)
+            tch2.pulse_width_percent(100-duty)
+        elif (duty < 0):
+            tch1.pulse_width_percent(100+duty)
+            tch2.pulse_width_percent(100)
+        else:
+            tch1.pulse_width_percent(0)
+            tch2.pulse_width_percent(0)
+
+    def run(self):
+        duty_x = self.convert_factor * self.motor_x_set.read()
+        duty_y = self.convert_factor * self.motor_y_set.read()
+        self.set_duty(self.channels[2], self.channels[3], -duty_y)
+        self.set_duty(self.channels[0], self.channels[1], duty_x)
+
+
+def torques(seconds, seed=1):
+    ''' @brief Creates the torques of the controller, one pair every 10 ms
+        @param seconds length in s, the first half balancing, the second half resting
+        @param seed seed of the random numbers
+        @return list of (torque x, torque y) in mNm
+    '''
+    rng = random.Random(seed)
+    result = []
+    steps = int(seconds*100)
+    for k in range(steps):
+        t = k/100
+        if (k < steps//2):
+            result.append((80*math.sin(2*math.pi*0.5*t) + rng.gauss(0, 2), 60*math.cos(2*math.pi*0.4*t) + rng.gauss(0, 2)))
+        else:
+            result.append((12 + rng.gauss(0, 0.1), -7 + rng.gauss(0, 0.1)))
+    return result
+
+
+def applied_torque(task_motor, channels, ticks):
+    ''' @brief Converts the pulse widths of a motor back into a torque
+        @param task_motor module with TORQUE_TO_DUTY
+        @param channels the two channels of the motor
+        @param ticks timer ticks of one PWM period
+        @return torque in mNm
+    '''
+    return 100*(channels[0].width - channels[1].width)/ticks/task_motor.TORQUE_TO_DUTY
+
+
+def bench(task, timer, motor_x_set, motor_y_set, commands, check=None):
+    ''' @brief Runs a motor task with the commands of the controller
+        @param task motor task with run()
+        @param timer FakeTimer of the task
+        @param motor_x_set share of the x torque
+        @param motor_y_set share of the y torque
+        @param commands list of torque pairs, one every 10 ms
+        @param check optional function(command) which returns the torque error after a run
+        @return tuple (timer writes per run, us per run on the PC, largest torque error in mNm)
+    '''
+    timer.writes = 0
+    elapsed = 0
+    error = 0
+    for (torque_x, torque_y) in commands:
+        motor_x_set.write(torque_x)
+        motor_y_set.write(torque_y)
+        for i in range(2):
+            start = time.perf_counter()
+            task.run()
+            elapsed += time.perf_counter() - start
+        if check:
+            error = max(error, check(torque_x))
+    runs = 2*len(commands)
+    return (timer.writes/runs, 1e6*elapsed/runs, error)
+
+
+def main():
+    ''' @brief Command line interface of the benchmark
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark the motor task with a fake pyb.Timer')
+    parser.add_argument('--seconds', type=float, default=10.0, help='simulated time in s')
+    parser.add_argument('--deadband', type=int, default=None, help='deadband in ticks, default of Term_task_motor.py')
+    args = parser.parse_args()
+
+    (task_motor, shares) = load_task()
+    #the torque error is checked against the linear conversion, a friction compensation file is not loaded
+    task_motor.COMPENSATION_FILE = ''
+    if args.deadband is not None:
+        task_motor.DEADBAND = args.deadband
+    commands = torques(args.seconds)
+    half = len(commands)//2
+    print('{:<24}{:<12}{:>14}{:>12}{:>20}'.format('task', 'phase', 'writes/run', 'us/run PC', 'max torque error'))
+    for (phase, part) in (('balancing', commands[:half]), ('resting', commands[half:])):
+        (motor_x_set, motor_y_set) = (shares.StampedShare(0), shares.StampedShare(0))
+        legacy = LegacyTask(motor_x_set, motor_y_set)
+        (writes, us, error) = bench(legacy, legacy.timer, motor_x_set, motor_y_set, part)
+        print('{:<24}{:<12}{:>14.2f}{:>12.2f}{:>21}'.format('pulse_width_percent', phase, writes, us, '-'))
+
+        (motor_x_set, motor_y_set) = (shares.StampedShare(0), shares.StampedShare(0))
+        task = task_motor.Task_Motor(5000, motor_x_set, motor_y_set)
+        task.run()
+        timer = task.timer
+        channels = timer.channels[0:2]
+        check = lambda command: abs(applied_torque(task_motor, channels, timer.ticks) - command)
+        (writes, us, error) = bench(task, timer, motor_x_set, motor_y_set, part, check)
+        print('{:<24}{:<12}{:>14.2f}{:>12.2f}{:>17.2f} mNm'.format('write-on-change', phase, writes, us, error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+''' @file                   Term_motor_fit.py
+    @brief                  Host tool which fits the friction compensation tables of the motors
+    @details                Runs on the PC with NumPy, not on the board. The input of every motor is a table file with the
+                            columns duty cycle in percent and angular velocity of the platform in degree/s, logged while the
+                            duty cycle slowly ramps through both directions without the ball. Both columns have the sign of
+                            the controller torque. The median velocity of every duty cycle bin is the static curve of the
+                            motor: it stands still up to the breakaway duty cycle and then speeds up, at first slower than
+                            linear because of the static friction. Far from the breakaway the slope is the one of the linear
+                            conversion TORQUE_TO_DUTY, so the velocity divided by this slope is the torque the motor delivers
+                            beyond its friction. The inverse of this curve is sampled on a uniform torque grid, its first
+                            value is the breakaway duty cycle (the deadband inverse). Torques beyond the logged range use the
+                            linear conversion, all duty cycles are limited to 100 %.
+                            The file has one row with the torque step and the smallest applied torque and one row per motor
+                            and direction, it is loaded by Task_Motor from flash. With --synthetic the logs are simulated from
+                            a known friction model and the torque error of the linear conversion and of the tables is printed,
+                            the tables are also run through Motor.compensate() of the board.
+
+                            Example: python Term_motor_fit.py --motor1 ramp_x.bin --motor2 ramp_y.bin
+                                     python Term_motor_fit.py --synthetic
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 22, 2021
+'''
+
+import argparse
+import sys
+import numpy as np
+try:
+    import tablefile
+except ImportError:
+    import Term_tablefile as tablefile
+
+
+## @brief duty cycle in percent per torque in mNm of the linear conversion, the same as in Task_Motor
+#
+TORQUE_TO_DUTY = (100*2.21)/(4*13.8*12)
+
+## @brief largest torque of the motors in mNm, the same limit as in Task_Controller
+#
+TORQUE_LIMIT = 300.0
+
+## @brief breakaway duty cycles in percent (positive, negative) of the synthetic motors
+#
+SYNTHETIC_BREAKAWAY = ((6.5, 8.0), (7.5, 5.5))
+
+
+def static_curve(duty, velocity, width=1.0):
+    ''' @brief Bins a log of one direction into the static curve
+        @param duty array of duty cycle magnitudes in percent
+        @param velocity array of velocity magnitudes in the same direction in degree/s
+        @param width width of a bin in percent
+        @return tuple (array of bin centers, array of median velocities), only bins with samples
+    '''
+    edges = np.arange(0, 100 + width, width)
+    centers = []
+    speeds = []
+    for (low, high) in zip(edges[:-1], edges[1:]):
+        inside = (duty >= low) & (duty < high)
+        if np.any(inside):
+            centers.append((low + high)/2)
+            speeds.append(np.median(velocity[inside]))
+    return (np.array(centers), np.array(speeds))
+
+
+def fit_direction(duty, velocity, moving=2.0):
+    ''' @brief Fits the delivered torque of one direction over the duty cycle
+        @param duty array of duty cycle magnitudes in percent
+        @param velocity array of velocity magnitudes in the same direction in degree/s
+        @param moving smallest velocity in degree/s at which the motor counts as moving
+        @return tuple (breakaway duty cycle, array of duty cycles, array of delivered torques in mNm) starting at the breakaway
+    '''
+    (centers, speeds) = static_curve(duty, velocity)
+    index = np.flatnonzero(speeds > moving)
+    if len(index) < 4:
+        raise ValueError('the motor does not move in the log')
+    first = index[0]
+    #interpolates the duty cycle at which the velocity crosses the moving threshold
+    if first > 0:
+        breakaway = np.interp(moving, speeds[first - 1:first + 1], centers[first - 1:first + 1])
+    else:
+        breakaway = centers[0]
+    #slope of the upper half of the moving range, where the static friction no longer matters
+    upper = index[len(index)//2:]
+    gain = np.polyfit(centers[upper], speeds[upper], 1)[0]
+    torque = np.maximum.accumulate(np.maximum(speeds[first:], 0)/gain/TORQUE_TO_DUTY)
+    return (breakaway, np.concatenate(([breakaway], centers[first:])), np.concatenate(([0.0], torque)))
+
+
+def table_row(breakaway, duties, torques, step, size):
+    ''' @brief Samples the inverse of the delivered torque on the torque grid
+        @param breakaway breakaway duty cycle in percent
+        @param duties array of duty cycles from fit_direction()
+        @param torques array of delivered torques from fit_direction()
+        @param step torque step of the grid in mNm
+        @param size number of grid points
+        @return array of duty cycles in percent for the torques 0, step, 2*step, ...
+    '''
+    grid = np.arange(size)*step
+    #np.interp needs increasing torques, flat parts of the curve keep their first duty cycle
+    (torques, unique) = np.unique(torques, return_index=True)
+    duties = duties[unique]
+    row = np.interp(grid, torques, duties)
+    beyond = grid > torques[-1]
+    row[beyond] = duties[-1] + (grid[beyond] - torques[-1])*TORQUE_TO_DUTY
+    row[0] = breakaway
+    return np.minimum(row, 100.0)
+
+
+def fit_motor(log, step, size):
+    ''' @brief Fits the tables of both directions of one motor
+        @param log array with the columns duty cycle and velocity
+        @param step torque step of the grid in mNm
+        @param size number of grid points
+        @return tuple (row of the positive direction, row of the negative direction, breakaways)
+    '''
+    rows = []
+    breakaways = []
+    for sign in (1, -1):
+        part = log[sign*log[:, 0] > 0]
+        (breakaway, duties, torques) = fit_direction(sign*part[:, 0], sign*part[:, 1])
+        rows.append(table_row(breakaway, duties, torques, step, size))
+        breakaways.append(breakaway)
+    return (rows[0], rows[1], breakaways)
+
+
+def synthetic_velocity(duty, breakaway, gain=12.0, stribeck=3.0):
+    ''' @brief Static curve of the synthetic motor
+        @param duty array of duty cycle magnitudes in percent
+        @param breakaway breakaway duty cycle in percent
+        @param gain velocity per duty cycle in degree/s/% far from the breakaway
+        @param stribeck duty cycle range in percent in which the friction falls from static to sliding
+        @return array of velocities in degree/s
+    '''
+    over = np.maximum(duty - breakaway, 0)
+    return gain*(over - stribeck*(1 - np.exp(-over/stribeck)))
+
+
+def synthetic_log(breakaways, seed=1):
+    ''' @brief Simulates the ramp log of one motor
+        @param breakaways breakaway duty cycles (positive, negative) in percent
+        @param seed seed of the random numbers
+        @return array with the columns duty cycle and velocity
+    '''
+    rng = np.random.default_rng(seed)
+    duty = np.concatenate((np.linspace(0, 60, 3000), np.linspace(60, -60, 6000), np.linspace(-60, 0, 3000)))
+    velocity = np.where(duty > 0, synthetic_velocity(duty, breakaways[0]), -synthetic_velocity(-duty, breakaways[1]))
+    return np.column_stack((duty, velocity + rng.normal(0, 0.5, len(duty))))
+
+
+def check_board(table, cols):
+    ''' @brief Runs the tables through Motor.compensate() of the board and compares it with NumPy
+        @param table values of the table file
+        @param cols number of columns
+        @return largest difference in timer ticks
+    '''
+    try:
+        import motor_bench
+    except ImportError:
+        import Term_motor_bench as motor_bench
+    motor_bench.load_task()
+    motordriver = sys.modules['motordriver']
+    timer = motor_bench.FakeTimer()
+    motor = motordriver.Motor('B4', 'B5', 1, 2, timer, TORQUE_TO_DUTY)
+    motor.set_compensation(table[0], table[1], table[cols:2*cols], table[2*cols:3*cols])
+    grid = np.arange(cols)*table[0]
+    largest = 0
+    for torque in np.linspace(-1.2*TORQUE_LIMIT, 1.2*TORQUE_LIMIT, 2001):
+        row = table[cols:2*cols] if torque > 0 else table[2*cols:3*cols]
+        expected = 0 if abs(torque) < table[1] else np.sign(torque)*np.interp(abs(torque), grid, row)*timer.ticks/100
+        largest = max(largest, abs(motor.compensate(torque) - expected))
+    return largest
+
+
+def main():
+    ''' @brief Command line interface of the fitting tool
+    '''
+    parser = argparse.ArgumentParser(description='Fit the friction compensation tables of the motors')
+    parser.add_argument('--motor1', default='ramp_x.bin', help='ramp log of motor 1 (x-axis)')
+    parser.add_argument('--motor2', default='ramp_y.bin', help='ramp log of motor 2 (y-axis)')
+    parser.add_argument('--synthetic', action='store_true', help='simulate the ramp logs instead of reading them')
+    parser.add_argument('--size', type=int, default=31, help='number of torque grid points')
+    parser.add_argument('--threshold', type=float, default=0.5, help='smallest applied torque in mNm')
+    parser.add_argument('-o', '--output', default='motor_lut.bin', help='table file for the board')
+    args = parser.parse_args()
+
+    step = TORQUE_LIMIT/(args.size - 1)
+    logs = []
+    for (i, filename) in enumerate((args.motor1, args.motor2)):
+        if args.synthetic:
+            logs.append(synthetic_log(SYNTHETIC_BREAKAWAY[i], seed=i + 1))
+        else:
+            (rows, cols, values) = tablefile.load(filename)
+            logs.append(np.array(values).reshape(rows, cols)[:, 0:2])
+
+    table = [step, args.threshold] + [0.0] * (args.size - 2)
+    for (i, log) in enumerate(logs):
+        (positive, negative, breakaways) = fit_motor(log, step, args.size)
+        table += list(positive) + list(negative)
+        print('motor {}: breakaway {:.2f} % / {:.2f} %, duty at {:.0f} mNm {:.1f} % / {:.1f} %'.format(
+            i + 1, breakaways[0], breakaways[1], TORQUE_LIMIT/2, positive[args.size//2], negative[args.size//2]))
+        if args.synthetic:
+            torques = np.linspace(0, 200, 401)
+            grid = np.arange(args.size)*step
+            for (row, breakaway, name) in ((positive, SYNTHETIC_BREAKAWAY[i][0], 'positive'),
+                                           (negative, SYNTHETIC_BREAKAWAY[i][1], 'negative')):
+                delivered = lambda duty: synthetic_velocity(duty, breakaway)/12.0/TORQUE_TO_DUTY
+                linear = np.abs(delivered(TORQUE_TO_DUTY*torques) - torques)
+                compensated = np.abs(delivered(np.interp(torques, grid, row)) - torques)
+                print('  {:<9} torque error 0..200 mNm: linear max {:6.2f} mNm, table max {:5.2f} mNm'.format(
+                    name, np.max(linear), np.max(compensated)))
+    tablefile.save(args.output, 5, args.size, table)
+    print('saved {} ({} x {}, step {:.1f} mNm)'.format(args.output, 5, args.size, step))
+    if args.synthetic:
+        print('largest difference of Motor.compensate() to NumPy: {:.2f} ticks'.format(check_board(table, args.size)))
+
+
+if __name__ == '__main__':
+    main()
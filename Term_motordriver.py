@@ -1,91 +1,302 @@
-''' @file                   Term_motordriver.py
-    @brief                  contains 2 classes to create a motor object and driver
-    @details                contains a class called DRV8847 to create a motor driver and configure the DRV8847 which can be used to perform motor control. Also contains a class called motor which can be used to apply PWM to a motor
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   October 25, 2021
-'''
-import pyb
-
-class DRV8847:
-    ''' @brief A motor driver class for the DRV8847 from TI.
-        @details Objects of this class can be used to configure the DRV8847
-        motor driver and to create one or moreobjects of the
-        Motor class which can be used to perform motor
-        control.
-    
-        Refer to the DRV8847 datasheet here:
-        https://www.ti.com/lit/ds/symlink/drv8847.pdf
-    '''
-    
-    def __init__ (self):
-        ''' @brief Initializes and returns a DRV8847 object.
-        '''
-    
-    def disable (self):
-        ''' @brief Puts the DRV8847 in sleep mode.
-        '''
-        #disables the motor
-        self.set_duty(0)
-   
-    def motor (self, pinIn1, pinIn2, chNum1, chNum2, Timer):
-        ''' @brief Initializes and returns a motor object associated with the DRV8847.
-            @param pinIn1 value of Pin1 of motor
-            @param pinIn2 value of Pin2 of motor
-            @param chNum1 value of Timer Channel 1
-            @param chNum2 value of Timer Channel 2
-            @param Timer for the motor
-            @return An object of class Motor
-            '''
-        #creates motor object
-        return Motor(pinIn1, pinIn2, chNum1, chNum2, Timer)
-
-class Motor:
-    ''' @brief A motor class for one channel of the DRV8847.
-        @details Objects of this class can be used to apply PWM to a given
-        DC motor.
-    '''
-    
-    def __init__ (self, pinIn1, pinIn2, chNum1, chNum2, Timer):
-        ''' @brief Initializes and returns a motor object associated with the DRV8847.
-            @details Objects of this class should not be instantiated
-            directly. Instead create a DRV8847 object and use
-            that to create Motor objects using the method
-            DRV8847.motor().
-            @param pinIn1 value of Pin1 of motor
-            @param pinIn2 value of Pin2 of motor
-            @param chNum1 value of Timer Channel 1
-            @param chNum2 value of Timer Channel 2
-            @param Timer for the motor
-            '''
-        ##@brief initialize the timer
-        #
-        self.timer = Timer
-        ##@brief initialize timer channel 1
-        #
-        self.tch1 = self.timer.channel(chNum1, pyb.Timer.PWM, pin=pinIn1)
-        ##@brief initialize timer channel 2
-        #
-        self.tch2 = self.timer.channel(chNum2, pyb.Timer.PWM, pin=pinIn2)
-        
-    
-    def set_duty (self, duty):
-    
-        ''' @brief Set the PWM duty cycle for the motor channel.
-            @details This method sets the duty cycle to be sent
-            to the motor to the given level. Positive values
-            cause effort in one direction, negative values
-            in the opposite direction.
-            @param duty A signed number holding the duty
-            cycle of the PWM signal sent to the motor
-        '''
-        #checks if the duty cycle is negativ or positive
-        if (duty > 0): #forward
-            self.tch1.pulse_width_percent(100)
-            self.tch2.pulse_width_percent(100-duty)       
-        elif (duty < 0): #backward
-            self.tch1.pulse_width_percent(100+duty)
-            self.tch2.pulse_width_percent(100)           
-        else: #zero
-            self.tch1.pulse_width_percent(0)
-            self.tch2.pulse_width_percent(0)
-        
+''' @file                   Term_motordriver.py
+    @brief                  contains 2 classes to create a motor object and driver
+    @details                contains a class called DRV8847 to create a motor driver and configure the DRV8847 which can be used to perform motor control. Also contains a class called motor which can be used to apply PWM to a motor
+                            The static friction and the deadband of a motor can be compensated with a piecewise-linear
+                            table from torque to duty cycle, which is fitted on the PC by Term_motor_fit.py.
+                            A falling edge of the nFAULT pin of the DRV8847 triggers an interrupt which stops all motors at once
+                            and latches the fault, until clear_fault() wakes the driver again.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   October 25, 2021
+'''
+import pyb
+from array import array
+
+class DRV8847:
+    ''' @brief A motor driver class for the DRV8847 from TI.
+        @details Objects of this class can be used to configure the DRV8847
+        motor driver and to create one or moreobjects of the
+        Motor class which can be used to perform motor
+        control.
+    
+        Refer to the DRV8847 datasheet here:
+        https://www.ti.com/lit/ds/symlink/drv8847.pdf
+        
+        The interrupt service routine fault_cb() only writes
+        preallocated attributes and integer pulse widths, so it
+        does not allocate memory.
+    '''
+    
+    def __init__ (self, sleep_pin=None, fault_pin=None):
+        ''' @brief Initializes and returns a DRV8847 object.
+            @param sleep_pin optional pin connected to nSLEEP, the driver
+            starts in sleep mode until enable() is called
+            @param fault_pin optional pin connected to nFAULT (open drain,
+            low on a fault)
+        '''
+        #motors created by this driver, stopped by a fault
+        self.motors = []
+        #latched fault and number of faults since the start
+        self.faulted = False
+        self.fault_count = 0
+        self.nSLEEP = None
+        self.nFAULT = None
+        self.fault_irq = None
+        if (sleep_pin is not None):
+            self.nSLEEP = pyb.Pin(sleep_pin, mode=pyb.Pin.OUT_PP, value=0)
+        if (fault_pin is not None):
+            self.nFAULT = pyb.Pin(fault_pin, mode=pyb.Pin.IN, pull=pyb.Pin.PULL_UP)
+            #the bound method is created once here, not in the interrupt
+            self.fault_irq = pyb.ExtInt(fault_pin, pyb.ExtInt.IRQ_FALLING, pyb.Pin.PULL_UP, self.fault_cb)
+    
+    def enable (self):
+        ''' @brief Wakes the DRV8847 from sleep mode.
+            @details nFAULT can be low for a short time while the driver
+            wakes up, so the fault interrupt is disabled meanwhile.
+        '''
+        if (self.fault_irq):
+            self.fault_irq.disable()
+        if (self.nSLEEP):
+            self.nSLEEP.high()
+        pyb.udelay(25)
+        if (self.fault_irq):
+            self.fault_irq.enable()
+    
+    def disable (self):
+        ''' @brief Stops all motors and puts the DRV8847 in sleep mode.
+        '''
+        #stops the motors
+        for i in range(len(self.motors)):
+            self.motors[i].stop()
+        if (self.nSLEEP):
+            self.nSLEEP.low()
+    
+    def fault_cb (self, line):
+        ''' @brief Interrupt service routine of a falling edge of nFAULT
+            @details Stops all motors and latches the fault, set_duty() is
+            ignored until clear_fault().
+            @param line interrupt line of the pin
+        '''
+        motors = self.motors
+        for i in range(len(motors)):
+            motors[i].halt()
+        self.faulted = True
+        self.fault_count += 1
+    
+    def clear_fault (self):
+        ''' @brief Clears a latched fault by putting the driver to sleep and waking it up
+            @return True if nFAULT is high again and the motors accept commands
+        '''
+        self.disable()
+        self.enable()
+        if (self.nFAULT) and (self.nFAULT.value() == 0):
+            return False
+        self.faulted = False
+        for i in range(len(self.motors)):
+            self.motors[i].release()
+        return True
+   
+    def motor (self, pinIn1, pinIn2, chNum1, chNum2, Timer, scale=1, deadband=0):
+        ''' @brief Initializes and returns a motor object associated with the DRV8847.
+            @param pinIn1 value of Pin1 of motor
+            @param pinIn2 value of Pin2 of motor
+            @param chNum1 value of Timer Channel 1
+            @param chNum2 value of Timer Channel 2
+            @param Timer for the motor
+            @param scale duty cycle in percent per unit of set_duty(), negative to reverse the motor
+            @param deadband largest change in timer ticks which is not written to the timer
+            @return An object of class Motor
+            '''
+        #creates motor object
+        motor = Motor(pinIn1, pinIn2, chNum1, chNum2, Timer, scale, deadband)
+        self.motors.append(motor)
+        return motor
+
+class Motor:
+    ''' @brief A motor class for one channel of the DRV8847.
+        @details Objects of this class can be used to apply PWM to a given
+        DC motor. The command is converted with one precomputed scale into
+        integer timer ticks and only written to the timer if it changed by
+        more than the deadband. A channel is only written if its pulse width
+        changes, so a new command in the same direction is one timer write.
+        With set_compensation() the command is a torque which is mapped to
+        the duty cycle by a table on a uniform torque grid, one for each
+        direction. The first value of a table is the duty cycle at which
+        the motor starts to move, so it inverts the deadband, torques above
+        the grid get the last value.
+    '''
+    
+    def __init__ (self, pinIn1, pinIn2, chNum1, chNum2, Timer, scale=1, deadband=0):
+        ''' @brief Initializes and returns a motor object associated with the DRV8847.
+            @details Objects of this class should not be instantiated
+            directly. Instead create a DRV8847 object and use
+            that to create Motor objects using the method
+            DRV8847.motor().
+            @param pinIn1 value of Pin1 of motor
+            @param pinIn2 value of Pin2 of motor
+            @param chNum1 value of Timer Channel 1
+            @param chNum2 value of Timer Channel 2
+            @param Timer for the motor
+            @param scale duty cycle in percent per unit of set_duty(), negative to reverse the motor
+            @param deadband largest change in timer ticks which is not written to the timer
+            '''
+        ##@brief initialize the timer
+        #
+        self.timer = Timer
+        ##@brief initialize timer channel 1
+        #
+        self.tch1 = self.timer.channel(chNum1, pyb.Timer.PWM, pin=pinIn1)
+        ##@brief initialize timer channel 2
+        #
+        self.tch2 = self.timer.channel(chNum2, pyb.Timer.PWM, pin=pinIn2)
+        ##@brief timer ticks of one PWM period, a pulse width of full_ticks is 100 %
+        #
+        self.full_ticks = Timer.period() + 1
+        ##@brief timer ticks per unit of set_duty()
+        #
+        self.tick_scale = scale*self.full_ticks/100
+        ##@brief largest change in timer ticks which is not written
+        #
+        self.deadband = deadband
+        #compensation tables of both directions, their size, the inverse of the torque step and the smallest torque
+        self.table = None
+        self.table_size = 0
+        self.step_inverse = 0
+        self.threshold = 0
+        self.table_scale = self.full_ticks/100 if scale >= 0 else -self.full_ticks/100
+        #applied command in ticks and pulse widths of both channels
+        self.ticks = 0
+        self.width1 = 0
+        self.width2 = 0
+        #True while a fault of the driver stops the motor
+        self.halted = False
+        self.tch1.pulse_width(0)
+        self.tch2.pulse_width(0)
+        
+    
+    def set_duty (self, duty):
+    
+        ''' @brief Set the PWM duty cycle for the motor channel.
+            @details This method sets the duty cycle to be sent
+            to the motor to the given level. Positive values
+            cause effort in one direction, negative values
+            in the opposite direction. Changes within the
+            deadband are skipped, except the change to 0.
+            While the motor is halted by a fault, nothing is written.
+            @param duty A signed number holding the duty
+            cycle of the PWM signal sent to the motor, in percent
+            times the scale of the constructor
+        '''
+        if (self.halted):
+            return
+        
+        #converts the duty cycle into ticks and limits it to 100 %
+        full = self.full_ticks
+        if (self.table_size):
+            ticks = self.compensate(duty)
+        else:
+            ticks = int(duty*self.tick_scale)
+        if (ticks > full):
+            ticks = full
+        elif (ticks < -full):
+            ticks = -full
+        
+        #skips commands which are close to the applied one
+        change = ticks - self.ticks
+        if (-self.deadband <= change <= self.deadband) and ((ticks != 0) or (change == 0)):
+            return
+        self.ticks = ticks
+        
+        #checks if the duty cycle is negativ or positive
+        if (ticks > 0): #forward
+            width1 = full
+            width2 = full - ticks
+        elif (ticks < 0): #backward
+            width1 = full + ticks
+            width2 = full
+        else: #zero
+            width1 = 0
+            width2 = 0
+        
+        #writes only the channels which change
+        if (width1 != self.width1):
+            self.tch1.pulse_width(width1)
+            self.width1 = width1
+        if (width2 != self.width2):
+            self.tch2.pulse_width(width2)
+            self.width2 = width2
+        
+        #a fault interrupt during this call wins
+        if (self.halted):
+            self.stop()
+    
+    def stop(self):
+        ''' @brief Sets both channels to 0 at once
+            @details Writes the timer without checking the applied command
+            and without allocating, so it can run in an interrupt.
+        '''
+        self.tch1.pulse_width(0)
+        self.tch2.pulse_width(0)
+        self.ticks = 0
+        self.width1 = 0
+        self.width2 = 0
+    
+    def halt(self):
+        ''' @brief Stops the motor and ignores set_duty() until release()
+        '''
+        self.halted = True
+        self.stop()
+    
+    def release(self):
+        ''' @brief Accepts set_duty() again after halt()
+        '''
+        self.halted = False
+    
+    def set_compensation(self, step, threshold, positive, negative):
+        ''' @brief Sets the tables which map a torque to the duty cycle
+            @details The tables are copied into one preallocated array. After
+            this call set_duty() takes a torque, only the sign of the scale
+            of the constructor is used.
+            @param step torque between two values of a table
+            @param threshold smallest torque magnitude which is applied,
+            smaller torques stop the motor instead of dithering around 0
+            @param positive duty cycles in percent for the torques 0, step,
+            2*step, ... in the positive direction
+            @param negative duty cycles in percent for the same torque
+            magnitudes in the negative direction
+        '''
+        size = len(positive)
+        if (self.table_size != size):
+            self.table = array('f', [0] * (2*size))
+        for i in range(size):
+            self.table[i] = positive[i]
+            self.table[size + i] = negative[i]
+        self.table_size = size
+        self.step_inverse = 1/step
+        self.threshold = threshold
+        #forces the next command to be written
+        self.ticks = 2*self.full_ticks + self.deadband + 1
+    
+    def compensate(self, torque):
+        ''' @brief Maps a torque to timer ticks with the compensation tables
+            @details The table index is calculated from the torque, so the
+            time does not depend on the size of the table.
+            @param torque requested torque
+            @return signed pulse width in ticks
+        '''
+        magnitude = torque if torque >= 0 else -torque
+        #a torque of 0 stops the motor even without a threshold, it has no direction to select a table
+        if (magnitude < self.threshold) or (torque == 0):
+            return 0
+        table = self.table
+        last = self.table_size - 1
+        offset = 0 if torque > 0 else self.table_size
+        position = magnitude*self.step_inverse
+        i = int(position)
+        if (i >= last):
+            #saturation at the end of the table
+            duty = table[offset + last]
+        else:
+            low = table[offset + i]
+            duty = low + (position - i)*(table[offset + i + 1] - low)
+        ticks = int(duty*self.table_scale)
+        return ticks if torque > 0 else -ticks
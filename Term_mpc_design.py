@@ -0,0 +1,284 @@
+''' @file                   Term_mpc_design.py
+    @brief                  Host tool which designs the explicit model predictive controller
+    @details                Runs on the PC with NumPy, not on the board. The model of one axis in board units is predicted over
+                            a short horizon of torque moves with the LQR solution as terminal cost. The torque limit and the
+                            plate edge are inequality constraints of the condensed quadratic program. For every combination
+                            of active constraints the optimal first torque is an affine function of the state inside a
+                            polyhedral region. The regions are sampled with random states and ordered by their frequency, so
+                            the search of ExplicitMPC stops early for the common states. Regions which are never hit are kept
+                            at the end, a state outside of the sampled box still gets its optimal torque. The table is written for
+                            closedloop.ExplicitMPC, which Task_Controller loads at startup. The state is the error to the
+                            reference, so the edge is only the absolute limit of the ball position with the center as
+                            reference. For a trajectory choose --edge smaller than the edge of the plate by the largest
+                            distance of the trajectory from the center.
+
+                            With --check the table is loaded into closedloop.ExplicitMPC on the PC, the torques are compared
+                            with a brute force solution of the quadratic program and the time per run is measured. The time on
+                            the board is shown by the task statistics of Task_User ('p'). The tool exits with status 1 if the
+                            largest torque error is above --tolerance.
+
+                            Example: python Term_mpc_design.py --horizon 2 --edge 45 --torque-limit 300 --check
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 15, 2021
+'''
+
+import argparse
+import itertools
+import sys
+import time
+import numpy as np
+try:
+    import tablefile
+except ImportError:
+    import Term_tablefile as tablefile
+try:
+    import lqr_design
+except ImportError:
+    import Term_lqr_design as lqr_design
+
+
+## @brief half width of the box of the sampled states: x, theta, x_dot, theta_dot in mm, degree, mm/s, degree/s
+#  @details The position is replaced by the plate edge.
+#
+SAMPLE_BOX = (45.0, 10.0, 200.0, 100.0)
+
+
+def board_weights(q, r, torque_scale=lqr_design.TORQUE_SCALE):
+    ''' @brief Converts the LQR weights of the model units into the board units
+        @param q diagonal of Q for the model state
+        @param r weight of the model torque
+        @return tuple (Q, R) for the board state and the torque in mNm
+    '''
+    S_inv = np.diag(1.0/np.asarray(lqr_design.STATE_SCALE))
+    return (S_inv @ np.diag(q) @ S_inv, np.array([[r/torque_scale**2]]))
+
+
+def condense(A, B, Q, R, P, N):
+    ''' @brief Builds the condensed quadratic program of the horizon
+        @details The states x(1)..x(N) are Phi*x + Gamma*U with the torque moves U. The cost without its constant part is
+                 1/2 U'HU + x'F'U.
+        @param A discrete system matrix
+        @param B discrete input matrix
+        @param Q state weight
+        @param R torque weight
+        @param P terminal weight
+        @param N number of torque moves
+        @return tuple (H, F, Phi, Gamma)
+    '''
+    n = A.shape[0]
+    Phi = np.zeros((N*n, n))
+    Gamma = np.zeros((N*n, N))
+    for k in range(N):
+        Phi[k*n:(k + 1)*n] = np.linalg.matrix_power(A, k + 1)
+        for j in range(k + 1):
+            Gamma[k*n:(k + 1)*n, j] = (np.linalg.matrix_power(A, k - j) @ B)[:, 0]
+    Q_bar = np.kron(np.eye(N), Q)
+    Q_bar[(N - 1)*n:, (N - 1)*n:] = P
+    H = 2*(Gamma.T @ Q_bar @ Gamma + R[0, 0]*np.eye(N))
+    F = 2*Gamma.T @ Q_bar @ Phi
+    return (H, F, Phi, Gamma)
+
+
+def constraints(Phi, Gamma, N, torque_limit, edge):
+    ''' @brief Builds the constraints G U <= w + S x of the torque limit and the plate edge
+        @param Phi prediction matrix of the state
+        @param Gamma prediction matrix of the torque moves
+        @param N number of torque moves
+        @param torque_limit largest torque in mNm
+        @param edge largest distance of the ball from the center in mm
+        @return tuple (G, w, S)
+    '''
+    n = Phi.shape[1]
+    position = [k*n for k in range(N)]
+    G = np.vstack((np.eye(N), -np.eye(N), Gamma[position], -Gamma[position]))
+    w = np.concatenate((np.full(2*N, torque_limit), np.full(2*N, edge)))
+    S = np.vstack((np.zeros((2*N, n)), -Phi[position], Phi[position]))
+    return (G, w, S)
+
+
+def active_set_law(H_inv, F, G, w, S, active):
+    ''' @brief Calculates the solution of the quadratic program for a set of active constraints
+        @param H_inv inverse of the Hessian
+        @param F linear cost term
+        @param G, w, S constraints G U <= w + S x
+        @param active indices of the active constraints
+        @return tuple (U_x, U_0, L_x, L_0) with the moves U = U_x x + U_0 and the multipliers L = L_x x + L_0,
+                or None if the active constraints are linearly dependent
+    '''
+    if len(active) == 0:
+        return (-H_inv @ F, np.zeros(H_inv.shape[0]), np.zeros((0, F.shape[1])), np.zeros(0))
+    G_a = G[list(active)]
+    M = G_a @ H_inv @ G_a.T
+    if np.linalg.matrix_rank(M) < len(active):
+        return None
+    M_inv = np.linalg.inv(M)
+    L_x = -M_inv @ (S[list(active)] + G_a @ H_inv @ F)
+    L_0 = -M_inv @ w[list(active)]
+    U_x = -H_inv @ (F + G_a.T @ L_x)
+    U_0 = -H_inv @ G_a.T @ L_0
+    return (U_x, U_0, L_x, L_0)
+
+
+def enumerate_regions(H, F, G, w, S):
+    ''' @brief Calculates the critical regions of all combinations of active constraints
+        @return list of tuples (law, rows) with the first move law = (4 gains, offset) and rows a x <= b as (a, b) rows
+    '''
+    N = H.shape[0]
+    H_inv = np.linalg.inv(H)
+    regions = []
+    for size in range(N + 1):
+        for active in itertools.combinations(range(len(w)), size):
+            solution = active_set_law(H_inv, F, G, w, S, active)
+            if solution is None:
+                continue
+            (U_x, U_0, L_x, L_0) = solution
+            inactive = [i for i in range(len(w)) if i not in active]
+            #multipliers are positive, inactive constraints hold
+            rows = [np.append(-L_x[i], L_0[i]) for i in range(len(active))]
+            rows += [np.append(G[i] @ U_x - S[i], w[i] - G[i] @ U_0) for i in inactive]
+            kept = []
+            empty = False
+            for row in rows:
+                norm = np.linalg.norm(row[:-1])
+                if norm < 1e-9:
+                    empty = empty or row[-1] < -1e-9
+                else:
+                    kept.append(row / norm)
+            if not empty:
+                regions.append((np.append(U_x[0], U_0[0]), np.array(kept).reshape(-1, 5)))
+    return regions
+
+
+def sample_states(count, edge, seed=0):
+    ''' @brief Draws random states from the sample box
+        @return array with one state per row
+    '''
+    box = np.array((edge,) + SAMPLE_BOX[1:])
+    return np.random.default_rng(seed).uniform(-box, box, (count, 4))
+
+
+def locate(regions, X, tol=1e-6):
+    ''' @brief Finds the first region of every state
+        @return array with the region index of every state, -1 if no region contains the state
+    '''
+    index = np.full(len(X), -1)
+    for r, (law, rows) in enumerate(regions):
+        inside = np.all(X @ rows[:, :4].T <= rows[:, 4] + tol, axis=1) & (index < 0)
+        index[inside] = r
+    return index
+
+
+def brute_force(H, F, G, w, S, X):
+    ''' @brief Solves the quadratic program for many states by trying every set of active constraints
+        @return first torque of every state, NaN if the problem has no solution
+    '''
+    N = H.shape[0]
+    H_inv = np.linalg.inv(H)
+    best = np.full(len(X), np.inf)
+    u = np.full(len(X), np.nan)
+    for size in range(N + 1):
+        for active in itertools.combinations(range(len(w)), size):
+            solution = active_set_law(H_inv, F, G, w, S, active)
+            if solution is None:
+                continue
+            U = X @ solution[0].T + solution[1]
+            feasible = np.all(U @ G.T <= w + X @ S.T + 1e-6, axis=1)
+            cost = 0.5*np.einsum('ij,jk,ik->i', U, H, U) + np.einsum('ij,kj,ik->i', X, F, U)
+            better = feasible & (cost < best)
+            best[better] = cost[better]
+            u[better] = U[better, 0]
+    return u
+
+
+def table_rows(regions, K, torque_limit):
+    ''' @brief Builds the rows of the table file
+        @return list with the rows of the table file
+    '''
+    rows = [[len(regions), torque_limit, 0, 0, 0], list(K) + [0]]
+    for (law, constraint_rows) in regions:
+        rows.append([len(constraint_rows), 0, 0, 0, 0])
+        rows.append(list(law))
+        rows += [list(row) for row in constraint_rows]
+    return rows
+
+
+def check(filename, H, F, G, w, S, X):
+    ''' @brief Runs the table with closedloop.ExplicitMPC on the PC and compares it with the brute force solution
+        @param filename name of the table file
+        @param X states of both axes, one row per state
+        @return largest torque error in mNm
+    '''
+    try:
+        import closedloop
+    except ImportError:
+        import Term_closedloop as closedloop
+    (rows, cols, table) = tablefile.load(filename)
+    mpc = closedloop.ExplicitMPC(rows, cols, table)
+    expected = brute_force(H, F, G, w, S, X)
+    torques = np.zeros(len(X))
+    start = time.perf_counter()
+    for i in range(0, len(X) - 1, 2):
+        torque = mpc.run(np.concatenate((X[i], X[i + 1])))
+        torques[i] = torque[0]
+        torques[i + 1] = torque[1]
+    elapsed = time.perf_counter() - start
+    solved = ~np.isnan(expected)
+    solved[-1] = solved[-1] and len(X) % 2 == 0
+    error = np.max(np.abs(torques[solved] - expected[solved])) if np.any(solved) else 0.0
+    print('check: {} states, largest torque error {:.3g} mNm, {:.1f} us per run on the PC'.format(
+        np.count_nonzero(solved), error, 1e6*elapsed/(len(X)//2)))
+    return error
+
+
+def main():
+    ''' @brief Command line interface of the design tool
+    '''
+    parser = argparse.ArgumentParser(description='Design the explicit MPC of the ball balancing platform')
+    parser.add_argument('--q', default='400,100,25,1', help='diagonal of Q as x,theta,x_dot,theta_dot in model units')
+    parser.add_argument('--r', type=float, default=30.0, help='weight of the motor torque in model units')
+    parser.add_argument('--period', type=float, default=0.01, help='controller period in s')
+    parser.add_argument('--horizon', type=int, default=2, help='number of torque moves')
+    parser.add_argument('--torque-limit', type=float, default=300.0, help='largest motor torque in mNm')
+    parser.add_argument('--edge', type=float, default=45.0, help='largest distance of the ball from the center in mm')
+    parser.add_argument('--samples', type=int, default=20000, help='number of sampled states')
+    parser.add_argument('--check', action='store_true', help='compare the table with a brute force solution')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='largest torque error of --check in mNm')
+    parser.add_argument('-o', '--output', default='K_mpc.bin', help='name of the MPC table file')
+    args = parser.parse_args()
+
+    (A, B) = lqr_design.board_model(lqr_design.PARAMETERS, args.period)
+    (Q, R) = board_weights([float(v) for v in args.q.split(',')], args.r)
+    (K, P) = lqr_design.dlqr(A, B, Q, R)
+    (H, F, Phi, Gamma) = condense(A, B, Q, R, P, args.horizon)
+    (G, w, S) = constraints(Phi, Gamma, args.horizon, args.torque_limit, args.edge)
+
+    regions = enumerate_regions(H, F, G, w, S)
+    X = sample_states(args.samples, args.edge)
+    index = locate(regions, X)
+    hits = np.bincount(index[index >= 0], minlength=len(regions))
+    order = np.argsort(-hits, kind='stable')
+    regions = [regions[r] for r in order]
+    index = locate(regions, X)
+
+    rows = table_rows(regions, K[0], args.torque_limit)
+    tablefile.save(args.output, len(rows), 5, [v for row in rows for v in row])
+    n_constraints = sum(len(c) for (law, c) in regions)
+    checks = np.array([sum(len(regions[j][1]) for j in range(r)) + len(regions[r][1]) for r in index[index >= 0]])
+    print('LQR gains (mm, deg, mm/s, deg/s -> mNm): ' + ' '.join('{:.4g}'.format(v) for v in K[0]))
+    print('{} of {} regions hit, {} constraint rows'.format(np.count_nonzero(hits), len(regions), n_constraints))
+    print('coverage of the sampled states {:.1f} %, the rest uses the saturated LQR'.format(100.0*np.mean(index >= 0)))
+    print('mean constraint rows up to the region of a state {:.1f}, all rows {}'.format(
+        np.mean(checks) if len(checks) else 0, n_constraints))
+    print('table file {} bytes, ExplicitMPC storage about {} bytes'.format(
+        tablefile.HEADER_SIZE + 20*len(rows), 4*(4*n_constraints + n_constraints + 5*len(regions))))
+    print('wrote', args.output)
+
+    if args.check:
+        error = check(args.output, H, F, G, w, S, sample_states(2000, args.edge, seed=1))
+        if error > args.tolerance:
+            print('check failed: torque error above {} mNm'.format(args.tolerance))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
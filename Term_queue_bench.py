@@ -0,0 +1,101 @@
+''' @file                   Term_queue_bench.py
+    @brief                  Host benchmark of shares.Queue
+    @details                Runs on the PC, not on the board. The old Queue, which appended to a list and removed the first
+                            item with pop(0), is reproduced here as reference and compared with the ring buffer of
+                            Term_shares.py, with the capacity of the fill and unbounded. The queues are filled to a number of
+                            items and then put() and get() run in turns, so the fill stays the same. Printed are the time of one put() and get() pair on the PC
+                            and the memory which is allocated and freed again within the pair (measured with tracemalloc).
+                            On the board pop(0) moves all items of the list, so its time grows with the fill as on the PC.
+                            The indices of the ring buffer above 256 are int objects on the PC, on the board they are small
+                            ints and put() and get() do not allocate.
+
+                            Example: python Term_queue_bench.py --pairs 20000
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 28, 2021
+'''
+
+import argparse
+import sys
+import time
+import tracemalloc
+try:
+    import imu_bench
+except ImportError:
+    import Term_imu_bench as imu_bench
+
+
+## @brief numbers of items in the queue while put() and get() are measured
+#
+FILLS = (1, 16, 256, 4096)
+
+
+class LegacyQueue:
+    ''' @brief The Queue of Term_shares.py before the ring buffer, as reference
+    '''
+
+    def __init__(self):
+        self._buffer = []
+
+    def put(self, item):
+        self._buffer.append(item)
+
+    def get(self):
+        return self._buffer.pop(0)
+
+    def num_in(self):
+        return len(self._buffer)
+
+
+def load_shares(clock):
+    ''' @brief Imports the shares module with a fake utime module
+        @param clock VirtualClock of imu_bench
+        @return shares module
+    '''
+    sys.modules['utime'] = clock.module()
+    if 'shares' not in sys.modules:
+        sys.modules['shares'] = __import__('Term_shares')
+    sys.modules['shares'].utime = sys.modules['utime']
+    return sys.modules['shares']
+
+
+def measure(queue, fill, pairs):
+    ''' @brief Measures put() and get() of a queue at a constant fill
+        @param queue empty queue with put(), get() and num_in()
+        @param fill number of items in the queue
+        @param pairs number of put() and get() pairs
+        @return tuple (time of one pair in us, temporary memory of one pair in bytes)
+    '''
+    for i in range(fill):
+        queue.put(i)
+    (put, get) = (queue.put, queue.get)
+    start = time.perf_counter()
+    for i in range(pairs):
+        put(get())
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    put(get())
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if queue.num_in() != fill:
+        raise AssertionError('the queue lost items')
+    return (1e6*elapsed/pairs, peak - current)
+
+
+def main():
+    ''' @brief Command line interface of the benchmark
+    '''
+    parser = argparse.ArgumentParser(description='Compare the list based queue with the ring buffer')
+    parser.add_argument('--pairs', type=int, default=20000, help='number of put() and get() pairs per fill')
+    args = parser.parse_args()
+
+    shares = load_shares(imu_bench.VirtualClock())
+    print('{:<14}{:>8}{:>18}{:>18}'.format('queue', 'items', 'us/pair PC', 'temporary B/pair'))
+    for fill in FILLS:
+        for (name, queue) in (('list', LegacyQueue()), ('ring buffer', shares.Queue(fill)), ('unbounded', shares.Queue())):
+            (us, temporary) = measure(queue, fill, args.pairs)
+            print('{:<14}{:>8}{:>18.3f}{:>18}'.format(name, fill, us, temporary))
+
+
+if __name__ == '__main__':
+    main()
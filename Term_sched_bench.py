@@ -0,0 +1,455 @@
+''' @file                   Term_sched_bench.py
+    @brief                  Host benchmark of the task scheduling
+    @details                Runs on the PC, not on the board. The tasks of Term_main.py are replaced by loads which take their
+                            run time on a virtual clock, the fake utime module of this clock charges CALL_US for every call of
+                            ticks_us(). The old busy polling loop, in which every task compared the time on its own with >=,
+                            is reproduced here as reference and compared with the deadline scheduler, which idles with a fake
+                            pyb.wfi() until the next SysTick. The clock starts shortly before the ticks wrap at 2^30 us, so
+                            every run crosses a wrap. Printed are the share of idle time, the loop overhead (time which is
+                            neither idle nor in a task) and for every task the runs against the expected runs, the mean and
+                            largest deviation of the time between two starts from the period and the number of skipped
+                            periods. The AsyncRuntime of Term_async_runtime.py runs with a stand-in of uasyncio, which like
+                            uasyncio wakes the coroutines at the ms ticks and idles in between, and which charges SWITCH_US for
+                            every switch between two coroutines.
+                            With --pipeline the touchpanel, controller and motor tasks are replaced by stages which pass the
+                            time of the touch sample on. They run in the scheduler with their periods or in the ControlPath of
+                            Term_controlpath.py, whose fake timer interrupts the cooperative tasks between two steps of the
+                            clock and whose fake micropython.schedule() runs the pipeline right after the interrupt. Printed
+                            are the time from a touch sample to the motor update which applies a torque calculated from it,
+                            the deviation of the controller starts from its period, the idle time and the overruns of the
+                            pipeline.
+
+                            Example: python Term_sched_bench.py --seconds 2
+                                     python Term_sched_bench.py --pipeline
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 27, 2021
+'''
+
+import argparse
+import sys
+import types
+
+
+## @brief assumed cost of one call of utime.ticks_us() with the comparison after it on the board in us
+#
+CALL_US = 3
+
+## @brief tasks of Term_main.py: name, period in us and assumed run time on the board in us, the 'p' table of
+#         Task_User gives the measured run times
+#
+TASKS = (('user', 100000, 300), ('touchpanel', 5000, 700), ('imu', 10000, 1300), ('controller', 10000, 600),
+         ('motor', 5000, 150), ('datacollection', 50000, 400))
+
+## @brief time between two SysTick interrupts which end pyb.wfi() in us
+#
+SYSTICK_US = 1000
+
+## @brief assumed cost of one switch of the uasyncio event loop to a coroutine on the board in us
+#
+SWITCH_US = 40
+
+
+class BenchClock:
+    ''' @brief Virtual time of the fake utime, pyb and micropython modules
+        @details Interrupts are events at a time. They run when the clock passes their time, also in the middle of the run
+                 time of a task, which then ends later by the time of the interrupt.
+    '''
+
+    def __init__(self, start=0):
+        ''' @param start time of the clock at the start in us
+        '''
+        self.now = start
+        self.idle = 0
+        self.events = []
+        self.scheduled = []
+        self.in_scheduled = False
+
+    def module(self):
+        ''' @brief Creates the fake utime module
+            @return module object which can be put into sys.modules
+        '''
+        clock = self
+        utime = types.ModuleType('utime')
+
+        def ticks_us():
+            clock.advance(CALL_US)
+            return clock.now % (1 << 30)
+        utime.ticks_us = ticks_us
+        utime.ticks_ms = lambda: (clock.now // 1000) % (1 << 30)
+        utime.ticks_add = lambda ticks, delta: (ticks + delta) % (1 << 30)
+        utime.ticks_diff = lambda a, b: ((a - b + (1 << 29)) % (1 << 30)) - (1 << 29)
+        utime.sleep_us = lambda us: clock.wait(us)
+        utime.sleep_ms = lambda ms: clock.wait(1000*ms)
+        return utime
+
+    def micropython(self):
+        ''' @brief Creates the fake micropython module
+            @return module object which can be put into sys.modules
+        '''
+        micropython = types.ModuleType('micropython')
+        micropython.const = lambda value: value
+        micropython.schedule = self.schedule
+        return micropython
+
+    def at(self, time, event):
+        ''' @brief Runs an interrupt when the clock reaches a time
+            @param time time in us
+            @param event function without arguments
+        '''
+        self.events.append((time, event))
+        self.events.sort(key=lambda item: item[0])
+
+    def schedule(self, function, arg):
+        ''' @brief Fake micropython.schedule(), the function runs after the interrupt, but not inside another one
+        '''
+        self.scheduled.append((function, arg))
+        if not self.in_scheduled:
+            self.in_scheduled = True
+            while self.scheduled:
+                (function, arg) = self.scheduled.pop(0)
+                function(arg)
+            self.in_scheduled = False
+
+    def advance(self, us):
+        ''' @brief Lets time pass while the CPU is busy, interrupts in this time run and make it longer
+            @param us time in us
+        '''
+        remaining = max(0, int(us))
+        while self.events and self.events[0][0] <= self.now + remaining:
+            (time, event) = self.events.pop(0)
+            step = max(0, time - self.now)
+            self.now += step
+            remaining -= step
+            event()
+        self.now += remaining
+
+    def wait(self, us):
+        ''' @brief Lets time pass while the CPU is idle, an interrupt ends the wait
+            @param us time in us
+        '''
+        until = self.now + max(0, int(us))
+        if self.events and self.events[0][0] < until:
+            until = max(self.now, self.events[0][0])
+        self.idle += until - self.now
+        self.now = until
+        self.advance(0)
+
+    def wfi(self):
+        ''' @brief Fake pyb.wfi(), idles until the next SysTick
+        '''
+        self.wait(SYSTICK_US - self.now % SYSTICK_US)
+
+
+class Load:
+    ''' @brief Task which takes a fixed time and records when it starts
+    '''
+
+    def __init__(self, clock, name, period, cost):
+        ''' @param clock BenchClock
+            @param name name of the task
+            @param period period of the task in us
+            @param cost run time of the task in us
+        '''
+        self.clock = clock
+        self.name = name
+        self.period = period
+        self.cost = cost
+        self.starts = []
+
+    def run(self):
+        self.starts.append(self.clock.now)
+        self.clock.advance(self.cost)
+
+
+class LegacyLoad(Load):
+    ''' @brief Task which checks its own time like the tasks before the scheduler, as reference
+    '''
+
+    def __init__(self, clock, utime, name, period, cost):
+        Load.__init__(self, clock, name, period, cost)
+        self.utime = utime
+        self.next_time = utime.ticks_add(utime.ticks_us(), period)
+
+    def run(self):
+        if (self.utime.ticks_us() >= self.next_time):
+            Load.run(self)
+            self.next_time = self.utime.ticks_add(self.next_time, self.period)
+
+
+class Sleep:
+    ''' @brief Awaitable of the uasyncio stand-in, hands the time to wake up to the event loop
+    '''
+
+    def __init__(self, wake):
+        ''' @param wake time to wake up in us, None to wait forever
+        '''
+        self.wake = wake
+
+    def __await__(self):
+        yield self
+
+
+class FakeUasyncio:
+    ''' @brief Stand-in of uasyncio on a BenchClock
+        @details Only the functions which AsyncRuntime uses. Like uasyncio the event loop counts in ms, sleep_ms() wakes
+                 a coroutine at a ms tick, and the loop idles until the earliest coroutine is due.
+    '''
+
+    def __init__(self, clock, end):
+        ''' @param clock BenchClock
+            @param end time in us at which run() returns
+        '''
+        self.clock = clock
+        self.end = end
+        self.queue = []
+        self.order = 0
+
+    def module(self):
+        ''' @brief Creates the fake uasyncio module
+            @return module object which can be put into sys.modules
+        '''
+        uasyncio = types.ModuleType('uasyncio')
+        uasyncio.sleep_ms = self.sleep_ms
+        uasyncio.sleep = lambda seconds: self.sleep_ms(int(1000*seconds))
+        uasyncio.create_task = self.create_task
+        uasyncio.run = self.run
+        return uasyncio
+
+    def sleep_ms(self, ms):
+        return Sleep(1000*(self.clock.now // 1000 + ms))
+
+    def create_task(self, coroutine):
+        self.push(self.clock.now, coroutine)
+        #the tasks of AsyncRuntime never end, a coroutine which awaits one waits forever
+        return Sleep(None)
+
+    def push(self, wake, coroutine):
+        self.queue.append((wake, self.order, coroutine))
+        self.order += 1
+
+    def run(self, coroutine):
+        self.push(self.clock.now, coroutine)
+        while self.queue and self.clock.now < self.end:
+            self.queue.sort(key=lambda item: item[:2])
+            (wake, order, coroutine) = self.queue.pop(0)
+            if wake > self.clock.now:
+                self.clock.wait(wake - self.clock.now)
+            self.clock.advance(SWITCH_US)
+            try:
+                sleep = coroutine.send(None)
+            except StopIteration:
+                continue
+            if sleep.wake is not None:
+                self.push(sleep.wake, coroutine)
+
+
+class FakeTimer:
+    ''' @brief Timer whose callback is an interrupt of a BenchClock
+    '''
+
+    def __init__(self, clock, period):
+        ''' @param clock BenchClock
+            @param period period of the interrupt in us
+        '''
+        self.clock = clock
+        self.period = period
+        self.function = None
+
+    def callback(self, function):
+        ''' @brief Sets or removes the callback like pyb.Timer.callback()
+        '''
+        start = self.function is None
+        self.function = function
+        if start and function is not None:
+            self.clock.at(self.clock.now + self.period, self.interrupt)
+
+    def interrupt(self):
+        if self.function is not None:
+            self.clock.at(self.clock.now + self.period, self.interrupt)
+            self.function(self)
+
+
+class Stage:
+    ''' @brief Stand-in of the update() of the touchpanel, controller or motor task
+        @details The touchpanel stage takes a sample at the start of its run, the controller stage passes the time of
+                 the newest sample on as its torque and the motor stage records the time from the sample to its run.
+    '''
+
+    def __init__(self, clock, name, period, cost, source=None):
+        ''' @param clock BenchClock
+            @param name name of the task
+            @param period period of the task in us
+            @param cost run time in us
+            @param source stage whose output is the input of this one, None for the touchpanel
+        '''
+        self.clock = clock
+        self.name = name
+        self.period = period
+        self.cost = cost
+        self.source = source
+        self.output = None
+        self.seq = 0
+        self.source_seq = 0
+        self.starts = []
+        self.latencies = []
+
+    def run(self):
+        self.starts.append(self.clock.now)
+        if self.source is None:
+            self.output = self.clock.now
+            self.seq += 1
+        elif self.source.seq != self.source_seq:
+            self.source_seq = self.source.seq
+            self.output = self.source.output
+            self.seq += 1
+            if self.name == 'motor':
+                self.latencies.append(self.clock.now - self.output)
+        self.clock.advance(self.cost)
+
+
+def load_modules(clock):
+    ''' @brief Imports the scheduler and the control path with the fake modules of a clock
+        @param clock BenchClock
+        @return scheduler module
+    '''
+    sys.modules.update({'utime': clock.module(), 'micropython': clock.micropython()})
+    for name in ('taskstats', 'scheduler', 'controlpath'):
+        if name not in sys.modules:
+            sys.modules[name] = __import__('Term_' + name)
+        #use the fake modules of this run
+        sys.modules[name].utime = sys.modules['utime']
+    sys.modules['controlpath'].micropython = sys.modules['micropython']
+    return sys.modules['scheduler']
+
+
+def statistics(load, duration):
+    ''' @brief Evaluates the start times of a task
+        @param load Load object
+        @param duration simulated time in us
+        @return tuple (runs, expected runs, mean and largest deviation from the period in us, skipped periods)
+    '''
+    intervals = [b - a for (a, b) in zip(load.starts[:-1], load.starts[1:])]
+    deviations = [abs(interval - load.period) for interval in intervals] or [0]
+    skipped = sum(1 for interval in intervals if interval > 1.5*load.period)
+    return (len(load.starts), duration//load.period, sum(deviations)/len(deviations), max(deviations), skipped)
+
+
+def simulate(loop, seconds, before_wrap):
+    ''' @brief Runs the tasks of Term_main.py with one loop
+        @param loop 'polling' for the old loop, 'scheduler' or 'async'
+        @param seconds simulated time in s
+        @param before_wrap time in us between the start and the wrap of the ticks
+        @return tuple (list of loads, idle time in us, time in the tasks in us, simulated time in us)
+    '''
+    clock = BenchClock((1 << 30) - before_wrap)
+    scheduler = load_modules(clock)
+    utime = sys.modules['utime']
+    start = clock.now
+    end = start + int(1e6*seconds)
+    if (loop == 'polling'):
+        loads = [LegacyLoad(clock, utime, *task) for task in TASKS]
+        while clock.now < end:
+            for load in loads:
+                load.run()
+    elif (loop == 'async'):
+        sys.modules['uasyncio'] = FakeUasyncio(clock, end).module()
+        #imported again for the fake uasyncio and utime modules of this run
+        sys.modules.pop('async_runtime', None)
+        sys.modules['async_runtime'] = __import__('Term_async_runtime')
+        sys.modules['async_runtime'].utime = utime
+        sys.modules['async_runtime'].asyncio = sys.modules['uasyncio']
+        sys.modules['async_runtime'].sleep_ms = sys.modules['uasyncio'].sleep_ms
+        loads = [Load(clock, *task) for task in TASKS]
+        tasks = sys.modules['async_runtime'].AsyncRuntime()
+        for load in loads:
+            tasks.add_task(load.run, load.period, load.name)
+        tasks.run()
+    else:
+        loads = [Load(clock, *task) for task in TASKS]
+        tasks = scheduler.Scheduler(idle=clock.wfi)
+        for load in loads:
+            tasks.add_task(load.run, load.period, load.name)
+        while clock.now < end:
+            tasks.step()
+    busy = sum(load.cost*len(load.starts) for load in loads)
+    return (loads, clock.idle, busy, clock.now - start)
+
+
+def simulate_pipeline(timer, seconds, command_cost=50):
+    ''' @brief Runs the control chain in the scheduler or in the timer driven control path
+        @param timer True for the control path
+        @param seconds simulated time in s
+        @param command_cost run time in us of the run() of the touchpanel, controller and motor task, which only handle
+                            the commands if the control path calls their update()
+        @return tuple (motor stage, controller stage, control path or None, idle time in us, simulated time in us)
+    '''
+    clock = BenchClock()
+    scheduler = load_modules(clock)
+    costs = dict((task[0], task) for task in TASKS)
+    touch = Stage(clock, *costs['touchpanel'])
+    controller = Stage(clock, *costs['controller'], source=touch)
+    motor = Stage(clock, *costs['motor'], source=controller)
+    tasks = scheduler.Scheduler(idle=clock.wfi)
+    path = None
+    for task in TASKS:
+        stage = {'touchpanel': touch, 'controller': controller, 'motor': motor}.get(task[0])
+        if stage is None:
+            load = Load(clock, *task)
+        elif timer:
+            load = Load(clock, task[0], task[1], command_cost)
+        else:
+            load = stage
+        tasks.add_task(load.run, load.period, load.name)
+    if timer:
+        path = sys.modules['controlpath'].ControlPath(FakeTimer(clock, touch.period), (touch.run, controller.run, motor.run),
+                                                      touch.period, dividers=(1, controller.period//touch.period, 1))
+        path.start()
+    end = clock.now + int(1e6*seconds)
+    while clock.now < end:
+        tasks.step()
+    if path:
+        path.stop()
+    return (motor, controller, path, clock.idle, clock.now)
+
+
+def pipeline_table(seconds):
+    ''' @brief Prints the comparison of the scheduler and the control path
+        @param seconds simulated time in s
+    '''
+    print('{:<16}{:>28}{:>32}{:>10}{:>10}'.format('control chain', 'touch to motor mean/max us',
+                                                 'controller deviation mean/max', 'idle %', 'overruns'))
+    for timer in (False, True):
+        (motor, controller, path, idle, duration) = simulate_pipeline(timer, seconds)
+        latencies = motor.latencies or [0]
+        (runs, expected, mean, largest, skipped) = statistics(controller, duration)
+        print('{:<16}{:>19.0f} /{:>7}{:>20.0f} /{:>6} us{:>10.1f}{:>10}'.format(
+            'control path' if timer else 'scheduler', sum(latencies)/len(latencies), max(latencies), mean, largest,
+            100*idle/duration, path.overruns if path else '-'))
+
+
+def main():
+    ''' @brief Command line interface of the benchmark
+    '''
+    parser = argparse.ArgumentParser(description='Compare the scheduling loops on a virtual clock')
+    parser.add_argument('--seconds', type=float, default=2.0, help='simulated time of every loop in s')
+    parser.add_argument('--before-wrap', type=int, default=500000, help='time between the start and the tick wrap in us')
+    parser.add_argument('--pipeline', action='store_true', help='compare the control path with the scheduler instead')
+    args = parser.parse_args()
+
+    if args.pipeline:
+        pipeline_table(args.seconds)
+        return
+
+    print('{:<12}{:<16}{:>16}{:>22}{:>10}'.format('loop', 'task', 'runs/expected', 'deviation mean/max us', 'skipped'))
+    for loop in ('polling', 'scheduler', 'async'):
+        (loads, idle, busy, duration) = simulate(loop, args.seconds, args.before_wrap)
+        for load in loads:
+            (runs, expected, mean, largest, skipped) = statistics(load, duration)
+            print('{:<12}{:<16}{:>9} /{:>5}{:>15.0f} /{:>5}{:>10}'.format(loop, load.name, runs, expected, mean, largest,
+                                                                        skipped))
+        print('{:<12}idle {:.1f} %, loop overhead {:.1f} %'.format(loop, 100*idle/duration,
+                                                                    100*(duration - idle - busy)/duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+''' @file                   Term_scheduler.py
+    @brief                  A deadline driven scheduler for the cooperative tasks
+    @details                Owns the list of tasks of the ball balancing application. Every task is registered with its period and
+                            a callback. Instead of spinning over all tasks and letting every task compare the time on its own, the
+                            scheduler works out the earliest next deadline with wrap-safe tick math (utime.ticks_diff), idles until
+                            that deadline and then runs the tasks that are due in the order they were registered.
+                            Optionally the run time and lateness of every task is recorded in a Term_taskstats.TaskStats object.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 6, 2021
+'''
+
+import utime
+
+
+class Scheduler:
+    ''' @brief A deadline driven task scheduler
+        @details Objects of this class replace the busy-polling loop in Term_main.py. The release times of the
+                 tasks are kept in a list and advanced by one period after every run. If a task fell behind by a whole
+                 period or more it is resynchronized to the current time instead of being run several times in a row.
+    '''
+
+    def __init__(self, idle=None, idle_margin=1000, stats=None):
+        ''' @brief Constructs a scheduler object
+            @param idle function called while the next deadline is further away than idle_margin, e.g. pyb.wfi.
+                        If it is None the scheduler only waits with utime.sleep_us()
+            @param idle_margin time in us below which the scheduler stops idling and waits for the deadline with utime.sleep_us()
+            @param stats optional TaskStats object which records the run times of the tasks while stats.enabled is set
+        '''
+        #class variables
+        self.idle = idle
+        self.idle_margin = idle_margin
+        self.stats = stats
+        self.num_tasks = 0
+        self.names = []
+        self.callbacks = []
+        self.periods = []
+        self.next_times = []
+
+    def add_task(self, callback, period, name=''):
+        ''' @brief Registers a task at the scheduler
+            @param callback function which runs one iteration of the task, e.g. Task_Motor.run
+            @param period time in us between two runs of the task
+            @param name short name of the task
+            @return index of the task in the task list
+        '''
+        self.names.append(name)
+        self.callbacks.append(callback)
+        self.periods.append(period)
+        self.next_times.append(utime.ticks_add(utime.ticks_us(), period))
+        if (self.stats is not None):
+            self.stats.set_name(self.num_tasks, name)
+        self.num_tasks += 1
+        return self.num_tasks - 1
+
+    def time_to_next(self):
+        ''' @brief Calculates the time until the earliest deadline of all tasks
+            @return time in us until the next task is due, zero or negative if a task is already due
+        '''
+        now = utime.ticks_us()
+        next_times = self.next_times
+        delay = utime.ticks_diff(next_times[0], now)
+        for i in range(1, self.num_tasks):
+            task_delay = utime.ticks_diff(next_times[i], now)
+            if (task_delay < delay):
+                delay = task_delay
+        return delay
+
+    def step(self):
+        ''' @brief Waits until the earliest deadline and runs every task which is due
+        '''
+        #idle or wait until the next task is due
+        delay = self.time_to_next()
+        while (delay > 0):
+            if (self.idle is not None) and (delay > self.idle_margin):
+                self.idle()
+            else:
+                utime.sleep_us(delay)
+            delay = self.time_to_next()
+
+        #run all due tasks in the order they were registered
+        stats = self.stats
+        now = utime.ticks_us()
+        for i in range(self.num_tasks):
+            release = self.next_times[i]
+            late = utime.ticks_diff(now, release)
+            if (late >= 0):
+                if (stats is not None) and stats.enabled:
+                    start = utime.ticks_us()
+                    self.callbacks[i]()
+                    stats.record(i, release, start, utime.ticks_us(), self.periods[i])
+                else:
+                    self.callbacks[i]()
+                #defines the next time the task should run
+                if (late >= self.periods[i]):
+                    self.next_times[i] = utime.ticks_add(now, self.periods[i])
+                else:
+                    self.next_times[i] = utime.ticks_add(release, self.periods[i])
+
+    def run(self):
+        ''' @brief Runs the scheduler forever
+        '''
+        while(True):
+            self.step()
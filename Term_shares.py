@@ -1,57 +1,329 @@
-''' @file       Term_shares.py
-    @brief      Task sharing ibrary implementing both shares and queues.
-    @details    Implements a very simple interface for sharing data between
-                multiple tasks.
-'''
-
-class Share:
-    ''' @brief      A standard shared variable.
-        @details    Values can be accessed with read() or changed with write()
-    '''
-    def __init__(self, initial_value=None):
-        ''' @brief      Constructs a shared variable
-            @param      initial_value An optional initial value for the 
-                                      shared variable.
-        '''
-        self._buffer = initial_value
-    
-    def write(self, item):
-        ''' @brief      Updates the value of the shared variable
-            @param item The new value for the shared variable
-        '''
-        self._buffer = item
-        
-    def read(self):
-        ''' @brief      Access the value of the shared variable
-            @return    The value of the shared variable
-        '''
-        return self._buffer
-
-class Queue:
-    ''' @brief      A queue of shared data.
-        @details    Values can be accessed with placed into queue with put() or
-                    removed from the queue with get(). Check if there are
-                    items in the queue with num_in() before using get().
-    '''
-    def __init__(self):
-        ''' @brief              Constructs an empty queue of shared values
-        '''
-        self._buffer = []
-    
-    def put(self, item):
-        ''' @brief      Adds an item to the end of the queue.
-            @param item The new item to append to the queue.
-        '''
-        self._buffer.append(item)
-        
-    def get(self):
-        ''' @brief      Remove the first item from the front of the queue
-            @return     The value of the item removed
-        '''
-        return self._buffer.pop(0)
-    
-    def num_in(self):
-        ''' @brief      Find the number of items in the queue. Call before get().
-            @return     The number of items in the queue
-        '''
-        return len(self._buffer)
\ No newline at end of file
+''' @file       Term_shares.py
+    @brief      Task sharing ibrary implementing both shares and queues.
+    @details    Implements a very simple interface for sharing data between
+                multiple tasks.
+'''
+
+import utime
+from array import array
+try:
+    from micropython import const
+except ImportError:
+    #CPython, e.g. in the host benchmarks
+    const = lambda x: x
+
+## @brief Overflow policy of Queue: a full queue drops its oldest item
+#
+DROP_OLDEST = 0
+## @brief Overflow policy of Queue: a full queue ignores the new item
+#
+DROP_NEWEST = 1
+## @brief Overflow policy of Queue: a full queue raises an OverflowError
+#
+RAISE = 2
+
+## @brief Index of the contact flag of the touchpanel in a StateBlock
+#
+Z_POS = const(0)
+## @brief Index of the x position of the ball in a StateBlock
+#
+X_POS = const(1)
+## @brief Index of the y position of the ball in a StateBlock
+#
+Y_POS = const(2)
+## @brief Index of the x velocity of the ball in a StateBlock
+#
+X_VEL = const(3)
+## @brief Index of the y velocity of the ball in a StateBlock
+#
+Y_VEL = const(4)
+## @brief Index of the theta_x angle of the platform in a StateBlock
+#
+THETA_X = const(5)
+## @brief Index of the theta_y angle of the platform in a StateBlock
+#
+THETA_Y = const(6)
+## @brief Index of the theta_x velocity of the platform in a StateBlock
+#
+THETA_X_VEL = const(7)
+## @brief Index of the theta_y velocity of the platform in a StateBlock
+#
+THETA_Y_VEL = const(8)
+## @brief Number of values in a StateBlock
+#
+STATE_SIZE = const(9)
+
+## @brief Group of the touchpanel values Z_POS to Y_VEL, written by task_touchpanel
+#
+TOUCH = const(0)
+## @brief Group of the IMU values THETA_X to THETA_Y_VEL, written by task_imu
+#
+IMU = const(1)
+
+#first index and end index of every group
+_GROUP_START = (Z_POS, THETA_X)
+_GROUP_END = (THETA_X, STATE_SIZE)
+
+class Share:
+    ''' @brief      A standard shared variable.
+        @details    Values can be accessed with read() or changed with write()
+    '''
+    def __init__(self, initial_value=None):
+        ''' @brief      Constructs a shared variable
+            @param      initial_value An optional initial value for the 
+                                      shared variable.
+        '''
+        self._buffer = initial_value
+    
+    def write(self, item):
+        ''' @brief      Updates the value of the shared variable
+            @param item The new value for the shared variable
+        '''
+        self._buffer = item
+        
+    def read(self):
+        ''' @brief      Access the value of the shared variable
+            @return    The value of the shared variable
+        '''
+        return self._buffer
+
+class StampedShare(Share):
+    ''' @brief      A shared variable which remembers when it was written.
+        @details    Every write() stores the time in us and increases a 
+                    sequence number, so a reader can find out how old the 
+                    value is and whether it was written since the last read.
+    '''
+    def __init__(self, initial_value=None):
+        ''' @brief      Constructs a stamped shared variable
+            @param      initial_value An optional initial value for the 
+                                      shared variable.
+        '''
+        self._buffer = initial_value
+        self._time = utime.ticks_us()
+        self._seq = 0
+    
+    def write(self, item):
+        ''' @brief      Updates the value, the time stamp and the sequence number
+            @param item The new value for the shared variable
+        '''
+        self._buffer = item
+        self._time = utime.ticks_us()
+        #the counter wraps to 1, 0 means never written
+        seq = (self._seq + 1) & 0x3FFFFFFF
+        self._seq = seq if seq else 1
+    
+    def age(self):
+        ''' @brief      Find the time since the last write
+            @return     The age of the value in us, 0x3FFFFFFF if it was 
+                        never written
+        '''
+        if self._seq == 0:
+            return 0x3FFFFFFF
+        return utime.ticks_diff(utime.ticks_us(), self._time)
+    
+    def seq(self):
+        ''' @brief      Access the sequence number of the last write
+            @return     The sequence number, 0 if it was never written
+        '''
+        return self._seq
+    
+    def new_since(self, seq):
+        ''' @brief      Check if the value was written after a given write
+            @param seq  Sequence number returned by seq() earlier
+            @return     True if there was a write since then
+        '''
+        return self._seq != seq
+
+class Queue:
+    ''' @brief      A queue of shared data.
+        @details    Values can be accessed with placed into queue with put() or
+                    removed from the queue with get(). Check if there are
+                    items in the queue with num_in() before using get().
+                    The items are kept in a ring buffer, so put() and get()
+                    take constant time. Without a capacity the queue is 
+                    unbounded like a list: a full ring buffer is replaced 
+                    by one of twice the size, which is the only allocation.
+                    With a capacity the ring buffer is allocated once and 
+                    put() follows the overflow policy given to the 
+                    constructor if the queue is full.
+    '''
+    def __init__(self, capacity=None, overflow=DROP_OLDEST):
+        ''' @brief              Constructs an empty queue of shared values
+            @param capacity     Maximum number of items in the queue, None 
+                                for an unbounded queue which never drops items
+            @param overflow     What put() does if a queue with a capacity 
+                                is full: DROP_OLDEST, DROP_NEWEST or RAISE
+        '''
+        if capacity is not None and capacity < 1:
+            raise ValueError('queue capacity must be at least 1')
+        self._bounded = capacity is not None
+        if capacity is None:
+            capacity = 16
+        self._buffer = [None] * capacity
+        self._capacity = capacity
+        self._overflow = overflow
+        self._head = 0
+        self._count = 0
+    
+    def put(self, item):
+        ''' @brief      Adds an item to the end of the queue.
+            @param item The new item to append to the queue.
+        '''
+        if self._count == self._capacity:
+            if not self._bounded:
+                self._grow()
+            elif self._overflow == DROP_NEWEST:
+                return
+            elif self._overflow == RAISE:
+                raise OverflowError('queue full')
+            else:
+                #drop the oldest item to make room
+                self._head = (self._head + 1) % self._capacity
+                self._count -= 1
+        self._buffer[(self._head + self._count) % self._capacity] = item
+        self._count += 1
+    
+    def _grow(self):
+        ''' @brief      Doubles the ring buffer of an unbounded queue, the 
+                        items start at index 0 of the new buffer
+        '''
+        buffer = [None] * (2 * self._capacity)
+        for i in range(self._count):
+            buffer[i] = self._buffer[(self._head + i) % self._capacity]
+        self._buffer = buffer
+        self._capacity *= 2
+        self._head = 0
+        
+    def get(self):
+        ''' @brief      Remove the first item from the front of the queue
+            @return     The value of the item removed
+        '''
+        if self._count == 0:
+            raise IndexError('queue empty')
+        item = self._buffer[self._head]
+        self._buffer[self._head] = None
+        self._head = (self._head + 1) % self._capacity
+        self._count -= 1
+        return item
+    
+    def peek(self):
+        ''' @brief      Read the first item without removing it from the queue
+            @return     The value of the first item
+        '''
+        if self._count == 0:
+            raise IndexError('queue empty')
+        return self._buffer[self._head]
+    
+    def drain(self, buffer=None):
+        ''' @brief        Remove all items from the queue at once
+            @param buffer Optional preallocated list which receives the items 
+                          in order, starting at index 0. Items which do not 
+                          fit into the buffer stay in the queue.
+            @return       The number of items removed
+        '''
+        if buffer is None:
+            num = self._count
+        else:
+            num = min(self._count, len(buffer))
+        for i in range(num):
+            index = (self._head + i) % self._capacity
+            if buffer is not None:
+                buffer[i] = self._buffer[index]
+            self._buffer[index] = None
+        self._head = (self._head + num) % self._capacity
+        self._count -= num
+        return num
+    
+    def num_in(self):
+        ''' @brief      Find the number of items in the queue. Call before get().
+            @return     The number of items in the queue
+        '''
+        return self._count
+
+
+class StateBlock:
+    ''' @brief      A block of shared float values which are written in groups.
+        @details    All values are kept in one array('f') and addressed with 
+                    the index constants of this module. A writer updates a 
+                    whole group at once with write_group(). Every group has a 
+                    sequence counter which is odd while the group is written, 
+                    so read_group() can detect and repeat a read which was 
+                    interrupted by a write. Every group also remembers the 
+                    time of its last write.
+    '''
+    def __init__(self):
+        ''' @brief              Constructs a state block with all values set to zero
+        '''
+        self._buffer = array('f', [0] * STATE_SIZE)
+        self._seq = [0] * len(_GROUP_START)
+        self._time = [utime.ticks_us()] * len(_GROUP_START)
+    
+    def write_group(self, group, values):
+        ''' @brief        Updates all values of a group
+            @param group  TOUCH or IMU
+            @param values Array or list of length STATE_SIZE, only the 
+                          entries of the group are copied
+        '''
+        buffer = self._buffer
+        self._seq[group] += 1
+        for i in range(_GROUP_START[group], _GROUP_END[group]):
+            buffer[i] = values[i]
+        self._time[group] = utime.ticks_us()
+        #the counter wraps to 2, 0 means never written and odd values a write
+        seq = (self._seq[group] + 1) & 0x3FFFFFFF
+        self._seq[group] = seq if seq else 2
+    
+    def read_group(self, group, values):
+        ''' @brief        Copies a consistent snapshot of all values of a group
+            @details      A read which is interrupted by a write is repeated.
+                          If the group is in the middle of a write which can 
+                          not finish before this read, e.g. because the read 
+                          runs in a scheduled callback, values is not changed.
+            @param group  TOUCH or IMU
+            @param values Array or list of length STATE_SIZE which receives 
+                          the entries of the group
+            @return       The sequence counter of the snapshot or -1 if values
+                          was not changed
+        '''
+        buffer = self._buffer
+        while True:
+            seq = self._seq[group]
+            if seq & 1:
+                return -1
+            for i in range(_GROUP_START[group], _GROUP_END[group]):
+                values[i] = buffer[i]
+            if self._seq[group] == seq:
+                return seq
+    
+    def read(self, index):
+        ''' @brief       Access a single value
+            @param index One of the index constants, e.g. X_POS
+            @return      The value
+        '''
+        return self._buffer[index]
+    
+    def seq(self, group):
+        ''' @brief       Access the sequence counter of a group
+            @param group TOUCH or IMU
+            @return      The sequence counter, it changes with every write 
+                         of the group and is 0 if the group was never written
+        '''
+        return self._seq[group]
+    
+    def age(self, group):
+        ''' @brief       Find the time since the last write of a group
+            @param group TOUCH or IMU
+            @return      The age of the group in us, 0x3FFFFFFF if it was 
+                         never written
+        '''
+        if self._seq[group] == 0:
+            return 0x3FFFFFFF
+        return utime.ticks_diff(utime.ticks_us(), self._time[group])
+    
+    def new_since(self, group, seq):
+        ''' @brief       Check if a group was written after a given snapshot
+            @param group TOUCH or IMU
+            @param seq   Sequence counter returned by read_group() or seq()
+            @return      True if there was a write since then
+        '''
+        return self._seq[group] != seq
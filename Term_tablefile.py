@@ -0,0 +1,74 @@
+''' @file                   Term_tablefile.py
+    @brief                  Reads and writes tables of float values as compact binary files
+    @details                A table file starts with an 8 byte header (magic, number of rows, number of columns) followed by
+                            rows*cols little-endian float32 values, row by row. The files are written on the PC by the design
+                            tools and read on the board with one readinto() into an array('f'), or with open_table() row by
+                            row from the open file, so a long table stays in the flash. The module runs on the board and on
+                            the PC.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 10, 2021
+'''
+
+import struct
+from array import array
+
+## @brief first four bytes of every table file
+#
+MAGIC = b'BBTB'
+## @brief struct format of the header: magic, rows, cols
+#
+HEADER = '<4sHH'
+## @brief size of the header in bytes
+#
+HEADER_SIZE = 8
+
+
+def load(filename):
+    ''' @brief Reads a table file
+        @param filename name of the table file
+        @return tuple (rows, cols, values) where values is an array('f') with rows*cols values, row by row
+    '''
+    with open(filename, 'rb') as f:
+        (magic, rows, cols) = struct.unpack(HEADER, f.read(HEADER_SIZE))
+        if (magic != MAGIC):
+            raise ValueError('no table file: ' + filename)
+        values = array('f', [0] * (rows * cols))
+        if (f.readinto(values) != 4 * rows * cols):
+            raise ValueError('table file too short: ' + filename)
+    return (rows, cols, values)
+
+
+def open_table(filename):
+    ''' @brief Opens a table file to read it row by row
+        @details After the header the file position is at the first row, every readinto() of a buffer with cols floats
+                 reads the next row. seek(HEADER_SIZE) starts again at the first row.
+        @param filename name of the table file
+        @return tuple (file, rows, cols), the caller closes the file
+    '''
+    f = open(filename, 'rb')
+    try:
+        (magic, rows, cols) = struct.unpack(HEADER, f.read(HEADER_SIZE))
+        if (magic != MAGIC):
+            raise ValueError('no table file: ' + filename)
+        if (f.seek(0, 2) < HEADER_SIZE + 4 * rows * cols):
+            raise ValueError('table file too short: ' + filename)
+        f.seek(HEADER_SIZE)
+    except:
+        f.close()
+        raise
+    return (f, rows, cols)
+
+
+def save(filename, rows, cols, values):
+    ''' @brief Writes a table file
+        @param filename name of the table file
+        @param rows number of rows
+        @param cols number of columns
+        @param values iterable with rows*cols values, row by row
+    '''
+    values = array('f', values)
+    if (len(values) != rows * cols):
+        raise ValueError('table needs {} values, got {}'.format(rows * cols, len(values)))
+    with open(filename, 'wb') as f:
+        f.write(struct.pack(HEADER, MAGIC, rows, cols))
+        f.write(values)
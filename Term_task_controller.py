@@ -1,139 +1,361 @@
-''' @file                   Term_task_controller.py
-    @brief                  with that file you can access the controller functions
-    @details                Responsible for implementing the closed-loop full-state-feedback controller. It calculates the torque for the motors from the gains and position, angles and velocities input.
-			    This is the State diagram we used:
-			    \image html Term_contoller_SD.png "State Diagram" width=80%   
-    @author                 Sebastian Boessl, Johannes Frisch
-    @date                   November 3, 2021
-'''
-
-import closedloop
-import utime
-from ulab import numpy as np
-
-#Define State Variables
-##@brief defines the initialization state
-#
-S0_Init = 0
-##@brief defines the state to stop balance the ball
-#
-S1_StopBalancing = 1
-##@brief defines the state to balance the ball
-#
-S2_Balancing = 2
-
-
-class Task_Controller:
-    ''' @brief A Controller Task class
-        @details Objects of this class can be used to implement a closed loop controller
-    '''
-
-    def __init__(self, period, begin_balancing, stop_balancing, z_pos, x_pos, y_pos, x_vel, y_vel, theta_x, theta_y, theta_x_vel, theta_y_vel, motor_x_set, motor_y_set):
-        ''' @brief creates a object of Task_Motor
-            @param period defines the time until task_controller will run again
-            @param begin_balancing gets instruction from task_user to begin balancing the ball
-            @param stop_balancing gets instruction from task_user to stop balancing the ball
-            @param z_pos gets z value from the touchpanel whether there is a contact or not
-            @param x_pos gets x position from the touchpanel
-            @param y_pos gets y position from the touchpanel
-            @param x_vel gets x velocity from the touchpanel
-            @param y_vel gets y velocity from the touchpanel
-            @param theta_x gets theta x position from the platfrom from the IMU
-            @param theta_y gets theta y position from the platfrom from the IMU
-            @param theta_x_velo gets theta x velocity from the platfrom from the IMU
-            @param theta_y_velo gets theta y velocity from the platfrom from the IMU
-            @param motor_x_set calculates the torque for the motor
-            @param motor_y_set calculates the torque for the motor
-        '''
-        
-        #class variables
-        self.state = S0_Init
-        self.runs = 0
-        self.period = period
-        #defines when the task will run again 
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period)
-        self.balancing = 0
-
-        #shared variables
-        self.begin_balancing = begin_balancing
-        self.stop_balancing = stop_balancing
-        self.z_pos = z_pos
-        self.x_pos = x_pos
-        self.y_pos = y_pos
-        self.x_vel = x_vel
-        self.y_vel = y_vel
-        self.theta_x = theta_x
-        self.theta_y = theta_y
-        self.theta_x_vel = theta_x_vel
-        self.theta_y_vel = theta_y_vel
-        self.motor_x_set = motor_x_set
-        self.motor_y_set = motor_y_set      
-        
-    def run(self):
-        ''' @brief          runs one interation of the task
-        '''
-        #checks if it is time to run the task
-        if (utime.ticks_us() >= self.next_time):
-            
-            #initialization state
-            if (self.state == S0_Init):
-                #run state 0
-                
-                #creates k_matrix with the gains
-                K_matrix = np.array([0, -5, 0, -0.2])
-                #initalize the k-matrix in the closedloop driver
-                self.ctr_x = closedloop.ClosedLoop(K_matrix)
-                self.ctr_y = closedloop.ClosedLoop(K_matrix)
-                
-                #set motor values to 0 to disable them
-                self.motor_x_set.write(0)
-                self.motor_y_set.write(0)
-                
-                #transition to state 1
-                self.state = S1_StopBalancing
-                
-            #update state
-            if (self.state == S1_StopBalancing):
-                #run state 
-                
-                #check if it should start balancing
-                if (self.begin_balancing.num_in() > 0):
-                    self.begin_balancing.get()
-                    self.state = S2_Balancing
-                
-            #check the current state
-            if(self.state == S2_Balancing):
-                #run state
-                
-                #check if it should stop balancing
-                if (self.stop_balancing.num_in() > 0):
-                    self.stop_balancing.get()
-                    #disable motor 
-                    self.motor_x_set.write(0)
-                    self.motor_y_set.write(0)
-                    #transition into next state+
-                    self.state = S1_StopBalancing
-                    
-                #update state vectors
-                self.stateVector_Mx = np.array([[self.x_pos.read()],
-                                                 [self.theta_y.read()],
-                                                 [self.x_vel.read()],
-                                                 [-self.theta_y_vel.read()]])
-                
-                self.stateVector_My = np.array([[self.y_pos.read()],
-                                                 [self.theta_x.read()],
-                                                 [self.y_vel.read()],
-                                                 [-self.theta_x_vel.read()]])
-                          
-                #call closedloop controller to calculate torques
-                #only calculate torque if there is contact with the ball otherwise set it to 0
-                if (self.z_pos.read() == True):
-                    #calculate and set torque for the motors
-                    self.motor_x_set.write(self.ctr_x.run(self.stateVector_Mx))
-                    self.motor_y_set.write(self.ctr_y.run(self.stateVector_My))
-                else:
-                    self.motor_x_set.write(0)
-                    self.motor_y_set.write(0)
-                
-            #defines the next time the run should run
-            self.next_time = utime.ticks_add(self.next_time, self.period)
\ No newline at end of file
+''' @file                   Term_task_controller.py
+    @brief                  with that file you can access the controller functions
+    @details                Responsible for implementing the closed-loop full-state-feedback controller. It calculates the torque for the motors from the gains and position, angles and velocities input.
+                            The ball can follow a reference trajectory, a table of x, y, vx and vy samples per controller period written by
+                            Term_trajectory_gen.py. The table stays in the flash, its file is kept open and one row of 16 bytes is read
+                            into a preallocated buffer every run. An integral of the position error removes offsets.
+                            Task_User can switch between the state feedback and the explicit MPC from Term_mpc_design.py, both have the
+                            same run(state_vector) interface.
+			    This is the State diagram we used:
+			    \image html Term_contoller_SD.png "State Diagram" width=80%   
+    @author                 Sebastian Boessl, Johannes Frisch
+    @date                   November 3, 2021
+'''
+
+import closedloop
+import tablefile
+import shares
+from array import array
+from ulab import numpy as np
+
+#Define State Variables
+##@brief defines the initialization state
+#
+S0_Init = 0
+##@brief defines the state to stop balance the ball
+#
+S1_StopBalancing = 1
+##@brief defines the state to balance the ball
+#
+S2_Balancing = 2
+
+##@brief table file with the gains of the x- and the y-axis, written by Term_lqr_design.py
+#
+GAIN_FILE = "K_gains.bin"
+##@brief table file with the gain schedule over ball radius and platform tilt, written by Term_lqr_design.py
+#
+SCHEDULE_FILE = "K_schedule.bin"
+##@brief table file of the explicit MPC, written by Term_mpc_design.py
+#
+MPC_FILE = "K_mpc.bin"
+##@brief table files of the reference trajectories which can be selected by task_user, None is the plate center
+#
+TRAJECTORY_FILES = (None, "traj_circle.bin", "traj_eight.bin", "traj_steps.bin")
+##@brief largest torque of the motors in mNm, the position error is not integrated while a torque is above
+#
+TORQUE_LIMIT = 300
+
+
+class Task_Controller:
+    ''' @brief A Controller Task class
+        @details Objects of this class can be used to implement a closed loop controller
+                 The torques are calculated by update(), which run() calls unless the timer driven control path of
+                 Term_controlpath.py calls it.
+    '''
+
+    def __init__(self, period, begin_balancing, stop_balancing, state_block, motor_x_set, motor_y_set, select_trajectory, select_controller, controller_selected, max_age=30000, integral_limit=200, pipelined=False):
+        ''' @brief creates a object of Task_Motor
+            @param period defines the time until task_controller will run again
+            @param begin_balancing gets instruction from task_user to begin balancing the ball
+            @param stop_balancing gets instruction from task_user to stop balancing the ball
+            @param state_block shared StateBlock with the positions and velocities from the touchpanel and the angles and velocities of the platform from the IMU
+            @param motor_x_set calculates the torque for the motor
+            @param motor_y_set calculates the torque for the motor
+            @param select_trajectory gets the index of the reference trajectory in TRAJECTORY_FILES from task_user
+            @param select_controller gets 0 for the state feedback or 1 for the explicit MPC from task_user
+            @param controller_selected sends the index of the controller which is used after a selection to task_user
+            @param max_age maximum age in us of the touchpanel and IMU values, older values set the torques to 0
+            @param integral_limit largest magnitude of the integral of the position error in mm*s
+            @param pipelined True if the control path calls update() every period, then run() only handles the commands
+        '''
+        
+        #class variables
+        self.state = S0_Init
+        self.runs = 0
+        self.period = period
+        self.balancing = 0
+        #snapshot of the state block
+        self.values = array('f', [0] * shares.STATE_SIZE)
+        self.max_age = max_age
+        #sequence counters of the last values the torques were calculated from
+        self.touch_seq = -1
+        self.imu_seq = -1
+        #row of the reference trajectory and the open table file, the plate center until a trajectory is selected
+        self.reference = array('f', [0] * 4)
+        self.ref_file = None
+        #integral gains of the x- and the y-axis, the integrals of the position errors and the limit
+        self.Ki = array('f', [0] * 2)
+        self.integral = array('f', [0] * 2)
+        self.integral_limit = integral_limit
+        self.dt = period/1000000
+        self.pipelined = pipelined
+
+        #shared variables
+        self.begin_balancing = begin_balancing
+        self.stop_balancing = stop_balancing
+        self.state_block = state_block
+        self.motor_x_set = motor_x_set
+        self.motor_y_set = motor_y_set      
+        self.select_trajectory = select_trajectory
+        self.select_controller = select_controller
+        self.controller_selected = controller_selected
+        
+    def run(self):
+        ''' @brief          runs one interation of the task
+        '''
+        
+        #initialization state
+        if (self.state == S0_Init):
+            #run state 0
+            
+            #creates k_matrix with the default gains
+            K_matrix = np.array([0, -5, 0, -0.2])
+            #initalize the k-matrix in the closedloop driver for both axes
+            self.ctr = closedloop.FusedClosedLoop(K_matrix, K_matrix)
+            #load the gains from the gain file if existent
+            self.load_gains(GAIN_FILE)
+            #use gain scheduling instead if a gain schedule exists
+            self.load_schedule(SCHEDULE_FILE)
+            self.feedback = self.ctr
+            #load the explicit MPC if existent, it is used after task_user selected it
+            self.mpc = None
+            self.load_mpc(MPC_FILE)
+            #state vector of both axes, it is overwritten every run
+            self.stateVector = array('f', [0] * 8)
+            
+            #set motor values to 0 to disable them
+            self.motor_x_set.write(0)
+            self.motor_y_set.write(0)
+            
+            #transition to state 1
+            self.state = S1_StopBalancing
+            
+        #update state
+        if (self.state == S1_StopBalancing):
+            #run state 
+            
+            #check if another trajectory or controller was selected
+            self.check_trajectory()
+            self.check_controller()
+            
+            #check if it should start balancing
+            if (self.begin_balancing.num_in() > 0):
+                self.begin_balancing.get()
+                self.touch_seq = -1
+                self.imu_seq = -1
+                self.restart_trajectory()
+                self.state = S2_Balancing
+            
+        #check the current state
+        if(self.state == S2_Balancing):
+            #run state
+            
+            #check if it should stop balancing
+            if (self.stop_balancing.num_in() > 0):
+                self.stop_balancing.get()
+                #transition into next state first, so the control path does not write torques after the zeros
+                self.state = S1_StopBalancing
+                #disable motor 
+                self.motor_x_set.write(0)
+                self.motor_y_set.write(0)
+            else:
+                #check if another controller was selected, a trajectory is only loaded while not balancing
+                self.check_controller()
+                #calculate the torques from the latest values, unless the control path does it
+                if not (self.pipelined):
+                    self.update()
+
+    def update(self):
+        ''' @brief Calculates the torques while the ball is balanced
+            @details Only runs in state 2. It only uses the state block and the torque shares, so the control path can call
+                     it between any two bytecodes of run().
+        '''
+        if (self.state == S2_Balancing):
+            self.update_torques()
+
+    def load_gains(self, filename):
+        ''' @brief Loads the gains from a table file into the controller
+            @details The file contains either one row of 4 gains for both axes, two rows of 4 gains for the x- and the y-axis,
+                     two rows of 4 gains and the integral gain for the x- and the y-axis or a 2x8 block matrix.
+                     If the file is missing or has another shape, the current gains are kept.
+            @param filename name of the table file
+            @return True if the gains were loaded
+        '''
+        try:
+            (rows, cols, K) = tablefile.load(filename)
+        except (OSError, ValueError):
+            return False
+        if (rows == 1) and (cols == 4):
+            self.ctr.set_K(K, K)
+        elif (rows == 2) and (cols == 4):
+            self.ctr.set_K(K[0:4], K[4:8])
+        elif (rows == 2) and (cols == 5):
+            self.ctr.set_K(K[0:4], K[5:9])
+            self.Ki[0] = K[4]
+            self.Ki[1] = K[9]
+        elif (rows == 2) and (cols == 8):
+            self.ctr.set_K_block((K[0:8], K[8:16]))
+        else:
+            return False
+        return True
+    
+    def load_schedule(self, filename):
+        ''' @brief Replaces the controller by a gain scheduled controller with the table from a file
+            @details If the file is missing, has the wrong shape or a maximum radius or tilt which is not positive, the
+                     current controller is kept.
+            @param filename name of the table file
+            @return True if the gain schedule was loaded
+        '''
+        try:
+            (rows, cols, table) = tablefile.load(filename)
+            self.ctr = closedloop.ScheduledClosedLoop(rows, cols, table)
+        except (OSError, ValueError):
+            return False
+        return True
+    
+    def load_mpc(self, filename):
+        ''' @brief Loads the explicit MPC from a table file
+            @details If the file is missing or has the wrong shape, only the state feedback can be used.
+            @param filename name of the table file
+            @return True if the MPC was loaded
+        '''
+        try:
+            (rows, cols, table) = tablefile.load(filename)
+            self.mpc = closedloop.ExplicitMPC(rows, cols, table)
+        except (OSError, ValueError):
+            return False
+        return True
+    
+    def check_controller(self):
+        ''' @brief Switches between the state feedback and the explicit MPC as selected by task_user
+            @details The explicit MPC is only used if its table was loaded, the index of the controller which is used is
+                     sent back to task_user.
+        '''
+        if (self.select_controller.num_in() > 0):
+            if (self.select_controller.get() == 1) and (self.mpc):
+                self.ctr = self.mpc
+                self.controller_selected.put(1)
+            else:
+                self.ctr = self.feedback
+                self.controller_selected.put(0)
+    
+    def check_trajectory(self):
+        ''' @brief Loads the reference trajectory selected by task_user
+            @details Only called while the ball is not balanced, a trajectory selected while balancing is loaded after the
+                     balancing stopped. So opening the file does not delay the torques, and update() never reads from a
+                     file which is being replaced. Only the file is opened, update_torques() reads one row per run.
+                     If the table file is missing or has the wrong shape, the ball is balanced in the plate center.
+        '''
+        if (self.select_trajectory.num_in() > 0):
+            filename = TRAJECTORY_FILES[self.select_trajectory.get()]
+            if (self.ref_file):
+                self.ref_file.close()
+                self.ref_file = None
+            if (filename):
+                try:
+                    (f, rows, cols) = tablefile.open_table(filename)
+                    if (cols == 4) and (rows > 0):
+                        self.ref_file = f
+                    else:
+                        f.close()
+                except (OSError, ValueError):
+                    pass
+            self.restart_trajectory()
+    
+    def restart_trajectory(self):
+        ''' @brief Starts the reference trajectory from its first sample and clears the integrals
+        '''
+        ref = self.reference
+        for i in range(4):
+            ref[i] = 0
+        if (self.ref_file):
+            self.ref_file.seek(tablefile.HEADER_SIZE)
+        self.integral[0] = 0
+        self.integral[1] = 0
+    
+    def update_torques(self):
+        ''' @brief Calculates the motor torques from the latest touchpanel and IMU values
+            @details The torques are only recalculated if the touchpanel or the IMU values changed since the last call.
+                     If one of them is older than max_age, e.g. because the IMU is still calibrating, the torques are set to 0.
+                     The reference advances by one sample every call. The position errors are only integrated while the
+                     torque stays below TORQUE_LIMIT and the integrals are clamped to integral_limit (anti-windup).
+        '''
+        #sample of the reference trajectory for this period, after the last row the trajectory starts again
+        ref = self.reference
+        if (self.ref_file):
+            if (self.ref_file.readinto(ref) != 16):
+                self.ref_file.seek(tablefile.HEADER_SIZE)
+                self.ref_file.readinto(ref)
+        
+        #read consistent snapshots of the touchpanel and IMU values
+        values = self.values
+        touch_seq = self.state_block.read_group(shares.TOUCH, values)
+        imu_seq = self.state_block.read_group(shares.IMU, values)
+        touch_age = self.state_block.age(shares.TOUCH)
+        imu_age = self.state_block.age(shares.IMU)
+        
+        #fail safe if the values are too old
+        if (touch_age > self.max_age) or (touch_age < 0) or (imu_age > self.max_age) or (imu_age < 0):
+            self.motor_x_set.write(0)
+            self.motor_y_set.write(0)
+            self.touch_seq = touch_seq
+            self.imu_seq = imu_seq
+            self.integral[0] = 0
+            self.integral[1] = 0
+            
+        #skip the calculation if nothing changed or a snapshot could not be read
+        elif (touch_seq < 0) or (imu_seq < 0) or ((touch_seq == self.touch_seq) and (imu_seq == self.imu_seq)):
+            pass
+        
+        else:
+            self.touch_seq = touch_seq
+            self.imu_seq = imu_seq
+            
+            #update state vector with the errors to the reference
+            stateVector = self.stateVector
+            stateVector[0] = values[shares.X_POS] - ref[0]
+            stateVector[1] = values[shares.THETA_Y]
+            stateVector[2] = values[shares.X_VEL] - ref[2]
+            stateVector[3] = -values[shares.THETA_Y_VEL]
+            stateVector[4] = values[shares.Y_POS] - ref[1]
+            stateVector[5] = values[shares.THETA_X]
+            stateVector[6] = values[shares.Y_VEL] - ref[3]
+            stateVector[7] = -values[shares.THETA_X_VEL]
+                      
+            #call closedloop controller to calculate torques
+            #only calculate torque if there is contact with the ball otherwise set it to 0
+            if (values[shares.Z_POS]):
+                #calculate and set torque for the motors
+                torque = self.ctr.run(stateVector)
+                torque_x = self.integrate(0, torque[0], stateVector[0])
+                torque_y = self.integrate(1, torque[1], stateVector[4])
+                self.motor_x_set.write(torque_x)
+                self.motor_y_set.write(torque_y)
+            else:
+                self.motor_x_set.write(0)
+                self.motor_y_set.write(0)
+                self.integral[0] = 0
+                self.integral[1] = 0
+    
+    def integrate(self, axis, torque, error):
+        ''' @brief Integrates the position error of one axis and adds the integral torque
+            @param axis 0 for the x-axis and 1 for the y-axis
+            @param torque torque of the state feedback in mNm
+            @param error position error in mm
+            @return torque including the integral part in mNm
+        '''
+        Ki = self.Ki[axis]
+        if (Ki == 0):
+            return torque
+        integral = self.integral[axis]
+        #conditional integration, a saturated torque does not wind up the integral
+        new_integral = integral + error*self.dt
+        if (abs(torque - Ki*new_integral) < TORQUE_LIMIT):
+            integral = new_integral
+            #clamp the integral
+            if (integral > self.integral_limit):
+                integral = self.integral_limit
+            elif (integral < -self.integral_limit):
+                integral = -self.integral_limit
+            self.integral[axis] = integral
+        return torque - Ki*integral
@@ -1,118 +1,159 @@
-''' @file                   Term_task_datacollection.py
-    @brief                  with that file data is written to or read from files
-    @details                Responsible for collecting data and storing it in the appropriate format to
-                            either transmit over USB serial to a host PC or to save the data as a file on the Nucleo
-			    This is the State diagram we used:
-			    \image html Term_datacollection_SD.png "State Diagram" width=80%
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   November 3, 2021
-'''
-
-import utime
-
-
-#Define State Variables
-##@brief defines the initialization state
-#
-S0_Init = 0
-##@brief defines the update state to wait for user input
-#
-S1_Update = 1
-##@brief defines the state to collect data
-#
-S2_CollectData = 2
-
-
-class Task_DataCollection:
-    ''' @brief A Data Collection Task class
-    @details Objects of this class can be used to collect data
-    '''
-
-    def __init__(self, period, start_collect_data, z_pos, x_pos, y_pos, x_vel, y_vel, theta_x, theta_y, theta_x_vel, theta_y_vel):
-        ''' @brief creates a object of Task_Motor
-            @param period defines the time until task_datacollection will run again
-            @param start_collect_data instruction from task user to start data collection
-            @param z_pos gets z value from the touchpanel whether there is a contact or not
-            @param x_pos gets x position from the touchpanel
-            @param y_pos gets y position from the touchpanel
-            @param x_vel gets x velocity from the touchpanel
-            @param y_vel gets y velocity from the touchpanel
-            @param theta_x gets theta x position from the platfrom from the IMU
-            @param theta_y gets theta y position from the platfrom from the IMU
-            @param theta_x_velo gets theta x velocity from the platfrom from the IMU
-            @param theta_y_velo gets theta y velocity from the platfrom from the IMU
-        '''
-        
-        #class variables
-        self.state = S0_Init
-        self.runs = 0
-        self.period = period
-        #defines when the task will run again 
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period)
-        
-        
-        #shared variables
-        self.start_collect_data = start_collect_data
-        self.z_pos = z_pos
-        self.x_pos = x_pos
-        self.y_pos = y_pos
-        self.x_vel = x_vel
-        self.y_vel = y_vel
-        self.theta_x = theta_x
-        self.theta_y = theta_y
-        self.theta_x_vel = theta_x_vel
-        self.theta_y_vel = theta_y_vel
-
-        
-        
-    def run(self):
-        ''' @brief          runs one interation of the task
-        '''
-        #checks if it is time to run the task
-        if (utime.ticks_us() >= self.next_time):
-            
-            #initialization state
-            if (self.state == S0_Init):
-                #run state 0
-                
-                
-                #transition to state 1
-                self.state = S1_Update
-                
-            #update state
-            if (self.state == S1_Update):
-                #run state 1
-                
-                                
-                #check shared variables for commands                 
-                #start data collection
-                if (self.start_collect_data.num_in() > 0):
-                    self.start_collect_data.get()
-                    self.stop_time = utime.ticks_add(utime.ticks_ms(), 10000)
-                    #file initialisieren
-                    with open("Data.txt", 'w') as f:
-                                                               
-                        #overwrite the old file if existent 
-                        f.write("")
-        
-                    #array initialisieren
-                    self.array = ["Time[ms], Contact, X_Pos, Y_Pos, X_Vel, Y_Vel, Theta_X, Theta_Y, Theta_X_Vel, Theta_Y_Vel\n"]
-                    self.state = S2_CollectData
-                    
-            
-            if (self.state == S2_CollectData):
-                if ((utime.ticks_diff(self.stop_time, utime.ticks_ms())) > 0):
-                    #write data
-                    self.array.append(str((10000-(utime.ticks_diff(self.stop_time, utime.ticks_ms())))) + ", " + str(self.z_pos.read()) + ", " + str(self.x_pos.read()) + ", " + str(self.y_pos.read()) + ", " + str(self.x_vel.read()) + ", " + str(self.y_vel.read()) + ", " + str(self.theta_x.read()) + ", " + str(self.theta_y.read()) + ", " + str(self.theta_x_vel.read()) + ", " + str(self.theta_y_vel.read()) + "\n")
-               
-                else:
-                    with open("Data.txt", 'a') as f:
-                        for i in self.array:
-                            f.write(i)
-                    self.state = S1_Update
-              
-                    
-
-                
-            #defines the next time the run should run
-            self.next_time = utime.ticks_add(self.next_time, self.period)
\ No newline at end of file
+''' @file                   Term_task_datacollection.py
+    @brief                  with that file data is written to or read from files
+    @details                Responsible for collecting data and storing it in the appropriate format to
+                            either transmit over USB serial to a host PC or to save the data as a file on the Nucleo
+                            The samples are stored as binary records in Data.bin, Term_log_decode.py converts them on the PC.
+			    This is the State diagram we used:
+			    \image html Term_datacollection_SD.png "State Diagram" width=80%
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   November 3, 2021
+'''
+
+import utime
+import shares
+import struct
+from array import array
+
+
+#Define State Variables
+##@brief defines the initialization state
+#
+S0_Init = 0
+##@brief defines the update state to wait for user input
+#
+S1_Update = 1
+##@brief defines the state to collect data
+#
+S2_CollectData = 2
+##@brief defines the state to write the collected data to the file
+#
+S3_WriteFile = 3
+##@brief defines how many bytes are written to the file per run, so the file is written over several runs
+#
+BYTES_PER_RUN = 2048
+
+##@brief duration of one data collection in ms
+#
+DURATION = 10000
+##@brief name of the log file, it is decoded on the PC by Term_log_decode.py
+#
+FILE = "Data.bin"
+##@brief first four bytes of the log file
+#
+MAGIC = b'BBLG'
+##@brief version of the layout of the log file
+#
+VERSION = 1
+##@brief struct format of the header: magic, version, values per sample, number of samples, period in us
+#
+HEADER = '<4sHHII'
+##@brief struct format of one sample: time in ms since the start and the STATE_SIZE values of the state block
+#
+RECORD = '<i9f'
+##@brief struct format of the time at the start of a sample
+#
+TIME = '<i'
+##@brief size of one sample in bytes
+#
+RECORD_SIZE = 40
+
+
+class Task_DataCollection:
+    ''' @brief A Data Collection Task class
+    @details Objects of this class can be used to collect data. Every sample is the time as int32 followed by the
+    bytes of the float32 snapshot of the state block, whose order is the order of the record, copied into a bytearray
+    which is allocated once for the whole collection. Neither the copy nor the small int of the time creates an object,
+    so collecting does not allocate memory.
+    The bytes are written to the file after the collection, BYTES_PER_RUN in every run.
+    '''
+
+    def __init__(self, period, start_collect_data, state_block):
+        ''' @brief creates a object of Task_Motor
+            @param period defines the time until task_datacollection will run again
+            @param start_collect_data instruction from task user to start data collection
+            @param state_block shared StateBlock with the positions and velocities from the touchpanel and the angles and velocities of the platform from the IMU
+        '''
+        
+        #class variables
+        self.state = S0_Init
+        self.runs = 0
+        self.period = period
+        #snapshot of the state block
+        self.values = array('f', [0] * shares.STATE_SIZE)
+        try:
+            #CPython only copies memoryviews of the same format
+            self.values_bytes = memoryview(self.values).cast('B')
+        except AttributeError:
+            self.values_bytes = memoryview(self.values)
+        #samples of one collection, the number of collected samples and the number of bytes written to the file
+        self.capacity = DURATION*1000//period + 1
+        self.buffer = bytearray(self.capacity*RECORD_SIZE)
+        self.view = memoryview(self.buffer)
+        self.samples = 0
+        self.written = 0
+        
+        #shared variables
+        self.start_collect_data = start_collect_data
+        self.state_block = state_block
+
+        
+        
+    def run(self):
+        ''' @brief          runs one interation of the task
+        '''
+        
+        #initialization state
+        if (self.state == S0_Init):
+            #run state 0
+            
+            
+            #transition to state 1
+            self.state = S1_Update
+            
+        #update state
+        if (self.state == S1_Update):
+            #run state 1
+            
+                            
+            #check shared variables for commands                 
+            #start data collection
+            if (self.start_collect_data.num_in() > 0):
+                self.start_collect_data.get()
+                self.start_time = utime.ticks_ms()
+                self.stop_time = utime.ticks_add(self.start_time, DURATION)
+                self.samples = 0
+                self.state = S2_CollectData
+                
+        
+        if (self.state == S2_CollectData):
+            now = utime.ticks_ms()
+            if ((utime.ticks_diff(self.stop_time, now)) > 0) and (self.samples < self.capacity):
+                #read consistent snapshots of the touchpanel and IMU values
+                values = self.values
+                self.state_block.read_group(shares.TOUCH, values)
+                self.state_block.read_group(shares.IMU, values)
+                #copy the sample into the buffer, the values are stored in the order of RECORD
+                offset = self.samples*RECORD_SIZE
+                struct.pack_into(TIME, self.buffer, offset, utime.ticks_diff(now, self.start_time))
+                self.view[offset + 4:offset + RECORD_SIZE] = self.values_bytes
+                self.samples += 1
+           
+            else:
+                #overwrite the old file with the header and transition to the next state
+                with open(FILE, 'wb') as f:
+                    f.write(struct.pack(HEADER, MAGIC, VERSION, shares.STATE_SIZE, self.samples, self.period))
+                self.written = 0
+                self.state = S3_WriteFile
+        
+        elif (self.state == S3_WriteFile):
+            #write the next bytes to the file and return to the other tasks
+            size = self.samples*RECORD_SIZE
+            stop = min(self.written + BYTES_PER_RUN, size)
+            if (stop > self.written):
+                with open(FILE, 'ab') as f:
+                    f.write(self.view[self.written:stop])
+            self.written = stop
+            
+            #transition to state 1 if all samples are written
+            if (self.written == size):
+                self.state = S1_Update
\ No newline at end of file
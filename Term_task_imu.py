@@ -1,161 +1,168 @@
-''' @file                   Term_task_imu.py
-    @brief                  This task communicates with the IMU driver.
-    @details                It is reponsible for setting up the IMU object, calibrating it on startup and updating the angles and velocities of
-                            the platform. The calibration are either read from a file if existent or calibrated
-                            manualy and then write to a file, to speed up future startups.
-			    This is the State diagram we used:
-			    \image html Term_imu_SD.png "State Diagram" width=80%
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   December 03, 2021
-'''
-
-import BNO055
-import utime
-import pyb
-import os
-
-
-#Define State Variables
-##@brief defines the initialization state
-#
-S0_Init = 0
-##@brief defines the update state that calls the IMU driver functions to update the data
-#
-S1_Update = 1
-##@brief defines the calibration of the IMU unit
-#
-S2_Calibration = 2
-
-
-class Task_IMU:
-    ''' @brief A IMU Task class
-        @details Objects of this class can be used to read and calibrate the IMU.
-    '''
-
-    def __init__(self, period, get_imu_status, imu_status, theta_y, theta_x, theta_y_vel, theta_x_vel):
-        ''' @brief creates a object of Task_IMU
-            @param period defines the time until task_imu will run again
-            @param get_imu_status queue written by user taks that requests IMU calibration data from this object
-            @param imu_status contains the IMU claibration status
-            @param theta_y angle of the platform tilting around the y achsis
-            @param theta_x angle of the platform tilting around the x achsis
-            @param theta_y_vel angular velocity of theta_y
-            @param theta_x_vel angular velocity of theta_x
-        '''
-        
-        #class variables
-        self.state = S0_Init
-        self.runs = 0
-        self.period = period
-        
-        #defines when the task will run again 
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period)
-        
-        
-        #shared variables
-        self.get_imu_status = get_imu_status
-        self.imu_status = imu_status
-        self.theta_y = theta_y
-        self.theta_x = theta_x
-        self.theta_y_vel = theta_y_vel
-        self.theta_x_vel = theta_x_vel
-        
-    
-        
-    def run(self):
-        ''' @brief Runs the state machine implemented for this task. More information can be found in the finite state machine
-        '''
-        #checks if it is time to run the task
-        if (utime.ticks_us() >= self.next_time):
-            
-            #initialization state
-            if (self.state == S0_Init):
-                #run state 0
-                self.I2C = pyb.I2C(1, pyb.I2C.MASTER)
-                self.IMU = BNO055.BNO055(self.I2C)
-                
-                #change IMU to fusion mode
-                self.IMU.change_operating_mode(12)
-                self.imu_status.write(self.IMU.calibration_status())
-                
-                #trying to read calibration data on startup
-                filename = "IMU_cal_coeffs.txt"
-                if filename in os.listdir():
-                    with open("IMU_cal_coeffs.txt", 'r') as f:
-                        try:
-                            #Read the first line of the file
-                            cal_data_string = f.readline()
-                            #Split the line into multiple strings and then convert each one to a int
-                            cal_values = [int(cal_value) for cal_value in cal_data_string.strip().split(',')]
-                            #write data to IMU
-                            self.IMU.wrt_calibration_coefficient(cal_values)
-                            
-                            
-                            #transition to state 1
-                            self.state = S1_Update
-
-                            
-                        #go to state 2 to overwrite calibration data if they are not readable
-                        except:
-                            self.state = S2_Calibration
-                        
-                #go to state 2 if file doesnt exist     
-                else:
-                    self.state = S2_Calibration
-            
-                #write calibration status to shared variable
-                self.imu_status.write(self.IMU.calibration_status())
-                
-            #update state
-            if (self.state == S1_Update):
-                #run state 1
-                
-                                
-                #check shared variables for commands                 
-                #gets IMU status
-                if (self.get_imu_status.num_in() > 0):
-                    self.get_imu_status.get()
-                    self.imu_status.write(self.IMU.calibration_status())
-                    
-        
-                #Reading angles
-                angles= self.IMU.read_euler_angles()
-                self.theta_x.write(angles[1])
-                self.theta_y.write(angles[2])
-                #Reading velocities
-                velocities= self.IMU.read_angular_velocity()
-                self.theta_x_vel.write(velocities[1])
-                self.theta_y_vel.write(velocities[0])
-                
-                
-                    
-            if (self.state == S2_Calibration):
-                #check shared variables for commands                 
-                #gets IMU status
-                status =  self.IMU.calibration_status()
-                if (self.get_imu_status.num_in() > 0):
-                    self.get_imu_status.get()
-                    self.imu_status.write(status)
-                
-                #checks if accelorometer and gyroscope are calibrated
-                if(status[0] == True and status[1] == True and status[2] == True and status[3] == True):
-                    #if IMU is fully calibrated, write the calibration coefficients to file
-                    with open("IMU_cal_coeffs.txt", 'w') as f:
-                        buffer = bytearray(22)
-                        buffer = self.IMU.ret_calibration_coefficient()
-                        cal_data_string = ""
-                        for b in buffer:
-                            cal_data_string += hex(b) +","
-                            
-                        cal_data_string = cal_data_string[:-1]
-                        
-                        #write the calibration coefficients to the file as a string. 
-                        f.write(cal_data_string)
-
-                        
-                        #change state
-                        self.state = S1_Update
-
-                
-            #defines the next time the run should run
-            self.next_time = utime.ticks_add(self.next_time, self.period)
\ No newline at end of file
+''' @file                   Term_task_imu.py
+    @brief                  This task communicates with the IMU driver.
+    @details                It is reponsible for setting up the IMU object, calibrating it on startup and updating the angles and velocities of
+                            the platform. The calibration are either read from the calibration store if valid or calibrated
+                            manualy and then written to the calibration store, to speed up future startups.
+                            The operating mode of the BNO055 is a parameter. The calibration is finished when the sensors of
+                            this mode are calibrated, e.g. the IMU mode does not wait for the magnetometer.
+                            With the complementary filter the raw angular velocities and accelerations are read and the angles
+                            are estimated on the board, at the period of this task instead of the 10 ms of the fusion.
+			    This is the State diagram we used:
+			    \image html Term_imu_SD.png "State Diagram" width=80%
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 03, 2021
+'''
+
+import BNO055
+import calstore
+import complementary
+import shares
+import pyb
+from array import array
+
+
+#Define State Variables
+##@brief defines the initialization state
+#
+S0_Init = 0
+##@brief defines the update state that calls the IMU driver functions to update the data
+#
+S1_Update = 1
+##@brief defines the calibration of the IMU unit
+#
+S2_Calibration = 2
+
+##@brief time constant of the complementary filter in s, see Term_filter_replay.py
+#
+FILTER_TIME_CONSTANT = 0.5
+##@brief bandwidth of the accelerometer in Hz in the ACCGYRO mode, the output rate is twice the bandwidth
+#
+ACC_BANDWIDTH = 125
+##@brief bandwidth of the gyroscope in Hz in the ACCGYRO mode, the output rate is 400 Hz
+#
+GYR_BANDWIDTH = 47
+
+
+class Task_IMU:
+    ''' @brief A IMU Task class
+        @details Objects of this class can be used to read and calibrate the IMU.
+    '''
+
+    def __init__(self, period, get_imu_status, imu_status, state_block, split_phase=False, mode=BNO055.NDOF, quaternion=False,
+                 complementary_filter=False):
+        ''' @brief creates a object of Task_IMU
+            @param period defines the time until task_imu will run again
+            @param get_imu_status queue written by user taks that requests IMU calibration data from this object
+            @param imu_status contains the IMU claibration status
+            @param state_block shared StateBlock, the task writes the angles of the platform tilting around the x and y achsis and their velocities as group IMU
+            @param split_phase True to read one register group of the motion registers per run and to publish the
+                               sample after the last group, so one run blocks the other tasks only for a part of the
+                               I2C transfer, the task needs a period of the fusion period divided by the number of groups
+            @param mode fusion mode of the BNO055: BNO055.IMU, BNO055.NDOF_FMC_OFF or BNO055.NDOF
+            @param quaternion True to calculate the angles from the quaternion instead of reading the euler registers
+            @param complementary_filter True to estimate the angles with a complementary filter from the raw data, best with
+                                        the mode BNO055.ACCGYRO
+        '''
+        
+        #class variables
+        self.state = S0_Init
+        self.runs = 0
+        self.period = period
+        #values which are written to the state block
+        self.values = array('f', [0] * shares.STATE_SIZE)
+        self.split_phase = split_phase
+        self.mode = mode
+        self.quaternion = quaternion
+        self.filter = complementary.ComplementaryFilter(period/1000000, FILTER_TIME_CONSTANT) if complementary_filter else None
+        
+        #shared variables
+        self.get_imu_status = get_imu_status
+        self.imu_status = imu_status
+        self.state_block = state_block
+        
+    
+        
+    def run(self):
+        ''' @brief Runs the state machine implemented for this task. More information can be found in the finite state machine
+        '''
+        
+        #initialization state
+        if (self.state == S0_Init):
+            #run state 0
+            self.I2C = pyb.I2C(1, pyb.I2C.MASTER)
+            self.IMU = BNO055.BNO055(self.I2C)
+            self.IMU.use_quaternion(self.quaternion)
+            
+            #write the calibration from the calibration store if it is valid, otherwise calibrate manually
+            (flags, touch, imu) = calstore.load()
+            if (flags & calstore.IMU_VALID):
+                self.IMU.set_mode(BNO055.CONFIG)
+                self.IMU.wrt_calibration_coefficient(imu)
+                #transition to state 1
+                self.state = S1_Update
+            elif (BNO055.READY_MASKS[self.mode] == 0):
+                #a mode without fusion needs no calibration
+                self.state = S1_Update
+            else:
+                #go to state 2 if there is no valid calibration
+                self.state = S2_Calibration
+            
+            #the sensor configuration is only used without fusion
+            if (self.mode == BNO055.ACCGYRO):
+                self.IMU.configure_sensors(acc_bandwidth=ACC_BANDWIDTH, gyr_bandwidth=GYR_BANDWIDTH)
+            
+            #change IMU to the operating mode
+            self.IMU.set_mode(self.mode)
+        
+            #write calibration status to shared variable
+            self.imu_status.write(self.IMU.calibration_status())
+            
+        #update state
+        if (self.state == S1_Update):
+            #run state 1
+            
+                            
+            #check shared variables for commands
+            #gets IMU status
+            if (self.get_imu_status.num_in() > 0):
+                self.get_imu_status.get()
+                self.imu_status.write(self.IMU.calibration_status())
+            
+            if (self.filter):
+                #one update of the complementary filter with the raw velocities (0..2) and accelerations (3..5)
+                self.publish(self.filter.update(self.IMU.read_raw()))
+            elif (self.split_phase):
+                #read the next register group, the complete sample is published after the last one
+                if (self.IMU.read_motion_part()):
+                    self.publish(self.IMU.latest_motion())
+            else:
+                #Reading velocities (0..2) and angles (3..5) with one transaction
+                self.publish(self.IMU.read_motion())
+                
+        if (self.state == S2_Calibration):
+            #check shared variables for commands                 
+            #gets IMU status
+            if (self.get_imu_status.num_in() > 0):
+                self.get_imu_status.get()
+                self.imu_status.write(self.IMU.calibration_status())
+            
+            #checks if the sensors of the operating mode are calibrated
+            if (self.IMU.is_ready()):
+                #write the calibration coefficients to the calibration store
+                self.IMU.set_mode(BNO055.CONFIG)
+                calstore.update_imu(self.IMU.ret_calibration_coefficient())
+                self.IMU.set_mode(self.mode)
+                
+                #change state
+                self.state = S1_Update
+    
+    def publish(self, motion):
+        ''' @brief Writes the angles and velocities of the platform to the state block
+            @param motion array with the angular velocities (0..2) and the euler angles (3..5) from the IMU
+        '''
+        values = self.values
+        values[shares.THETA_X] = motion[4]
+        values[shares.THETA_Y] = motion[5]
+        values[shares.THETA_X_VEL] = motion[1]
+        values[shares.THETA_Y_VEL] = motion[0]
+        self.state_block.write_group(shares.IMU, values)
@@ -1,88 +1,150 @@
-''' @file                   Term_task_motor.py
-    @brief                  with that file you can access the motor driver functions
-    @details                Responsible for interfacing with the motors and motor
-                            drivers to deliver the correct PWM signal associated with the actuation values computed in
-                            the controller task using an object of your motor driver class.
-			    This is the state diagram we used:
-			    \image html Term_motor_SD.png "State Diagram" width=80%
-			
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   November 3, 2021
-'''
-
-import motordriver
-import utime
-import pyb
-
-#Define State Variables
-##@brief defines the initialization state
-#
-S0_Init = 0
-##@brief defines the update state to interact with the motor driver functions
-#
-S1_Update = 1
-
-
-
-
-class Task_Motor:
-    ''' @brief A motor task class
-        @details Objects of this class can be used to control the motor.
-        It determines how often it will interact with the motor and sets the duty cycle 
-        It communicates with the task_contoller object and gets the instructions from there
-    '''
-
-    def __init__(self, period, motor_x_set, motor_y_set):
-        ''' @brief creates a object of Task_Motor
-            @param period defines the time until task_motor will run again
-            @param motor_x_set gets the motor torque for the first motor
-            @param motor_y_set gets the motor torque for the second motor
-        '''
-        
-        #class variables
-        self.convert_factor = (100*2.21)/(4*13.8*12)
-        self.state = S0_Init
-        self.runs = 0
-        self.period = period
-        #defines when the task will run again 
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period)
-    
-        #shared variables
-        self.motor_x_set = motor_x_set
-        self.motor_y_set = motor_y_set
-        
-    def run(self):
-        ''' @brief          runs one interation of the task
-        '''
-        #checks if it is time to run the task
-        if (utime.ticks_us() >= self.next_time):
-            
-            #initialization state
-            if (self.state == S0_Init):
-                #run state 0
-                #creates a motor timer
-                self.timer = pyb.Timer(3, freq=20000)
-                #creates motordriver object
-                self.motor_drv = motordriver.DRV8847()
-                #creates motor object 1
-                self.motor_1 = self.motor_drv.motor(pyb.Pin.cpu.B4, pyb.Pin.cpu.B5, 1, 2, 3)
-                #creatse motor object 2
-                self.motor_2 = self.motor_drv.motor(pyb.Pin.cpu.B0, pyb.Pin.cpu.B1, 3, 4, 3)
-                
-                #transition to state 1
-                self.state = S1_Update
-                
-            #update state
-            if (self.state == S1_Update):
-                #run state 1
-                
-                #convert motor torques from controller into duty cycles
-                duty_x = self.convert_factor * self.motor_x_set.read()
-                duty_y = self.convert_factor * self.motor_y_set.read()
-                
-                #set motor speeds
-                self.motor_2.set_duty(-duty_y)
-                self.motor_1.set_duty(duty_x)
-                
-            #defines the next time the run should run
-            self.next_time = utime.ticks_add(self.next_time, self.period)
\ No newline at end of file
+''' @file                   Term_task_motor.py
+    @brief                  with that file you can access the motor driver functions
+    @details                Responsible for interfacing with the motors and motor
+                            drivers to deliver the correct PWM signal associated with the actuation values computed in
+                            the controller task using an object of your motor driver class.
+                            The torque to duty cycle conversion is the scale of the motor objects, a torque is only passed
+                            to the motor if the controller wrote a new one and the motor only writes the timer if the
+                            command changed by more than the deadband.
+                            If the table file of Term_motor_fit.py exists, the motors compensate their static friction and
+                            deadband with it instead of the linear conversion.
+                            A motor fault stops the motors in the nFAULT interrupt of the driver, this task only reports it
+                            in the fault share and clears it when task_user sends a request.
+			    This is the state diagram we used:
+			    \image html Term_motor_SD.png "State Diagram" width=80%
+			
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   November 3, 2021
+'''
+
+import motordriver
+import tablefile
+import pyb
+
+#Define State Variables
+##@brief defines the initialization state
+#
+S0_Init = 0
+##@brief defines the update state to interact with the motor driver functions
+#
+S1_Update = 1
+
+##@brief duty cycle in percent per torque in mNm: (100 % * 2.21 Ohm)/(4 * 13.8 mNm/A * 12 V)
+#
+TORQUE_TO_DUTY = (100*2.21)/(4*13.8*12)
+##@brief largest change of the pulse width in timer ticks which is not written to the timer, 4 ticks are about 0.3 mNm
+#
+DEADBAND = 4
+##@brief table file with the friction compensation of both motors, written by Term_motor_fit.py
+#
+COMPENSATION_FILE = "motor_lut.bin"
+
+
+
+class Task_Motor:
+    ''' @brief A motor task class
+        @details Objects of this class can be used to control the motor.
+        It determines how often it will interact with the motor and sets the duty cycle 
+        It communicates with the task_contoller object and gets the instructions from there
+        The torques are passed to the motors by update(), which run() calls unless the timer driven control path of
+        Term_controlpath.py calls it.
+    '''
+
+    def __init__(self, period, motor_x_set, motor_y_set, clear_fault=None, fault=None, pipelined=False):
+        ''' @brief creates a object of Task_Motor
+            @param period defines the time until task_motor will run again
+            @param motor_x_set gets the motor torque for the first motor
+            @param motor_y_set gets the motor torque for the second motor
+            @param clear_fault optional queue written by task_user to clear a fault of the motor driver
+            @param fault optional share which is True while a fault of the motor driver stops the motors
+            @param pipelined True if the control path calls update(), then run() only handles the faults
+        '''
+        
+        #class variables
+        self.state = S0_Init
+        self.runs = 0
+        self.period = period
+        self.pipelined = pipelined
+    
+        #shared variables
+        self.motor_x_set = motor_x_set
+        self.motor_y_set = motor_y_set
+        self.clear_fault = clear_fault
+        self.fault = fault
+        #sequence numbers of the last torques passed to the motors
+        self.seq_x = 0
+        self.seq_y = 0
+        
+    def run(self):
+        ''' @brief          runs one interation of the task
+        '''
+        
+        #initialization state
+        if (self.state == S0_Init):
+            #run state 0
+            #creates a motor timer
+            self.timer = pyb.Timer(3, freq=20000)
+            #creates motordriver object with nSLEEP on A15 and nFAULT on B2
+            self.motor_drv = motordriver.DRV8847(pyb.Pin.cpu.A15, pyb.Pin.cpu.B2)
+            #creates motor object 1, its duty cycle is the torque of the x-axis
+            self.motor_1 = self.motor_drv.motor(pyb.Pin.cpu.B4, pyb.Pin.cpu.B5, 1, 2, self.timer, TORQUE_TO_DUTY, DEADBAND)
+            #creatse motor object 2, it turns the other way for a positive torque of the y-axis
+            self.motor_2 = self.motor_drv.motor(pyb.Pin.cpu.B0, pyb.Pin.cpu.B1, 3, 4, self.timer, -TORQUE_TO_DUTY, DEADBAND)
+            #replaces the linear conversion by the friction compensation if it was fitted
+            self.load_compensation(COMPENSATION_FILE)
+            #wakes the driver up
+            self.motor_drv.enable()
+            
+            #transition to state 1
+            self.state = S1_Update
+            
+        #update state
+        if (self.state == S1_Update):
+            #run state 1
+            
+            #clear a fault of the motor driver on request of task_user
+            if (self.clear_fault is not None) and (self.clear_fault.num_in() > 0):
+                self.clear_fault.get()
+                if (self.motor_drv.faulted):
+                    self.motor_drv.clear_fault()
+            
+            #report a fault which the interrupt has latched
+            if (self.fault is not None) and (self.fault.read() != self.motor_drv.faulted):
+                self.fault.write(self.motor_drv.faulted)
+            
+            #pass the torques to the motors, unless the control path does it
+            if not (self.pipelined):
+                self.update()
+    
+    def update(self):
+        ''' @brief passes new motor torques from the controller to the motors
+            @details Only runs in state 1, after the motors were created. It only uses the torque shares and the motors,
+                     so the control path can call it between any two bytecodes of run().
+        '''
+        if (self.state != S1_Update):
+            return
+        if (self.motor_y_set.new_since(self.seq_y)):
+            self.seq_y = self.motor_y_set.seq()
+            self.motor_2.set_duty(self.motor_y_set.read())
+        if (self.motor_x_set.new_since(self.seq_x)):
+            self.seq_x = self.motor_x_set.seq()
+            self.motor_1.set_duty(self.motor_x_set.read())
+    
+    def load_compensation(self, filename):
+        ''' @brief Loads the friction compensation of both motors from a table file
+            @details The first row holds the torque step and the smallest applied torque in mNm, the next rows the duty
+                     cycles of motor 1 in the positive and the negative direction and of motor 2 in the positive and the
+                     negative direction. If the file is missing, has another shape or a step or smallest torque which is not
+                     positive, the linear conversion is kept.
+            @param filename name of the table file
+            @return True if the compensation was loaded
+        '''
+        try:
+            (rows, cols, table) = tablefile.load(filename)
+        except (OSError, ValueError):
+            return False
+        if (rows != 5) or (cols < 2) or (table[0] <= 0) or (table[1] <= 0):
+            return False
+        self.motor_1.set_compensation(table[0], table[1], table[cols:2*cols], table[2*cols:3*cols])
+        self.motor_2.set_compensation(table[0], table[1], table[3*cols:4*cols], table[4*cols:5*cols])
+        return True
@@ -1,243 +1,394 @@
-''' @file                   Term_task_user.py
-    @brief                  with that file you can access the user interface functions
-    @details                Responsible for interaction between the user and the program. This interface
-                            include commands that allow the user to begin balancing, stop the balancing, start the
-                            data collection, calibrate the touchpanel or get the imu-status.
-			    This is the State diagram we used:
-			    \image html Term_user_SD.png "State Diagram" width=80%
-    @author                 Sebastian Boessl, Johannes Frisch
-    @date                   November 30, 2021
-
-'''
-
-import utime
-import pyb
-
-#Define State Variables
-S0_Init = 0
-S1_PrintUI = 1
-S2_WaitForInput = 2
-S3_BeginBalancing = 3
-S4_StopBalancing = 4
-S5_GetIMUStatus = 5
-S6_ClearFault = 6
-S7_CalibrateTouchpanel = 7
-S8_StartDataCollection = 8
-
-
-class Task_User:
-    ''' @brief a class to create a User_Task
-        @details a way to interact with the user. Prints out statements for the user and reads the user input. 
-    '''
-    def __init__(self, period, calibrate_touchpanel, get_imu_status, begin_balancing, stop_balancing, start_data_collection, imu_status, UserInputTouch, CalibrationFinished, getUserInputTouch, PointFinished):
-        ''' @brief Constructs an Task_user object
-            @param period defines the next time the task is going to run
-            @param calibrate_touchpanel Sends instruction from task_user to task_touchpanel to start the calibration of the touchpanel
-            @param get_imu_status Sends instruction from task_user to task_imu to get the imu calibration status
-            @param begin_balancing Sends instruction from task_user to task_controller to start balancing the ball
-            @param stop_balancing Sends instruction from task_user to task_controller to stop balancing the ball
-            @param start_data_collection Sends instruction from task_user to task_data_collection to start collecting data
-            @param imu_status share value of the imu status
-            @param UserInputTouch
-            @param CalibrationFinished sends instruction from task_touchpanel to task_user to print that the calibration is finished
-            @param getUserInputTouch sends instruction from task_touchpanel to task_user to print instructions
-            @param PointFinished sends instruction from task_touchpanel to task_user to print that one point is calibrated
-        '''
-        #class variables
-        #defines current state
-        self.state = S0_Init            
-        #counts the number of iterations                                
-        self.runs = 0          
-        #defines the next time the task is going to run                                         
-        self.period = period 
-        #defines the next time the task is going to run                                          
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period) 
-        
-        #initalizes shared variables
-        self.calibrate_touchpanel = calibrate_touchpanel
-        self.get_imu_status = get_imu_status
-        self.begin_balancing = begin_balancing
-        self.stop_balancing = stop_balancing
-        self.start_data_collection = start_data_collection
-        self.imu_status = imu_status
-        self.UserInputTouch = UserInputTouch
-        self.CalibrationFinished = CalibrationFinished
-        self.getUserInputTouch = getUserInputTouch
-        self.PointFinished = PointFinished
-    
-    def run(self):
-        ''' @brief          runs one interation of the task
-        '''
-        #checks if it is time to run the task
-        if (utime.ticks_us() >= self.next_time):                        
-            
-            #checks the current state
-            if (self.state == S0_Init):                                 
-                #run state 0
-                #creates a serport object
-                self.serport = pyb.USB_VCP()                            
-                #transition to state 1
-                self.state = S1_PrintUI
-                
-            #checks the current state
-            if (self.state == S1_PrintUI):                              
-                #run state 1               
-                #print User Interface
-                print('-------------------------------------------------------------------------------------------')
-                print("\n\nChoose one of the following commands:\n")
-                print("'b'\tBegin balancing of the platform")
-                print("'s'\tStop balancing of the platform")
-                print("'d'\tCollect position and velocity data of the platform and the ball")
-                print("'t'\tCalibrate touchpanel")
-                print("'i'\tDisplay IMU Status")
-                print('-------------------------------------------------------------------------------------------')
-                
-                #transition to the next state
-                self.state = S2_WaitForInput
-                print('----------------------------------------------------')
-                print('Wait for user input...')
-                print('----------------------------------------------------')
-                        
-            #checks if it is time to run the task
-            if (self.state == S3_BeginBalancing):                         
-                #run state 3
-                
-                #send instruction to task_controller to start the ball balancing process
-                self.begin_balancing.put(1)   
-                
-                #transition to the next state
-                self.state = S2_WaitForInput
-                print('----------------------------------------------------')
-                print('Wait for user input...')
-                print('----------------------------------------------------')
-            
-            #checks if it is time to run the task
-            if (self.state == S4_StopBalancing):                         
-                #run state 4
-                
-                #send instruction to task_controller to stop the ball balancing process
-                self.stop_balancing.put(1)   
-                
-                #transition to the next state
-                self.state = S2_WaitForInput
-                print('----------------------------------------------------')
-                print('Wait for user input...')
-                print('----------------------------------------------------')
-            
-            #checks if it is time to run the task
-            if (self.state == S5_GetIMUStatus):                         
-                #run state 5
-                #prints the status of the IMU
-                status = self.imu_status.read()
-                print('Calibration Status is: Magnetometer: ', status[0],',', 'Acceloremeter: ', status[1], ',',  'Gyroscope: ', status[2], 'System: ', status[3])
-
-                #transition to the next state
-                self.state = S2_WaitForInput
-                print('----------------------------------------------------')
-                print('Wait for user input...')
-                print('----------------------------------------------------')
-            
-            #checks if it is time to run the task
-            if (self.state == S7_CalibrateTouchpanel):                         
-                #run state 7     
-                #checks if it should print instructions
-                if(self.getUserInputTouch.num_in() > 0):
-                    self.getUserInputTouch.get()
-                    print('----------------------------------------------------')
-                    print('Calibration of Touchpanel')
-                    print('Touch first point and press g one time and wait until you get a verfication that the point is calibrated.')
-                    print('Then continue doing that for 9 points total.')
-                    print('----------------------------------------------------')
-                    
-                #checks user input
-                if (self.serport.any()):                    
-                    #read input            
-                    self.user_in = self.serport.read(1)                 
-                    #checks if the user input is equal to g
-                    if (self.user_in.decode() == 'g'):   
-                        #send instruction to task_touchpanel to get the first point
-                        self.UserInputTouch.put(1)      
-                
-                #checks if point is calibrated
-                if(self.PointFinished.num_in() > 0):
-                    self.PointFinished.get()
-                    print('----------------------------------------------------')
-                    print("Point calibrated")
-                    print('----------------------------------------------------')
-                
-                #checks if calibration is finished
-                if(self.CalibrationFinished.num_in() > 0):
-                    self.CalibrationFinished.get()
-                    #print verification
-                    print('----------------------------------------------------')
-                    print("Calibration is finished.")
-                    print('----------------------------------------------------')
-                    #change state
-                    self.state = S2_WaitForInput
-                    print('----------------------------------------------------')
-                    print('Wait for user input...')
-                    print('----------------------------------------------------')
-                            
-            #checks if it is time to run the task
-            if (self.state == S8_StartDataCollection):                         
-                #run state 8
-                            
-                #send instruction to task_touchpanel to start the data collection
-                self.start_data_collection.put(1)   
-                
-                #transition to the next state
-                self.state = S2_WaitForInput
-                print('----------------------------------------------------')
-                print('Wait for user input...')
-                print('----------------------------------------------------')
-                
-            #checks if it is time to run the task
-            if (self.state == S2_WaitForInput):                         
-                #run state 2
-                #checks if the user put in something and checks what the input was
-                self.check_user_input()  
-
-            
-    def check_user_input(self):
-        ''' @brief      Checks if and what letter the user entered
-        '''
-        #checks if there is a user input
-        if (self.serport.any()):                    
-            #read input            
-            self.user_in = self.serport.read(1)                 
-            #checks if the user input is equal to b
-            if (self.user_in.decode() == 'b'):                  
-                #transition to state 3 - begin balancing of the platform  
-                self.state = S3_BeginBalancing
-                self.user_in = ' '
-            #checks if the user input is equal to s     
-            elif (self.user_in.decode() == 's'):                
-                #transition to state 4 - stop balancing of the platform
-                self.state = S4_StopBalancing
-                self.user_in = ' '
-            #checks if the user input is equal to i
-            elif (self.user_in.decode() == 'i'):                
-                #transition to state 5 - get the status of the IMU
-                self.state = S5_GetIMUStatus
-                self.user_in = ' '
-                #send instruction to task_imu to get the IMU status
-                self.get_imu_status.put(1) 
-            #checks if the user input is equal to t
-            elif (self.user_in.decode() == 't'):                
-                #transition to state 7 - start calibration of touchpanel
-                self.state = S7_CalibrateTouchpanel
-                self.user_in = ' '
-                #send instruction to task_touchpanel to calibrate the touchpanel
-                self.calibrate_touchpanel.put(1) 
-            #checks if the user input is equal to d
-            elif (self.user_in.decode() == 'd'):                
-            #transition to state 8 - start data collection process
-                self.state = S8_StartDataCollection
-                self.user_in = ' '
-            
-            else:
-                print('----------------------------------------------------')
-                print('Unknown user input: Try again')
-                print('----------------------------------------------------')
-                
+''' @file                   Term_task_user.py
+    @brief                  with that file you can access the user interface functions
+    @details                Responsible for interaction between the user and the program. This interface
+                            include commands that allow the user to begin balancing, stop the balancing, start the
+                            data collection, calibrate the touchpanel, get the imu-status or select the trajectory of the ball.
+			    This is the State diagram we used:
+			    \image html Term_user_SD.png "State Diagram" width=80%
+    @author                 Sebastian Boessl, Johannes Frisch
+    @date                   November 30, 2021
+
+'''
+
+import pyb
+
+#Define State Variables
+S0_Init = 0
+S1_PrintUI = 1
+S2_WaitForInput = 2
+S3_BeginBalancing = 3
+S4_StopBalancing = 4
+S5_GetIMUStatus = 5
+S6_ClearFault = 6
+S7_CalibrateTouchpanel = 7
+S8_StartDataCollection = 8
+S9_PrintTaskStats = 9
+S10_SelectTrajectory = 10
+S11_SelectController = 11
+S12_ToggleTaskStats = 12
+##@brief defines the state to wait until task_controller reports the controller it uses
+#
+S13_WaitForController = 13
+
+##@brief names of the reference trajectories of task_controller, in the order of its TRAJECTORY_FILES
+#
+TRAJECTORY_NAMES = ('center', 'circle', 'figure eight', 'steps')
+##@brief names of the controllers of task_controller
+#
+CONTROLLER_NAMES = ('state feedback', 'explicit MPC')
+
+
+class Task_User:
+    ''' @brief a class to create a User_Task
+        @details a way to interact with the user. Prints out statements for the user and reads the user input. 
+    '''
+    def __init__(self, period, calibrate_touchpanel, get_imu_status, begin_balancing, stop_balancing, start_data_collection, imu_status, UserInputTouch, CalibrationFinished, getUserInputTouch, PointFinished, task_stats, select_trajectory, select_controller, clear_fault, fault, controller_selected):
+        ''' @brief Constructs an Task_user object
+            @param period defines the next time the task is going to run
+            @param calibrate_touchpanel Sends instruction from task_user to task_touchpanel to start the calibration of the touchpanel
+            @param get_imu_status Sends instruction from task_user to task_imu to get the imu calibration status
+            @param begin_balancing Sends instruction from task_user to task_controller to start balancing the ball
+            @param stop_balancing Sends instruction from task_user to task_controller to stop balancing the ball
+            @param start_data_collection Sends instruction from task_user to task_data_collection to start collecting data
+            @param imu_status share value of the imu status
+            @param UserInputTouch
+            @param CalibrationFinished sends instruction from task_touchpanel to task_user to print that the calibration is finished
+            @param getUserInputTouch sends instruction from task_touchpanel to task_user to print instructions
+            @param PointFinished sends instruction from task_touchpanel to task_user to print that one point is calibrated
+            @param task_stats TaskStats object with the run time statistics of all tasks
+            @param select_trajectory Sends the index of the reference trajectory from task_user to task_controller
+            @param select_controller Sends the index of the controller from task_user to task_controller
+            @param clear_fault Sends instruction from task_user to task_motor to clear a fault of the motor driver
+            @param fault share which is True while a fault of the motor driver stops the motors
+            @param controller_selected sends the index of the controller which is used from task_controller to task_user
+        '''
+        #class variables
+        #defines current state
+        self.state = S0_Init            
+        #counts the number of iterations                                
+        self.runs = 0          
+        #defines the next time the task is going to run                                         
+        self.period = period 
+        #index of the selected reference trajectory
+        self.trajectory = 0
+        #index of the selected controller
+        self.controller = 0
+        #True if the current fault of the motor driver was printed
+        self.fault_shown = False
+        
+        #initalizes shared variables
+        self.calibrate_touchpanel = calibrate_touchpanel
+        self.get_imu_status = get_imu_status
+        self.begin_balancing = begin_balancing
+        self.stop_balancing = stop_balancing
+        self.start_data_collection = start_data_collection
+        self.imu_status = imu_status
+        self.UserInputTouch = UserInputTouch
+        self.CalibrationFinished = CalibrationFinished
+        self.getUserInputTouch = getUserInputTouch
+        self.PointFinished = PointFinished
+        self.task_stats = task_stats
+        self.select_trajectory = select_trajectory
+        self.select_controller = select_controller
+        self.clear_fault = clear_fault
+        self.fault = fault
+        self.controller_selected = controller_selected
+    
+    def run(self):
+        ''' @brief          runs one interation of the task
+        '''
+        
+        #checks the current state
+        if (self.state == S0_Init):                                 
+            #run state 0
+            #creates a serport object
+            self.serport = pyb.USB_VCP()                            
+            #transition to state 1
+            self.state = S1_PrintUI
+            
+        #checks the current state
+        if (self.state == S1_PrintUI):                              
+            #run state 1               
+            #print User Interface
+            print('-------------------------------------------------------------------------------------------')
+            print("\n\nChoose one of the following commands:\n")
+            print("'b'\tBegin balancing of the platform")
+            print("'s'\tStop balancing of the platform")
+            print("'d'\tCollect position and velocity data of the platform and the ball")
+            print("'t'\tCalibrate touchpanel")
+            print("'i'\tDisplay IMU Status")
+            print("'p'\tDisplay task run time statistics")
+            print("'o'\tSwitch the task run time statistics on or off, switching them on resets them")
+            print("'r'\tSelect the next reference trajectory of the ball, it is used from the next balancing")
+            print("'m'\tSwitch between state feedback and explicit MPC")
+            print("'c'\tClear a fault of the motor driver")
+            print('-------------------------------------------------------------------------------------------')
+            
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+                    
+        #checks if it is time to run the task
+        if (self.state == S3_BeginBalancing):                         
+            #run state 3
+            
+            #send instruction to task_controller to start the ball balancing process
+            self.begin_balancing.put(1)   
+            
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+        
+        #checks if it is time to run the task
+        if (self.state == S4_StopBalancing):                         
+            #run state 4
+            
+            #send instruction to task_controller to stop the ball balancing process
+            self.stop_balancing.put(1)   
+            
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+        
+        #checks if it is time to run the task
+        if (self.state == S5_GetIMUStatus):                         
+            #run state 5
+            #prints the status of the IMU
+            status = self.imu_status.read()
+            print('Calibration Status is: Magnetometer: ', status[0],',', 'Acceloremeter: ', status[1], ',',  'Gyroscope: ', status[2], 'System: ', status[3])
+
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+        
+        #checks if it is time to run the task
+        if (self.state == S6_ClearFault):                         
+            #run state 6
+            #send instruction to task_motor to clear the fault of the motor driver
+            self.clear_fault.put(1)
+            print('Clearing the fault of the motor driver')
+
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+        
+        #checks if it is time to run the task
+        if (self.state == S9_PrintTaskStats):                         
+            #run state 9
+            #prints the run time statistics of all tasks
+            self.task_stats.print_table()
+
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+        
+        #checks if it is time to run the task
+        if (self.state == S12_ToggleTaskStats):                         
+            #run state 12
+            #switches the statistics on with cleared values or off
+            if (self.task_stats.enabled):
+                self.task_stats.enabled = False
+                print('Task statistics: off')
+            else:
+                self.task_stats.reset()
+                self.task_stats.enabled = True
+                print('Task statistics: on')
+
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+        
+        #checks if it is time to run the task
+        if (self.state == S7_CalibrateTouchpanel):                         
+            #run state 7     
+            #checks if it should print instructions
+            if(self.getUserInputTouch.num_in() > 0):
+                self.getUserInputTouch.get()
+                print('----------------------------------------------------')
+                print('Calibration of Touchpanel')
+                print('Touch first point and press g one time and wait until you get a verfication that the point is calibrated.')
+                print('Then continue doing that for 9 points total.')
+                print('----------------------------------------------------')
+                
+            #checks user input
+            if (self.serport.any()):                    
+                #read input            
+                self.user_in = self.serport.read(1)                 
+                #checks if the user input is equal to g
+                if (self.user_in.decode() == 'g'):   
+                    #send instruction to task_touchpanel to get the first point
+                    self.UserInputTouch.put(1)      
+            
+            #checks if point is calibrated
+            if(self.PointFinished.num_in() > 0):
+                self.PointFinished.get()
+                print('----------------------------------------------------')
+                print("Point calibrated")
+                print('----------------------------------------------------')
+            
+            #checks if calibration is finished
+            if(self.CalibrationFinished.num_in() > 0):
+                self.CalibrationFinished.get()
+                #print verification
+                print('----------------------------------------------------')
+                print("Calibration is finished.")
+                print('----------------------------------------------------')
+                #change state
+                self.state = S2_WaitForInput
+                print('----------------------------------------------------')
+                print('Wait for user input...')
+                print('----------------------------------------------------')
+                        
+        #checks if it is time to run the task
+        if (self.state == S8_StartDataCollection):                         
+            #run state 8
+                        
+            #send instruction to task_touchpanel to start the data collection
+            self.start_data_collection.put(1)   
+            
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+            
+        #checks if it is time to run the task
+        if (self.state == S10_SelectTrajectory):                         
+            #run state 10
+            #selects the next trajectory and sends it to task_controller
+            self.trajectory = (self.trajectory + 1) % len(TRAJECTORY_NAMES)
+            self.select_trajectory.put(self.trajectory)
+            print('Trajectory: ' + TRAJECTORY_NAMES[self.trajectory])
+
+            #transition to the next state
+            self.state = S2_WaitForInput
+            print('----------------------------------------------------')
+            print('Wait for user input...')
+            print('----------------------------------------------------')
+            
+        #checks if it is time to run the task
+        if (self.state == S11_SelectController):                         
+            #run state 11
+            #selects the other controller and sends it to task_controller
+            self.select_controller.put((self.controller + 1) % len(CONTROLLER_NAMES))
+
+            #transition to state 13 - wait for the controller which task_controller uses
+            self.state = S13_WaitForController
+            
+        #checks if it is time to run the task
+        if (self.state == S13_WaitForController):                         
+            #run state 13
+            #prints the controller which is used, the explicit MPC is only used if its table was loaded
+            if (self.controller_selected.num_in() > 0):
+                selected = (self.controller + 1) % len(CONTROLLER_NAMES)
+                self.controller = self.controller_selected.get()
+                if (self.controller == selected):
+                    print('Controller: ' + CONTROLLER_NAMES[self.controller])
+                else:
+                    print(CONTROLLER_NAMES[selected] + ' is not loaded, controller: ' + CONTROLLER_NAMES[self.controller])
+
+                #transition to the next state
+                self.state = S2_WaitForInput
+                print('----------------------------------------------------')
+                print('Wait for user input...')
+                print('----------------------------------------------------')
+            
+        #prints a new fault of the motor driver once
+        if (self.fault.read()) and (not self.fault_shown):
+            print('----------------------------------------------------')
+            print("Motor fault: the motors are stopped, press 'c' to clear it")
+            print('----------------------------------------------------')
+            self.fault_shown = True
+        elif (not self.fault.read()) and (self.fault_shown):
+            print('Motor fault cleared')
+            self.fault_shown = False
+            
+        #checks if it is time to run the task
+        if (self.state == S2_WaitForInput):                         
+            #run state 2
+            #checks if the user put in something and checks what the input was
+            self.check_user_input()  
+
+        
+    def check_user_input(self):
+        ''' @brief      Checks if and what letter the user entered
+        '''
+        #checks if there is a user input
+        if (self.serport.any()):                    
+            #read input            
+            self.user_in = self.serport.read(1)                 
+            #checks if the user input is equal to b
+            if (self.user_in.decode() == 'b'):                  
+                #transition to state 3 - begin balancing of the platform  
+                self.state = S3_BeginBalancing
+                self.user_in = ' '
+            #checks if the user input is equal to s     
+            elif (self.user_in.decode() == 's'):                
+                #transition to state 4 - stop balancing of the platform
+                self.state = S4_StopBalancing
+                self.user_in = ' '
+            #checks if the user input is equal to i
+            elif (self.user_in.decode() == 'i'):                
+                #transition to state 5 - get the status of the IMU
+                self.state = S5_GetIMUStatus
+                self.user_in = ' '
+                #send instruction to task_imu to get the IMU status
+                self.get_imu_status.put(1) 
+            #checks if the user input is equal to t
+            elif (self.user_in.decode() == 't'):                
+                #transition to state 7 - start calibration of touchpanel
+                self.state = S7_CalibrateTouchpanel
+                self.user_in = ' '
+                #send instruction to task_touchpanel to calibrate the touchpanel
+                self.calibrate_touchpanel.put(1) 
+            #checks if the user input is equal to d
+            elif (self.user_in.decode() == 'd'):                
+            #transition to state 8 - start data collection process
+                self.state = S8_StartDataCollection
+                self.user_in = ' '
+            #checks if the user input is equal to p
+            elif (self.user_in.decode() == 'p'):                
+                #transition to state 9 - print the task statistics
+                self.state = S9_PrintTaskStats
+                self.user_in = ' '
+            #checks if the user input is equal to o
+            elif (self.user_in.decode() == 'o'):                
+                #transition to state 12 - switch the task statistics on or off
+                self.state = S12_ToggleTaskStats
+                self.user_in = ' '
+            #checks if the user input is equal to r
+            elif (self.user_in.decode() == 'r'):                
+                #transition to state 10 - select the next reference trajectory
+                self.state = S10_SelectTrajectory
+                self.user_in = ' '
+            #checks if the user input is equal to m
+            elif (self.user_in.decode() == 'm'):                
+                #transition to state 11 - select the other controller
+                self.state = S11_SelectController
+                self.user_in = ' '
+            #checks if the user input is equal to c
+            elif (self.user_in.decode() == 'c'):                
+                #transition to state 6 - clear the fault of the motor driver
+                self.state = S6_ClearFault
+                self.user_in = ' '
+            
+            else:
+                print('----------------------------------------------------')
+                print('Unknown user input: Try again')
+                print('----------------------------------------------------')
+                
                 
\ No newline at end of file
@@ -0,0 +1,139 @@
+''' @file                   Term_taskstats.py
+    @brief                  Execution time and overrun statistics for the tasks
+    @details                Collects for every task the minimum, maximum and mean run time, a histogram of the lateness with fixed
+                            bins, the number of missed deadlines and the worst lateness. All storage is allocated in the constructor so
+                            recording a run does not allocate. The statistics are filled by the scheduler and printed as a compact
+                            table by Task_User together with the share of time in which no task was running.
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 7, 2021
+'''
+
+import utime
+from array import array
+
+
+class TaskStats:
+    ''' @brief A task statistics class
+        @details Objects of this class store the timing statistics of up to max_tasks tasks in preallocated arrays.
+                 A run counts as a missed deadline if it finishes later than one period after its release time.
+                 The lateness of a run is the time between its release time and the start of the run.
+                 While enabled is False the scheduler does not record anything, so switching the statistics off costs one
+                 attribute check per run.
+    '''
+
+    def __init__(self, max_tasks, bins=10, bin_width=250):
+        ''' @brief Constructs a task statistics object
+            @param max_tasks maximum number of tasks which can be recorded
+            @param bins number of bins of the lateness histogram, the last bin collects all later runs
+            @param bin_width width of one histogram bin in us
+        '''
+        #class variables
+        self.enabled = True
+        self.max_tasks = max_tasks
+        self.bins = bins
+        self.bin_width = bin_width
+        self.names = [''] * max_tasks
+        self.runs = array('L', [0] * max_tasks)
+        self.min_time = array('l', [0] * max_tasks)
+        self.max_time = array('l', [0] * max_tasks)
+        self.sum_time = array('L', [0] * max_tasks)
+        self.sum_runs = array('L', [0] * max_tasks)
+        self.missed = array('L', [0] * max_tasks)
+        self.worst_late = array('l', [0] * max_tasks)
+        self.histogram = array('L', [0] * (max_tasks * bins))
+        self.reset()
+
+    def set_name(self, task, name):
+        ''' @brief Sets the name which is printed for a task
+            @param task index of the task
+            @param name short name of the task
+        '''
+        self.names[task] = name
+
+    def reset(self):
+        ''' @brief Clears the statistics of all tasks
+        '''
+        for i in range(self.max_tasks):
+            self.runs[i] = 0
+            self.min_time[i] = 0x3FFFFFFF
+            self.max_time[i] = 0
+            self.sum_time[i] = 0
+            self.sum_runs[i] = 0
+            self.missed[i] = 0
+            self.worst_late[i] = 0
+        for i in range(self.max_tasks * self.bins):
+            self.histogram[i] = 0
+        #ticks_ms wraps after 2^30 ms instead of 2^30 us, so the idle time stays valid for days
+        self.start_time = utime.ticks_ms()
+
+    def record(self, task, release, start, end, period):
+        ''' @brief Records one run of a task
+            @param task index of the task
+            @param release time in us when the task was due
+            @param start time in us when the run started
+            @param end time in us when the run ended
+            @param period period of the task in us
+        '''
+        run_time = utime.ticks_diff(end, start)
+        late = utime.ticks_diff(start, release)
+
+        self.runs[task] += 1
+        if (run_time < self.min_time[task]):
+            self.min_time[task] = run_time
+        if (run_time > self.max_time[task]):
+            self.max_time[task] = run_time
+        if (late > self.worst_late[task]):
+            self.worst_late[task] = late
+        if (utime.ticks_diff(end, release) > period):
+            self.missed[task] += 1
+
+        #halve the sums before they leave the small int range, the mean stays the same
+        if (self.sum_time[task] > 0x1FFFFFFF):
+            self.sum_time[task] >>= 1
+            self.sum_runs[task] >>= 1
+        self.sum_time[task] += run_time
+        self.sum_runs[task] += 1
+
+        #sort the lateness into the histogram
+        bin_index = late // self.bin_width
+        if (bin_index < 0):
+            bin_index = 0
+        if (bin_index >= self.bins):
+            bin_index = self.bins - 1
+        self.histogram[task * self.bins + bin_index] += 1
+
+    def mean_time(self, task):
+        ''' @brief Calculates the mean run time of a task
+            @param task index of the task
+            @return mean run time in us
+        '''
+        if (self.sum_runs[task] == 0):
+            return 0
+        return self.sum_time[task] // self.sum_runs[task]
+
+    def idle_percent(self):
+        ''' @brief Estimates the share of time in which no task was running since the last reset
+            @return idle time in percent
+        '''
+        elapsed = 1000 * utime.ticks_diff(utime.ticks_ms(), self.start_time)
+        if (elapsed <= 0):
+            return 100
+        busy = 0
+        for i in range(self.max_tasks):
+            busy += self.mean_time(i) * self.runs[i]
+        return 100 - 100 * busy // elapsed
+
+    def print_table(self):
+        ''' @brief Prints the statistics of all tasks as a compact table
+            @details Times are in us. The histogram columns count the runs per bin of bin_width us of lateness.
+        '''
+        if not (self.enabled):
+            print('task statistics are off')
+            return
+        print('{:<15}{:>8}{:>7}{:>7}{:>7}{:>7}{:>7}  late hist [{} us bins]'.format('task', 'runs', 'min', 'mean', 'max', 'late', 'miss', self.bin_width))
+        for i in range(self.max_tasks):
+            if (self.runs[i] == 0):
+                continue
+            hist = ' '.join(str(self.histogram[i * self.bins + b]) for b in range(self.bins))
+            print('{:<15}{:>8}{:>7}{:>7}{:>7}{:>7}{:>7}  {}'.format(self.names[i], self.runs[i], self.min_time[i], self.mean_time(i), self.max_time[i], self.worst_late[i], self.missed[i], hist))
+        print('idle: {} %'.format(self.idle_percent()))
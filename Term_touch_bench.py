@@ -0,0 +1,377 @@
+''' @file                   Term_touch_bench.py
+    @brief                  Host benchmark of the touchpanel driver
+    @details                Runs on the PC, not on the board. The touchpanel driver is imported with a fake pyb module which
+                            counts the calls of Pin.init(), Pin.value(), pyb.ADC() and ADC.read(). The time of a scan on the
+                            board is estimated from these counts with costs per call. The default costs are chosen so that
+                            all_scan() gives the measured baseline of 1239us, they can be replaced by measurements on the board.
+                            A fake clock advances by these costs and ADC.read_timed() advances it by the time of the burst.
+                            With --noise the oversampling of the driver is benchmarked: the fake ADC.read_timed() fills the
+                            bursts with synthetic ADC values (noise and spikes) or with recorded raw values and the fast scan
+                            of the driver runs with every fixed burst size and with the adaptive burst size for every time
+                            budget. The mean burst size, the variance of the position and the time of the fast scan on the
+                            fake clock are printed for both reductions.
+                            With --affine the raw ADC values are generated from a known affine map of the positions with
+                            cross-coupling. The nine calibration points are scanned and calibrated like in Task_Touchpanel,
+                            then the fast scan has to recover random known positions. The error of the separate calculations
+                            which Task_Touchpanel used before the affine transform is printed for the same data, and the cost
+                            of both calculations per scan.
+
+                            Example: python Term_touch_bench.py --scans 100
+                                     python Term_touch_bench.py --noise --data raw_x.txt --budgets 1000,1500
+                                     python Term_touch_bench.py --affine
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 16, 2021
+'''
+
+import argparse
+import itertools
+import sys
+import time
+import types
+from array import array
+import numpy as np
+
+
+## @brief measured time of all_scan() on the board in us
+#
+BASELINE_US = 1239.0
+
+## @brief assumed costs per call in us, they reproduce the baseline
+#
+COSTS_US = {'Pin.init': 37.5, 'Pin.value': 5.0, 'ADC': 233.0, 'ADC.read': 20.0}
+
+## @brief known map of the true position in mm to the raw ADC values, rows (x, y, 1) -> raw x, raw y in mm of the scale
+#  @details Gains and cross-coupling of a touchpanel which is slightly rotated and shifted from the center.
+#
+TRUE_MAP = ((1.04, 0.12, 90.0),
+            (-0.09, 0.96, 48.5))
+
+## @brief largest error of the recovered positions in mm, the raw values are rounded to whole counts
+#
+AFFINE_TOLERANCE = 0.1
+
+
+class FakeBoard:
+    ''' @brief Counts the calls of the fake pyb module and provides the ADC values
+    '''
+
+    def __init__(self):
+        ''' @brief Creates the counters, the ball is in contact at half scale
+        '''
+        self.counts = dict((name, 0) for name in COSTS_US)
+        self.contact = True
+        self.value = 2048
+        #values of the next reads, e.g. of the z-, the x- and the y-scan, before value is returned again
+        self.reads = []
+        #fake clock in us
+        self.now = 0.0
+        #iterator over the values of the bursts of ADC.read_timed() and the number of bursts and values
+        self.samples = None
+        self.bursts = 0
+        self.burst_values = 0
+
+    def reset(self):
+        ''' @brief Clears the counters
+        '''
+        for name in self.counts:
+            self.counts[name] = 0
+        self.bursts = 0
+        self.burst_values = 0
+
+    def call(self, name):
+        ''' @brief Counts a call and advances the fake clock by its cost
+            @param name key of COSTS_US
+        '''
+        self.counts[name] += 1
+        self.now += COSTS_US[name]
+
+    def module(self):
+        ''' @brief Creates the fake pyb module
+            @return module object which can be put into sys.modules
+        '''
+        board = self
+
+        class Pin:
+            OUT_PP = 1
+            IN = 0
+            ANALOG = 3
+            cpu = types.SimpleNamespace(A0='A0', A1='A1', A6='A6', A7='A7')
+
+            def __init__(self, name):
+                self.name = name
+
+            def init(self, mode, value=None):
+                board.call('Pin.init')
+
+            def value(self, value):
+                board.call('Pin.value')
+
+        class ADC:
+            def __init__(self, pin):
+                board.call('ADC')
+
+            def read(self):
+                board.call('ADC.read')
+                if not board.contact:
+                    return 4095
+                return board.reads.pop(0) if board.reads else board.value
+
+            def read_timed(self, buf, timer):
+                for i in range(len(buf)):
+                    buf[i] = next(board.samples)
+                board.bursts += 1
+                board.burst_values += len(buf)
+                board.now += len(buf)*1000000/timer.freq()
+
+        class Timer:
+            def __init__(self, id, freq):
+                self._freq = freq
+
+            def freq(self):
+                return self._freq
+
+        pyb = types.ModuleType('pyb')
+        pyb.Pin = Pin
+        pyb.ADC = ADC
+        pyb.Timer = Timer
+        return pyb
+
+
+def load_driver(board):
+    ''' @brief Imports the touchpanel driver with the fake pyb module
+        @param board FakeBoard object
+        @return touchpanel module
+    '''
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda value: value
+    utime = types.ModuleType('utime')
+    utime.ticks_us = lambda: int(board.now)
+    utime.ticks_diff = lambda a, b: a - b
+    sys.modules['pyb'] = board.module()
+    sys.modules['micropython'] = micropython
+    sys.modules['utime'] = utime
+    try:
+        import touchpanel
+    except ImportError:
+        import Term_touchpanel as touchpanel
+    return touchpanel
+
+
+def estimate(counts, scans):
+    ''' @brief Estimates the time of one scan on the board
+        @param counts dictionary with the call counts of all scans
+        @param scans number of scans
+        @return time of one scan in us
+    '''
+    return sum(COSTS_US[name]*counts[name] for name in counts) / scans
+
+
+def measure(board, scan, scans, contact):
+    ''' @brief Runs a scan function and returns the calls per scan and the estimated time
+        @param board FakeBoard object
+        @param scan function which is benchmarked
+        @param scans number of scans
+        @param contact True if the ball touches the panel
+        @return tuple (calls per scan, time per scan in us)
+    '''
+    board.contact = contact
+    scan()
+    board.reset()
+    for i in range(scans):
+        scan()
+    calls = dict((name, board.counts[name] / scans) for name in board.counts)
+    return (calls, estimate(board.counts, scans))
+
+
+def synthetic_samples(count, sigma, spike_rate, spike_size, seed=0):
+    ''' @brief Creates ADC values of a resting ball with noise and spikes
+        @param count number of values
+        @param sigma standard deviation of the noise in counts
+        @param spike_rate probability of a spike
+        @param spike_size largest magnitude of a spike in counts
+        @return array with the ADC values
+    '''
+    rng = np.random.default_rng(seed)
+    values = 2048 + rng.normal(0, sigma, count)
+    spikes = rng.random(count) < spike_rate
+    values[spikes] += rng.uniform(-spike_size, spike_size, np.count_nonzero(spikes))
+    return np.clip(np.round(values), 0, 4095)
+
+
+def noise_table(board, touchpanel, panel, samples, sizes, budgets, sample_time, scans):
+    ''' @brief Runs the oversampled fast scan and prints the burst size, the variance and the scan time
+        @param board FakeBoard object
+        @param touchpanel touchpanel module
+        @param panel touchpanel object
+        @param samples ADC values, consecutive values form the bursts
+        @param sizes burst sizes, each is run alone and all together with every budget
+        @param budgets time budgets of the fast scan in us for the adaptive burst size
+        @param sample_time time of one sample of a burst in us
+        @param scans number of scans of every case
+    '''
+    timer = sys.modules['pyb'].Timer(7, freq=int(1000000/sample_time))
+    #a fixed burst size ignores the budget
+    cases = [((n,), None) for n in sizes] + [(tuple(sizes), budget) for budget in budgets]
+    print('{:<14}{:>8}{:>8}{:>16}{:>20}'.format('reduction', 'budget', 'N', 'variance [mm^2]', 'scan mean/max [us]'))
+    for (name, mode) in (('median', touchpanel.MEDIAN), ('trimmed mean', touchpanel.TRIMMED_MEAN)):
+        for (case_sizes, budget) in cases:
+            panel.set_oversampling(timer, case_sizes, mode, 1000000 if budget is None else budget)
+            board.contact = True
+            board.samples = itertools.cycle(samples)
+            board.reset()
+            positions = []
+            times = []
+            for i in range(scans):
+                start = board.now
+                (x, y, z) = panel.fast_scan()
+                times.append(board.now - start)
+                positions.append(x)
+            print('{:<14}{:>8}{:>8.1f}{:>16.4f}{:>12.0f} /{:>5.0f}'.format(
+                name, '-' if budget is None else budget, board.burst_values/board.bursts, np.var(positions),
+                np.mean(times), np.max(times)))
+
+
+def separate(panel, raw_x, raw_y, K):
+    ''' @brief Calculates a calibrated position like Task_Touchpanel before the affine transform
+        @details The scale and the center are applied first, then the calibration in the order of the old task, the
+                 y-position uses the already calibrated x-position.
+        @param panel touchpanel object
+        @param raw_x, raw_y raw ADC values
+        @param K object with the calibration values Kxx, Kxy, Kyx, Kyy, Xc, Yc as attributes
+        @return tuple (X, Y)
+    '''
+    x = raw_x*panel.scale_x-panel.x_center
+    y = raw_y*panel.scale_y-panel.y_center
+    Kxx = K.Kxx
+    Kxy = K.Kxy
+    Kyx = K.Kyx
+    Kyy = K.Kyy
+    Xc = K.Xc
+    Yc = K.Yc
+    x = Kxx*x+Kxy*y+Xc
+    y = Kyx*x+Kyy*y+Yc
+    return (x, y)
+
+
+def affine(panel, raw_x, raw_y):
+    ''' @brief Calculates a calibrated position like the fast scan
+        @param panel touchpanel object
+        @param raw_x, raw_y raw ADC values
+        @return tuple (X, Y)
+    '''
+    (a, b, c, d, e, f) = panel.transform
+    return (a*raw_x + b*raw_y + c, d*raw_x + e*raw_y + f)
+
+
+def true_raw(panel, x, y):
+    ''' @brief Maps a true position with TRUE_MAP to raw ADC values
+        @param panel touchpanel object
+        @param x, y true position in mm
+        @return tuple (raw x, raw y) rounded to whole counts
+    '''
+    ((a, b, c), (d, e, f)) = TRUE_MAP
+    return (int(round((a*x + b*y + c)/panel.scale_x)), int(round((d*x + e*y + f)/panel.scale_y)))
+
+
+def affine_check(board, panel, count, seed=0):
+    ''' @brief Calibrates with a known affine map and checks the positions of the fast scan against the true positions
+        @details Raises an AssertionError if an error is above AFFINE_TOLERANCE.
+        @param board FakeBoard object
+        @param panel touchpanel object
+        @param count number of random positions
+    '''
+    #scan the nine calibration points like Task_Touchpanel
+    board.contact = True
+    data_x = []
+    data_y = []
+    for point in (panel.pos1, panel.pos2, panel.pos3, panel.pos4, panel.pos5, panel.pos6, panel.pos7, panel.pos8, panel.pos9):
+        (raw_x, raw_y) = true_raw(panel, point[0], point[1])
+        board.reads = [raw_x]
+        data_x.append(panel.x_scan())
+        board.reads = [raw_y]
+        data_y.append(panel.y_scan())
+    K = types.SimpleNamespace()
+    (K.Kxx, K.Kxy, K.Kyx, K.Kyy, K.Xc, K.Yc) = [float(v) for v in panel.calibration(data_x, data_y)]
+    panel.set_calibration(K.Kxx, K.Kxy, K.Kyx, K.Kyy, K.Xc, K.Yc)
+
+    rng = np.random.default_rng(seed)
+    error = 0.0
+    separate_error = 0.0
+    for i in range(count):
+        x_true = rng.uniform(-75, 75)
+        y_true = rng.uniform(-35, 35)
+        (raw_x, raw_y) = true_raw(panel, x_true, y_true)
+        #the fake ADC returns a contact in the z-scan and the raw values in the x- and the y-scan
+        board.reads = [0, raw_x, raw_y]
+        (x, y, z) = panel.fast_scan()
+        if board.reads or not z:
+            raise AssertionError('the fast scan did not read the z-, the x- and the y-scan')
+        error = max(error, abs(x - x_true), abs(y - y_true))
+        (x, y) = separate(panel, raw_x, raw_y, K)
+        separate_error = max(separate_error, abs(x - x_true), abs(y - y_true))
+    print('largest error of the fast scan to the true positions: {:.3f} mm'.format(error))
+    print('largest error of the separate calculations used before: {:.1f} mm'.format(separate_error))
+    if error > AFFINE_TOLERANCE:
+        raise AssertionError('the fast scan does not recover the true positions')
+
+    #cost per scan of the calculations after the ADC reads
+    start = time.perf_counter()
+    for i in range(count):
+        separate(panel, 2000, 1500, K)
+    separate_time = (time.perf_counter() - start) / count
+    start = time.perf_counter()
+    for i in range(count):
+        affine(panel, 2000, 1500)
+    affine_time = (time.perf_counter() - start) / count
+    print('separate: 10 attribute reads, 6 multiplies, 6 adds, {:.2f} us on the PC'.format(1e6*separate_time))
+    print('affine:   1 attribute read, 4 multiplies, 4 adds, {:.2f} us on the PC'.format(1e6*affine_time))
+
+
+def main():
+    ''' @brief Command line interface of the benchmark
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark the touchpanel driver with a fake pyb module')
+    parser.add_argument('--scans', type=int, default=100, help='number of scans of every case')
+    parser.add_argument('--noise', action='store_true', help='benchmark the oversampling instead of the scans')
+    parser.add_argument('--affine', action='store_true', help='check and benchmark the affine transform')
+    parser.add_argument('--data', help='file with one recorded raw ADC value per line instead of synthetic values')
+    parser.add_argument('--sizes', default='1,3,5,9,17', help='burst sizes')
+    parser.add_argument('--budgets', default='500,1000,1500,2000', help='time budgets of the adaptive burst size in us')
+    parser.add_argument('--sample-time', type=float, default=20.0, help='time of one sample of a burst in us')
+    parser.add_argument('--sigma', type=float, default=6.0, help='noise of the synthetic values in counts')
+    parser.add_argument('--spike-rate', type=float, default=0.02, help='probability of a spike of the synthetic values')
+    parser.add_argument('--spike-size', type=float, default=300.0, help='largest spike of the synthetic values in counts')
+    args = parser.parse_args()
+
+    board = FakeBoard()
+    touchpanel = load_driver(board)
+    panel = touchpanel.Touchpanel('A1', 'A0', 'A7', 'A6', 176, 100, 88, 50, 5000)
+
+    if args.affine:
+        affine_check(board, panel, 10000)
+        return
+
+    if args.noise:
+        if args.data:
+            samples = np.loadtxt(args.data)
+        else:
+            samples = synthetic_samples(100000, args.sigma, args.spike_rate, args.spike_size)
+        sizes = [int(n) for n in args.sizes.split(',')]
+        budgets = [int(b) for b in args.budgets.split(',')]
+        noise_table(board, touchpanel, panel, [int(v) for v in samples], sizes, budgets, args.sample_time,
+                    max(args.scans, 2000))
+        return
+
+    cases = [('all_scan, contact', panel.all_scan, True),
+             ('fast_scan, contact', panel.fast_scan, True),
+             ('fast_scan, no contact', panel.fast_scan, False)]
+    print('{:<24}{:>10}{:>11}{:>6}{:>10}{:>12}'.format('case', 'Pin.init', 'Pin.value', 'ADC', 'ADC.read', 'time [us]'))
+    for (name, scan, contact) in cases:
+        (calls, time_us) = measure(board, scan, args.scans, contact)
+        print('{:<24}{:>10g}{:>11g}{:>6g}{:>10g}{:>12.0f}'.format(name, calls['Pin.init'], calls['Pin.value'],
+                                                                 calls['ADC'], calls['ADC.read'], time_us))
+    print('baseline measured on the board: {:.0f} us'.format(BASELINE_US))
+
+
+if __name__ == '__main__':
+    main()
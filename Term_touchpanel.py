@@ -1,217 +1,391 @@
-''' @file                   Term_touchpanel.py
-    @brief                  A driver for reading positions from the touchpanel
-    @details                Creates a class which can be used to create a touchpanel object to get the position of the ball on the touchpanel
-                            Responsible for interfacing with the resistive touch panel using an object of
-                            the touch panel driver class. The task also performs filtering and calibration of the touchpanel.
-
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   November 18, 2021
-    @page touchpanel_doc    Touchpanel Driver Documentation
-                            On this page you can find a detailed documentation of the touchpanel driver, including a general
-            			    description of the setup, testing procedure and results and a benchmark which shows how long the driver
-            			    takes to read position values from the panel.
-    
-    @section sec_setup      Hardware Setup
-                            For this assignment we used the fully assembled ball-balancing plattform, which has a touchpanel on top
-                            and is connected to the Nucleo STM32 microcontroller. In this setup we have a resistive touchpanel, 
-                            which means that you can determine the position by the changing resistance, depending on where you press 
-             			    on the panel. Changing resistance leads to changing voltages at the pins connected to the panel, which can
-             			    be read via an ADC.
-                            
-                            Here is picture of the hardware setup:
-                            \image html HardwareSetup.png "Hardware Setup"
-                              
-    
-    @section sec_testing    Testing Procedure and Results
-                            We tested the function of the touchpanel by performing X- and Y-Scans and comparing the read coordinates with
-                            the known position we touched. In the center of the panel you should read (0, 0). In the pictures below you can
-                            see that the positive x-direction is to the front and the postive y-direction is to the right (from the viewpoint
-                            of the picture). The z-scan determines wheter there is something in contact with the panel at the moment or not.
-                            
-                            \image html TouchCenter.png "Touch in the center of the panel (x: 0mm, y: 0mm)"
-                            
-                            \image html TouchFrontRight.png "Touch in the front right of the panel (x: 74mm, y: 36mm)"
-                            
-    
-    @section sec_benchmark  Benchmark
-                            We took a few measures to optimize the speed of our xyz-scan function. First thing we did is to define every
-                            constant value as a micropython.const(). We did this for example with the center coordinates that have to be computed
-                            in the calculation of the actual coordinate. We also precomputed the scale factor in x- and y-direction and defined
-                            it as a constant to reduce the calculation time. 
-                            With these measures we were able to achieve an average reading time of 1239us for all coodrinates (xyz) together
-                            over a total of 100 scans. With this speed we can be sure, that the touchpanel reading is fast enough to not conflict 
-                            with other parts of final project, like the controller driver.
-                            
-                            
-    
-    @author                 Sebastian Bößl, Johannes Frisch
-    @date                   November 18, 2021
-'''
-
-import pyb
-from micropython import const
-from ulab import numpy as np
-
-class Touchpanel:
-    ''' @brief          Interfaces with touchpanel
-    '''
-    
-    def __init__(self, x_m, y_m, x_p, y_p, width , length, x_center, y_center, period):
-        ''' @brief Constructs an touchpanel object
-            @param x_m negativ x-Pin 
-            @param y_m negativ y-Pin
-            @param x_p positiv x-Pin
-            @param y_p positive y-Pin
-            @param length  length of the touchpanel
-            @param width widths of the touchpanel
-            @param x_center coordinate of the center of the touchpanel
-            @param y_center coordinate of the center of the touchpanel
-            @period period of task_touchpanel
-        '''
-        #class variables
-        self.x_m = pyb.Pin(x_m)   
-        self.y_m = pyb.Pin(y_m) 
-        self.x_p = pyb.Pin(x_p)  
-        self.y_p = pyb.Pin(y_p) 
-        self.width = width
-        self.length = length
-        self.x_center = const(x_center)
-        self.y_center = const(y_center)
-        self.scale_x = const(self.width/4095)
-        self.scale_y = const(self.length/4095)
-        self.alpha = 0.85  #gain position
-        self.beta = 0.005  #gain velocity
-        self.x_fil = 0
-        self.y_fil = 0
-        self.y_vel = 0
-        self.x_vel = 0
-        self.period = period
-        #desired calibration points
-        self.pos1 = (-70,30)
-        self.pos2 = (-70,0)
-        self.pos3 = (-70,-30)
-        self.pos4 = (0,30)
-        self.pos5 = (0,0)
-        self.pos6 = (0,-30)
-        self.pos7 = (70,30)
-        self.pos8 = (70,0)
-        self.pos9 = (70,-30)
-        
-    def x_scan(self):
-        ''' @brief     returns ball x-position with respect to center
-            @return x-position with respect to the center
-        '''
-        #x-scan
-        self.x_m.init(mode = pyb.Pin.OUT_PP) #sets x_m to pushpull output
-        self.x_m.value(0) #set output to low
-        self.y_m.init(mode = pyb.Pin.IN) #sets y_m to an input to read the voltage
-        self.y_p.init(mode = pyb.Pin.IN) #sets y_p to an input to float it 
-        self.x_p.init(mode = pyb.Pin.OUT_PP) #sets x_p to pushpull output
-        self.x_p.value(1) #set output to high
-        
-        ADC = pyb.ADC(self.y_m) #give y_m Pin to read the voltage    
-         
-        return((ADC.read()*self.scale_x-self.x_center)) #formula to calculate x-position with respect to the center
-    
-    def y_scan(self):
-        ''' @brief     returns ball y-position with respect to center
-            @return y-position with respect to the center
-        '''
-        #x-scan
-        self.x_m.init(mode = pyb.Pin.IN) #sets x_m to pushpull output
-        self.y_m.init(mode = pyb.Pin.OUT_PP) #sets y_m to an input to read the voltage
-        self.y_m.value(0) #set output to low
-        self.y_p.init(mode = pyb.Pin.OUT_PP) #sets y_p to an input to float it 
-        self.x_p.init(mode = pyb.Pin.IN) #sets x_p to pushpull output
-        self.y_p.value(1) #set output to high
-
-        ADC = pyb.ADC(self.x_m) #give y_m Pin to read the voltage
-        
-        return(ADC.read()*self.scale_y-self.y_center) #formula to calculate x-position with respect to the center
-    
-    def z_scan(self):
-        ''' @brief     returns true or false value whether there is a contact with the touchpanel or not
-            @return returns true or false value wether there is a contact with the touchpanel or not
-        '''
-        self.x_m.init(mode = pyb.Pin.OUT_PP) #sets x_m to pushpull output
-        self.y_m.init(mode = pyb.Pin.IN) #sets y_m to an input to read the voltage
-        self.x_m.value(0) #set output to low
-        self.y_p.init(mode = pyb.Pin.OUT_PP) #sets y_p to an input to float it 
-        self.x_p.init(mode = pyb.Pin.IN) #sets x_p to pushpull output
-        self.y_p.value(1) #set output to high
-
-        ADC = pyb.ADC(self.y_m) #give y_m Pin to read the voltage
-        ADC_value = ADC.read()
-        
-        if(ADC_value > 4080):
-            return(False)
-        else:
-            return(True)
-        
-    def all_scan(self):
-        ''' @brief  returns x,y position of the touchpanel and if there is a contact or not
-            @return returns x,y position of the touchpanel and if there is a contact or not
-        '''
-        return(self.x_scan(),self.y_scan(), self.z_scan())
-    
-    def filterting(self, x, y):
-        """ @brief this function will allow to filter the input and get the velocity of the ball
-            @param x x position of the ball
-            @param y y position of the ball
-            @return returns the filtered positions and the velocities
-        """
-        
-        #calculate x-filter
-        self.x_fil = self.x_fil+self.alpha*(x-self.x_fil)+self.period*self.x_vel
-        #calculate x-velocity
-        self.x_vel = self.x_vel +self.beta/self.period*(x-self.x_fil)
-        #calulate y-filter
-        self.y_fil = self.y_fil+self.alpha*(y-self.y_fil)+self.period*self.y_vel
-        #calculate y-vel
-        self.y_vel = self.y_vel +self.beta/self.period*(y-self.y_fil)
-        
-        #returns all calculated values
-        return(self.x_fil,self.y_fil,self.x_vel,self.y_vel)
-    
-    def calibration(self, reading_data_x, reading_data_y):
-        """ @brief calculates the paramters which can be used to calibrates the touchpanel
-            @param reading_data_x contains all the x-values of the touchpanel which were read to calibrate the touchpanel
-            @param reading_data_y contains all the y-values of the touchpanel which were read to calibrate the touchpanel
-            @return returns all the values which are used to calibrate the positions of the touchpanel
-        """
-        #create variables
-        Kxx, Kyx, Kxy, Kyy, Xc, Yc = 0,0,0,0,0,0
-        #create marix for the supposed position values
-        supposed_positions = np.array([(self.pos1[0], self.pos1[1]),(self.pos2[0],self.pos2[1]),(self.pos3[0],self.pos3[1]),(self.pos4[0],self.pos4[1]),(self.pos5[0],self.pos5[1]),(self.pos6[0],self.pos6[1]),(self.pos7[0],self.pos7[1]),(self.pos8[0],self.pos8[1]),(self.pos9[0],self.pos9[1])])
-        
-        #create matrix for the read position values
-        real_positions = np.array([[reading_data_x[0], reading_data_y[0], 1],
-                                   [reading_data_x[1], reading_data_y[1], 1],
-                                   [reading_data_x[2], reading_data_y[2], 1],
-                                   [reading_data_x[3], reading_data_y[3], 1 ],
-                                   [reading_data_x[4], reading_data_y[4], 1],
-                                   [reading_data_x[5], reading_data_y[5], 1],
-                                   [reading_data_x[6], reading_data_y[6], 1],
-                                   [reading_data_x[7], reading_data_y[7], 1],
-                                   [reading_data_x[8], reading_data_y[8], 1]])
-        
-        #calcualtes the calibration parameters which can be used to calibrate the positions of the ball on the touchpanel
-        beta = np.dot(np.dot(np.linalg.inv(np.dot(real_positions.transpose(),real_positions)), real_positions.transpose()), supposed_positions)
-            
-        #get values from matrix
-        Kxx = beta[0][0]
-        Kxy = beta[0][1]
-        Kyx = beta[1][0]
-        Kyy = beta[1][1]
-        Xc = beta[2][0]
-        Yc = beta[2][1]
-        
-        #return values
-        return(Kxx,Kxy,Kyx,Kyy, Xc, Yc)
-
-
-
-
-
-    
-
+''' @file                   Term_touchpanel.py
+    @brief                  A driver for reading positions from the touchpanel
+    @details                Creates a class which can be used to create a touchpanel object to get the position of the ball on the touchpanel
+                            Responsible for interfacing with the resistive touch panel using an object of
+                            the touch panel driver class. The task also performs filtering and calibration of the touchpanel.
+
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   November 18, 2021
+    @page touchpanel_doc    Touchpanel Driver Documentation
+                            On this page you can find a detailed documentation of the touchpanel driver, including a general
+            			    description of the setup, testing procedure and results and a benchmark which shows how long the driver
+            			    takes to read position values from the panel.
+    
+    @section sec_setup      Hardware Setup
+                            For this assignment we used the fully assembled ball-balancing plattform, which has a touchpanel on top
+                            and is connected to the Nucleo STM32 microcontroller. In this setup we have a resistive touchpanel, 
+                            which means that you can determine the position by the changing resistance, depending on where you press 
+             			    on the panel. Changing resistance leads to changing voltages at the pins connected to the panel, which can
+             			    be read via an ADC.
+                            
+                            Here is picture of the hardware setup:
+                            \image html HardwareSetup.png "Hardware Setup"
+                              
+    
+    @section sec_testing    Testing Procedure and Results
+                            We tested the function of the touchpanel by performing X- and Y-Scans and comparing the read coordinates with
+                            the known position we touched. In the center of the panel you should read (0, 0). In the pictures below you can
+                            see that the positive x-direction is to the front and the postive y-direction is to the right (from the viewpoint
+                            of the picture). The z-scan determines wheter there is something in contact with the panel at the moment or not.
+                            
+                            \image html TouchCenter.png "Touch in the center of the panel (x: 0mm, y: 0mm)"
+                            
+                            \image html TouchFrontRight.png "Touch in the front right of the panel (x: 74mm, y: 36mm)"
+                            
+    
+    @section sec_benchmark  Benchmark
+                            We took a few measures to optimize the speed of our xyz-scan function. First thing we did is to define every
+                            constant value as a micropython.const(). We did this for example with the center coordinates that have to be computed
+                            in the calculation of the actual coordinate. We also precomputed the scale factor in x- and y-direction and defined
+                            it as a constant to reduce the calculation time. 
+                            With these measures we were able to achieve an average reading time of 1239us for all coodrinates (xyz) together
+                            over a total of 100 scans. With this speed we can be sure, that the touchpanel reading is fast enough to not conflict 
+                            with other parts of final project, like the controller driver.
+                            
+                            The fast scan (fast_scan()) creates the ADC objects only once and remembers the mode of every pin, so
+                            only the pins which differ between two phases are switched. The phases run in the order z, x, y, so
+                            x_m and y_m keep their modes between z and x, and without contact x and y are not scanned at all.
+                            Term_touch_bench.py counts the pin and ADC calls of both paths with a fake pyb on the PC and
+                            estimates their time from costs per call which reproduce the baseline of 1239us.
+                            
+                            With set_oversampling() the fast scan reads x and y as bursts with ADC.read_timed() into preallocated
+                            buffers and reduces every burst with the median or a trimmed mean. The largest burst which still fits
+                            into the remaining time budget of the scan is used. Term_touch_bench.py --noise compares the noise
+                            variance of all burst sizes and reductions with their scan time.
+                            
+                            The fast scan maps the raw ADC values with one affine transform to calibrated positions in mm. The
+                            transform combines the scale, the center and the calibration and is only recalculated by
+                            set_calibration(). Term_touch_bench.py --affine calibrates with raw values of a known affine map with
+                            cross-coupling and checks that the fast scan recovers the true positions, it also compares the cost
+                            per scan with the separate calculations which were used before.
+                            
+                            
+    
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   November 18, 2021
+'''
+
+import pyb
+import utime
+from array import array
+from micropython import const
+try:
+    from ulab import numpy as np
+except ImportError:
+    #NumPy on the PC, used by Term_touch_bench.py
+    import numpy as np
+
+#modes of the pins in the phases of the fast scan
+_LOW = const(0)
+_HIGH = const(1)
+_ANALOG = const(2)
+_FLOAT = const(3)
+##@brief modes of the pins x_m, y_m, x_p and y_p in the phases z, x and y of the fast scan
+#
+PHASES = ((_LOW, _ANALOG, _FLOAT, _HIGH),
+          (_LOW, _ANALOG, _HIGH, _FLOAT),
+          (_ANALOG, _LOW, _FLOAT, _HIGH))
+##@brief ADC value above which there is no contact with the touchpanel
+#
+Z_THRESHOLD = const(4080)
+##@brief reduction of an oversampled burst: median
+#
+MEDIAN = const(0)
+##@brief reduction of an oversampled burst: mean without the lowest and the highest quarter
+#
+TRIMMED_MEAN = const(1)
+
+
+def reduce_samples(buf, mode):
+    ''' @brief  sorts a burst of ADC values in place and reduces it to one value
+        @param buf array with the ADC values
+        @param mode MEDIAN or TRIMMED_MEAN
+        @return reduced ADC value
+    '''
+    #insertion sort, the bursts are short
+    n = len(buf)
+    for i in range(1, n):
+        value = buf[i]
+        j = i - 1
+        while (j >= 0) and (buf[j] > value):
+            buf[j + 1] = buf[j]
+            j -= 1
+        buf[j + 1] = value
+    
+    if (mode == MEDIAN):
+        if (n & 1):
+            return buf[n >> 1]
+        return (buf[(n >> 1) - 1] + buf[n >> 1]) / 2
+    trim = n >> 2
+    total = 0
+    for i in range(trim, n - trim):
+        total += buf[i]
+    return total / (n - 2*trim)
+
+class Touchpanel:
+    ''' @brief          Interfaces with touchpanel
+    '''
+    
+    def __init__(self, x_m, y_m, x_p, y_p, width , length, x_center, y_center, period):
+        ''' @brief Constructs an touchpanel object
+            @param x_m negativ x-Pin 
+            @param y_m negativ y-Pin
+            @param x_p positiv x-Pin
+            @param y_p positive y-Pin
+            @param length  length of the touchpanel
+            @param width widths of the touchpanel
+            @param x_center coordinate of the center of the touchpanel
+            @param y_center coordinate of the center of the touchpanel
+            @param period period of task_touchpanel in us
+        '''
+        #class variables
+        self.x_m = pyb.Pin(x_m)   
+        self.y_m = pyb.Pin(y_m) 
+        self.x_p = pyb.Pin(x_p)  
+        self.y_p = pyb.Pin(y_p) 
+        self.width = width
+        self.length = length
+        self.x_center = const(x_center)
+        self.y_center = const(y_center)
+        self.scale_x = const(self.width/4095)
+        self.scale_y = const(self.length/4095)
+        self.alpha = 0.85  #gain position
+        self.beta = 0.005  #gain velocity
+        self.x_fil = 0
+        self.y_fil = 0
+        self.y_vel = 0
+        self.x_vel = 0
+        #period in s, so the filtered velocities are in mm/s
+        self.period = period/1000000
+        #desired calibration points
+        self.pos1 = (-70,30)
+        self.pos2 = (-70,0)
+        self.pos3 = (-70,-30)
+        self.pos4 = (0,30)
+        self.pos5 = (0,0)
+        self.pos6 = (0,-30)
+        self.pos7 = (70,30)
+        self.pos8 = (70,0)
+        self.pos9 = (70,-30)
+        #fast scan: ADC objects which are created once, the pins and their current modes
+        self.adc_y_m = pyb.ADC(self.y_m)
+        self.adc_x_m = pyb.ADC(self.x_m)
+        self.pins = (self.x_m, self.y_m, self.x_p, self.y_p)
+        self.modes = [-1, -1, -1, -1]
+        #last positions, returned by the fast scan without contact
+        self.x_last = 0
+        self.y_last = 0
+        #oversampling, disabled until set_oversampling() is called
+        self.buffers = None
+        self.samples = 1
+        #affine transform of the raw ADC values of the fast scan, uncalibrated until set_calibration() is called
+        #a tuple of floats, reading it does not allocate like reading an array('f')
+        self.transform = (self.scale_x, 0.0, -self.x_center, 0.0, self.scale_y, -self.y_center)
+        
+    def x_scan(self):
+        ''' @brief     returns ball x-position with respect to center
+            @return x-position with respect to the center
+        '''
+        #x-scan
+        self.modes = [-1, -1, -1, -1] #the fast scan has to set all pins again
+        self.x_m.init(mode = pyb.Pin.OUT_PP) #sets x_m to pushpull output
+        self.x_m.value(0) #set output to low
+        self.y_m.init(mode = pyb.Pin.IN) #sets y_m to an input to read the voltage
+        self.y_p.init(mode = pyb.Pin.IN) #sets y_p to an input to float it 
+        self.x_p.init(mode = pyb.Pin.OUT_PP) #sets x_p to pushpull output
+        self.x_p.value(1) #set output to high
+        
+        ADC = pyb.ADC(self.y_m) #give y_m Pin to read the voltage    
+         
+        return((ADC.read()*self.scale_x-self.x_center)) #formula to calculate x-position with respect to the center
+    
+    def y_scan(self):
+        ''' @brief     returns ball y-position with respect to center
+            @return y-position with respect to the center
+        '''
+        #x-scan
+        self.modes = [-1, -1, -1, -1] #the fast scan has to set all pins again
+        self.x_m.init(mode = pyb.Pin.IN) #sets x_m to pushpull output
+        self.y_m.init(mode = pyb.Pin.OUT_PP) #sets y_m to an input to read the voltage
+        self.y_m.value(0) #set output to low
+        self.y_p.init(mode = pyb.Pin.OUT_PP) #sets y_p to an input to float it 
+        self.x_p.init(mode = pyb.Pin.IN) #sets x_p to pushpull output
+        self.y_p.value(1) #set output to high
+
+        ADC = pyb.ADC(self.x_m) #give y_m Pin to read the voltage
+        
+        return(ADC.read()*self.scale_y-self.y_center) #formula to calculate x-position with respect to the center
+    
+    def z_scan(self):
+        ''' @brief     returns true or false value whether there is a contact with the touchpanel or not
+            @return returns true or false value wether there is a contact with the touchpanel or not
+        '''
+        self.modes = [-1, -1, -1, -1] #the fast scan has to set all pins again
+        self.x_m.init(mode = pyb.Pin.OUT_PP) #sets x_m to pushpull output
+        self.y_m.init(mode = pyb.Pin.IN) #sets y_m to an input to read the voltage
+        self.x_m.value(0) #set output to low
+        self.y_p.init(mode = pyb.Pin.OUT_PP) #sets y_p to an input to float it 
+        self.x_p.init(mode = pyb.Pin.IN) #sets x_p to pushpull output
+        self.y_p.value(1) #set output to high
+
+        ADC = pyb.ADC(self.y_m) #give y_m Pin to read the voltage
+        ADC_value = ADC.read()
+        
+        if(ADC_value > 4080):
+            return(False)
+        else:
+            return(True)
+        
+    def all_scan(self):
+        ''' @brief  returns x,y position of the touchpanel and if there is a contact or not
+            @return returns x,y position of the touchpanel and if there is a contact or not
+        '''
+        return(self.x_scan(),self.y_scan(), self.z_scan())
+    
+    def fast_scan(self):
+        ''' @brief  returns x,y position of the touchpanel and if there is a contact or not with as few pin changes as possible
+            @details Scans z first. Without contact the positions of the last contact are returned without scanning x and y.
+            @return returns x,y position of the touchpanel and if there is a contact or not
+        '''
+        start = utime.ticks_us()
+        #z-scan
+        self.set_phase(0)
+        if (self.adc_y_m.read() > Z_THRESHOLD):
+            return(self.x_last, self.y_last, False)
+        #x-scan
+        self.set_phase(1)
+        x = self.read_adc(self.adc_y_m, start, 2)
+        #y-scan
+        self.set_phase(2)
+        y = self.read_adc(self.adc_x_m, start, 1)
+        #calibrated positions from the raw ADC values
+        (a, b, c, d, e, f) = self.transform
+        self.x_last = a*x + b*y + c
+        self.y_last = d*x + e*y + f
+        return(self.x_last, self.y_last, True)
+    
+    def set_calibration(self, Kxx, Kxy, Kyx, Kyy, Xc, Yc):
+        ''' @brief  sets the calibration of the fast scan
+            @details The calibrated positions are X = Kxx*x + Kyx*y + Xc and Y = Kxy*x + Kyy*y + Yc with the positions x and
+                     y of x_scan() and y_scan(). Together with the scale and the center this is one affine transform of the
+                     raw ADC values, which is calculated here once.
+            @param Kxx, Kxy, Kyx, Kyy, Xc, Yc calibration values as returned by calibration()
+        '''
+        self.transform = (Kxx*self.scale_x, Kyx*self.scale_y, Xc - Kxx*self.x_center - Kyx*self.y_center,
+                          Kxy*self.scale_x, Kyy*self.scale_y, Yc - Kxy*self.x_center - Kyy*self.y_center)
+    
+    def set_oversampling(self, timer, sizes=(1, 3, 5, 9, 17), mode=MEDIAN, budget=1500):
+        ''' @brief  enables the oversampling of the x- and the y-scan of the fast scan
+            @param timer timer object which triggers the samples of a burst, e.g. pyb.Timer(7, freq=50000)
+            @param sizes possible numbers of samples of a burst, in increasing order
+            @param mode MEDIAN or TRIMMED_MEAN
+            @param budget time in us which the fast scan may take
+        '''
+        self.timer = timer
+        self.buffers = [array('H', [0] * n) for n in sizes]
+        self.mode = mode
+        self.budget = budget
+        #time of one sample in us
+        self.sample_time = 1000000 // timer.freq()
+    
+    def read_adc(self, adc, start, reads_left):
+        ''' @brief  reads one ADC value, oversampled if enabled
+            @details The largest burst is used for which the remaining reads still fit into the time budget.
+            @param adc ADC object of the sensed pin
+            @param start ticks_us() at the start of the scan
+            @param reads_left number of reads until the end of the scan including this one
+            @return ADC value
+        '''
+        buffers = self.buffers
+        if (buffers is None):
+            return adc.read()
+        #time which is left for every read
+        time_left = (self.budget - utime.ticks_diff(utime.ticks_us(), start)) // reads_left
+        k = len(buffers) - 1
+        while (k > 0) and (len(buffers[k])*self.sample_time > time_left):
+            k -= 1
+        buf = buffers[k]
+        adc.read_timed(buf, self.timer)
+        self.samples = len(buf)
+        return reduce_samples(buf, self.mode)
+    
+    def set_phase(self, phase):
+        ''' @brief  switches the pins which have another mode in the phase
+            @param phase 0 for the z-, 1 for the x- and 2 for the y-scan
+        '''
+        config = PHASES[phase]
+        modes = self.modes
+        for i in range(4):
+            mode = config[i]
+            if (modes[i] != mode):
+                modes[i] = mode
+                if (mode == _LOW):
+                    self.pins[i].init(mode = pyb.Pin.OUT_PP, value = 0)
+                elif (mode == _HIGH):
+                    self.pins[i].init(mode = pyb.Pin.OUT_PP, value = 1)
+                elif (mode == _ANALOG):
+                    self.pins[i].init(mode = pyb.Pin.ANALOG)
+                else:
+                    self.pins[i].init(mode = pyb.Pin.IN)
+    
+    def filterting(self, x, y):
+        """ @brief this function will allow to filter the input and get the velocity of the ball
+            @param x x position of the ball
+            @param y y position of the ball
+            @return returns the filtered positions and the velocities
+        """
+        
+        #calculate x-filter
+        self.x_fil = self.x_fil+self.alpha*(x-self.x_fil)+self.period*self.x_vel
+        #calculate x-velocity
+        self.x_vel = self.x_vel +self.beta/self.period*(x-self.x_fil)
+        #calulate y-filter
+        self.y_fil = self.y_fil+self.alpha*(y-self.y_fil)+self.period*self.y_vel
+        #calculate y-vel
+        self.y_vel = self.y_vel +self.beta/self.period*(y-self.y_fil)
+        
+        #returns all calculated values
+        return(self.x_fil,self.y_fil,self.x_vel,self.y_vel)
+    
+    def calibration(self, reading_data_x, reading_data_y):
+        """ @brief calculates the paramters which can be used to calibrates the touchpanel
+            @param reading_data_x contains all the x-values of the touchpanel which were read to calibrate the touchpanel
+            @param reading_data_y contains all the y-values of the touchpanel which were read to calibrate the touchpanel
+            @return returns all the values which are used to calibrate the positions of the touchpanel
+        """
+        #create variables
+        Kxx, Kyx, Kxy, Kyy, Xc, Yc = 0,0,0,0,0,0
+        #create marix for the supposed position values
+        supposed_positions = np.array([(self.pos1[0], self.pos1[1]),(self.pos2[0],self.pos2[1]),(self.pos3[0],self.pos3[1]),(self.pos4[0],self.pos4[1]),(self.pos5[0],self.pos5[1]),(self.pos6[0],self.pos6[1]),(self.pos7[0],self.pos7[1]),(self.pos8[0],self.pos8[1]),(self.pos9[0],self.pos9[1])])
+        
+        #create matrix for the read position values
+        real_positions = np.array([[reading_data_x[0], reading_data_y[0], 1],
+                                   [reading_data_x[1], reading_data_y[1], 1],
+                                   [reading_data_x[2], reading_data_y[2], 1],
+                                   [reading_data_x[3], reading_data_y[3], 1 ],
+                                   [reading_data_x[4], reading_data_y[4], 1],
+                                   [reading_data_x[5], reading_data_y[5], 1],
+                                   [reading_data_x[6], reading_data_y[6], 1],
+                                   [reading_data_x[7], reading_data_y[7], 1],
+                                   [reading_data_x[8], reading_data_y[8], 1]])
+        
+        #calcualtes the calibration parameters which can be used to calibrate the positions of the ball on the touchpanel
+        beta = np.dot(np.dot(np.linalg.inv(np.dot(real_positions.transpose(),real_positions)), real_positions.transpose()), supposed_positions)
+            
+        #get values from matrix
+        Kxx = beta[0][0]
+        Kxy = beta[0][1]
+        Kyx = beta[1][0]
+        Kyy = beta[1][1]
+        Xc = beta[2][0]
+        Yc = beta[2][1]
+        
+        #return values
+        return(Kxx,Kxy,Kyx,Kyy, Xc, Yc)
+
+
+
+
+
+    
+
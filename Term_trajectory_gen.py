@@ -0,0 +1,185 @@
+''' @file                   Term_trajectory_gen.py
+    @brief                  Host tool which generates the reference trajectories of the ball
+    @details                Runs on the PC with NumPy, not on the board. A circle, a figure eight and a sequence of steps are
+                            sampled with the controller period and written as table files with one row x, y, vx, vy (mm, mm/s)
+                            per period. Task_Controller reads one row every run, so no trigonometric function is evaluated on
+                            the board. The tool also simulates the linear model of one axis with the controller of the board,
+                            including torque saturation and the anti-windup of the integral, and prints the tracking error of
+                            every trajectory with and without the integral gain. If the gain file has no integral gain, the
+                            case with the integral gain uses the gains designed with the integral instead. The integral
+                            removes the offset of a constant disturbance, but it collects the large errors after every jump
+                            of the steps, so it can track the steps worse than the plain state feedback; the tool prints a
+                            note in that case.
+
+                            Example: python Term_trajectory_gen.py --circle 30,4 --eight 40,6 --steps 30,2 --gains K_gains.bin
+    @author                 Sebastian Bößl, Johannes Frisch
+    @date                   December 14, 2021
+'''
+
+import argparse
+import numpy as np
+try:
+    import tablefile
+except ImportError:
+    import Term_tablefile as tablefile
+try:
+    import lqr_design
+except ImportError:
+    import Term_lqr_design as lqr_design
+
+
+## @brief largest torque of the motors in mNm, the same limit as in Task_Controller
+#
+TORQUE_LIMIT = 300.0
+
+## @brief half the size of the touchpanel in mm, the trajectories have to stay inside
+#
+PLATE_EDGE = (88.0, 50.0)
+
+
+def circle(radius, revolution, period):
+    ''' @brief Samples a circle around the plate center
+        @param radius radius in mm
+        @param revolution time of one revolution in s
+        @param period controller period in s
+        @return array with one row x, y, vx, vy per period
+    '''
+    t = np.arange(int(round(revolution/period))) * period
+    w = 2*np.pi/revolution
+    return np.column_stack((radius*np.cos(w*t), radius*np.sin(w*t),
+                            -radius*w*np.sin(w*t), radius*w*np.cos(w*t)))
+
+
+def figure_eight(size, revolution, period):
+    ''' @brief Samples a figure eight (Lissajous curve 1:2) around the plate center
+        @param size half the width of the figure eight in mm, the height is half the width
+        @param revolution time of one figure eight in s
+        @param period controller period in s
+        @return array with one row x, y, vx, vy per period
+    '''
+    t = np.arange(int(round(revolution/period))) * period
+    w = 2*np.pi/revolution
+    return np.column_stack((size*np.sin(w*t), size/2*np.sin(2*w*t),
+                            size*w*np.cos(w*t), size*w*np.cos(2*w*t)))
+
+
+def steps(size, hold, period):
+    ''' @brief Samples a sequence of steps to the four points of a square around the plate center
+        @param size distance of the points from the center in mm
+        @param hold time every point is held in s
+        @param period controller period in s
+        @return array with one row x, y, vx, vy per period
+    '''
+    n = int(round(hold/period))
+    points = [(size, size), (-size, size), (-size, -size), (size, -size)]
+    return np.array([[x, y, 0.0, 0.0] for (x, y) in points for i in range(n)])
+
+
+def simulate(A, B, reference, K, Ki, period, disturbance=0.0, integral_limit=200.0, laps=2):
+    ''' @brief Simulates one axis which follows the x column of a trajectory
+        @details The controller is the one of Task_Controller: state feedback on the errors to the reference, conditional
+                 integration of the position error and a clamped integral. The motor torque saturates at TORQUE_LIMIT.
+        @param A discrete system matrix in board units
+        @param B discrete input matrix in board units
+        @param reference array with one row x, y, vx, vy per period
+        @param K 4 gains of the board
+        @param Ki integral gain of the board, 0 disables the integral
+        @param period controller period in s
+        @param disturbance constant torque in mNm added to the motor, e.g. an unbalanced platform
+        @param integral_limit largest magnitude of the integral in mm*s
+        @param laps number of times the trajectory is run
+        @return array with the position error in mm of every period
+    '''
+    x = np.array([reference[0, 0], 0.0, reference[0, 2], 0.0])
+    integral = 0.0
+    errors = []
+    for k in range(laps * len(reference)):
+        ref = reference[k % len(reference)]
+        error = x - np.array([ref[0], 0.0, ref[2], 0.0])
+        torque = -np.dot(K, error)
+        if Ki:
+            new_integral = integral + error[0]*period
+            if abs(torque - Ki*new_integral) < TORQUE_LIMIT:
+                integral = min(max(new_integral, -integral_limit), integral_limit)
+            torque -= Ki*integral
+        torque = min(max(torque, -TORQUE_LIMIT), TORQUE_LIMIT)
+        x = A @ x + B[:, 0]*(torque + disturbance)
+        errors.append(error[0])
+    return np.array(errors)
+
+
+def design_gains(period):
+    ''' @brief Designs the gains of the x-axis with the integral of the ball position
+        @param period controller period in s
+        @return tuple (K, Ki) with the 4 gains and the integral gain of the board
+    '''
+    (A, B) = lqr_design.discretize(*lqr_design.linearize(lqr_design.PARAMETERS), period)
+    (A, B) = lqr_design.augment_integral(A, B, period)
+    (K, P) = lqr_design.dlqr(A, B, np.diag([400, 100, 25, 1, 2000]), [[30]])
+    K = lqr_design.board_gains(K, state_scale=lqr_design.STATE_SCALE + (lqr_design.INTEGRAL_SCALE,))
+    return (K[0:4], K[4])
+
+
+def load_gains(filename, period):
+    ''' @brief Reads the gains of the x-axis from a gain file or designs them if the file does not exist
+        @param filename name of the gain file written by Term_lqr_design.py
+        @param period controller period in s
+        @return tuple (K, Ki) with the 4 gains and the integral gain of the board, Ki is 0 if the file has none
+    '''
+    try:
+        (rows, cols, values) = tablefile.load(filename)
+        K = np.array(values[0:4])
+        Ki = values[4] if cols == 5 else 0.0
+        return (K, Ki)
+    except OSError:
+        return design_gains(period)
+
+
+def main():
+    ''' @brief Command line interface of the trajectory generator
+    '''
+    parser = argparse.ArgumentParser(description='Generate the reference trajectories of the ball balancing platform')
+    parser.add_argument('--period', type=float, default=0.01, help='controller period in s')
+    parser.add_argument('--circle', default='30,4', help='radius_mm,revolution_s of the circle')
+    parser.add_argument('--eight', default='40,6', help='size_mm,revolution_s of the figure eight')
+    parser.add_argument('--steps', default='30,2', help='size_mm,hold_s of the steps')
+    parser.add_argument('--gains', default='K_gains.bin', help='gain file for the simulation, designed if it does not exist')
+    parser.add_argument('--disturbance', type=float, default=20.0, help='constant disturbance torque of the simulation in mNm')
+    args = parser.parse_args()
+
+    (radius, revolution) = [float(v) for v in args.circle.split(',')]
+    (size, eight_revolution) = [float(v) for v in args.eight.split(',')]
+    (step_size, hold) = [float(v) for v in args.steps.split(',')]
+    trajectories = [('traj_circle.bin', circle(radius, revolution, args.period)),
+                    ('traj_eight.bin', figure_eight(size, eight_revolution, args.period)),
+                    ('traj_steps.bin', steps(step_size, hold, args.period))]
+
+    (A, B) = lqr_design.board_model(lqr_design.PARAMETERS, args.period)
+    (K, Ki) = load_gains(args.gains, args.period)
+    print('K = ' + ' '.join('{:.4g}'.format(v) for v in K) + ', Ki = {:.4g}'.format(Ki))
+    #without an integral gain both columns would be the same, so the integral case uses the designed gains
+    K_integral = K
+    if not Ki:
+        (K_integral, Ki) = design_gains(args.period)
+        print('{} has no integral gain, the Ki column uses the designed gains K = '.format(args.gains) +
+              ' '.join('{:.4g}'.format(v) for v in K_integral) + ', Ki = {:.4g}'.format(Ki))
+    print('{:<18}{:>6}{:>8}  {:>22}  {:>22}'.format('file', 'rows', 'bytes', 'rms/max error, no Ki', 'rms/max error, Ki'))
+    for (filename, table) in trajectories:
+        if np.any(np.abs(table[:, 0]) > PLATE_EDGE[0]) or np.any(np.abs(table[:, 1]) > PLATE_EDGE[1]):
+            print('warning: {} leaves the touchpanel'.format(filename))
+        tablefile.save(filename, len(table), 4, table.ravel())
+        text = []
+        rms = []
+        for (gains, gain) in ((K, 0.0), (K_integral, Ki)):
+            errors = simulate(A, B, table, gains, gain, args.period, args.disturbance)
+            #the error of the second lap, after the start transient
+            errors = errors[len(table):]
+            rms.append(np.sqrt(np.mean(errors**2)))
+            text.append('{:9.2f} /{:7.2f} mm'.format(rms[-1], np.max(np.abs(errors))))
+        print('{:<18}{:>6}{:>8}  {:>22}  {:>22}'.format(filename, len(table), tablefile.HEADER_SIZE + 16*len(table), *text))
+        if rms[1] > rms[0]:
+            print('note: the integral gain tracks {} worse than the state feedback alone'.format(filename))
+
+
+if __name__ == '__main__':
+    main()